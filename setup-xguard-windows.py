@@ -137,6 +137,33 @@ def compile_extension():
         # 回到原始目录
         os.chdir(original_dir)
 
+def prepare_model(precision):
+    """准备模型产物：转换为目标精度的分片safetensors并写入校验清单，服务启动时走快速加载路径"""
+    print("🧩 准备模型产物...")
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    if not os.path.isdir(os.path.join(project_dir, "local_model")) or \
+            not os.path.isdir(os.path.join(project_dir, "local_tokenizer")):
+        print("⚠️  未找到local_model或local_tokenizer，跳过")
+        print("   放入模型后可手动运行: cd server && python model_artifacts.py prepare --precision auto")
+        return True
+    
+    try:
+        result = subprocess.run([
+            sys.executable, "model_artifacts.py", "prepare", "--precision", precision
+        ], cwd=os.path.join(project_dir, "server"), text=True)
+        
+        if result.returncode != 0:
+            print("⚠️  模型产物准备失败，服务仍可直接加载local_model")
+            return True
+        
+        print("✅ 模型产物已写入prepared_model，未配置model_path时服务优先加载该目录")
+        if precision != "auto":
+            print(f"   请同时将precision配置为 {precision}（或设置XGUARD_PRECISION）")
+        return True
+    except Exception as e:
+        print(f"❌ 准备模型产物时出错: {str(e)}")
+        return False
+
 def install_vsce():
     """安装vsce打包工具"""
     print("📦 安装vsce打包工具...")
@@ -338,6 +365,10 @@ def main():
     parser = argparse.ArgumentParser(description='XGuard Commit Message Security Guard - Windows安装脚本')
     parser.add_argument('--skip-deps', action='store_true', help='跳过依赖安装')
     parser.add_argument('--skip-vscode', action='store_true', help='跳过VSCode插件安装')
+    parser.add_argument('--skip-prepare-model', action='store_true', help='跳过模型产物准备')
+    parser.add_argument('--precision', default='auto',
+                        choices=['auto', 'bf16', 'int8-dynamic', 'int8-weight-only'],
+                        help='服务使用的推理精度，决定模型产物的权重dtype')
     
     args = parser.parse_args()
     
@@ -359,6 +390,11 @@ def main():
         if not install_node_deps():
             return False
     
+    # 准备模型产物
+    if not args.skip_prepare_model:
+        if not prepare_model(args.precision):
+            return False
+    
     # 选择安装方式
     if not args.skip_vscode:
         if not choose_install_method():
@@ -0,0 +1,16 @@
+"""
+XGuard基准测试 - 测量推理管线与HTTP接口的延迟、吞吐、内存及各阶段耗时
+
+    python -m benchmarks run --stub
+    python -m benchmarks compare results/base.json results/new.json
+"""
+
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_DIR = os.path.join(PROJECT_ROOT, 'server')
+
+# 服务模块按脚本目录平铺导入，基准测试与服务使用同一份代码
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
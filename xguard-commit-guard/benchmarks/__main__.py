@@ -0,0 +1,201 @@
+"""
+基准测试命令行
+
+    python -m benchmarks run --stub                      # 随机初始化的桩模型，离线、仅CPU
+    python -m benchmarks run --output results/main.json  # 使用配置中的本地模型
+    python -m benchmarks compare results/main.json results/branch.json
+    python -m benchmarks parity --stub --backends eager,compile,onnx  # 各推理后端的风险分布一致性
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+from . import PROJECT_ROOT
+from .corpus import generate_corpus, load_corpus
+from .report import environment_info, peak_rss_bytes, save_results, load_results, compare_results
+
+
+def _int_list(value):
+    return [int(part) for part in value.split(',') if part.strip()]
+
+
+def _str_list(value):
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+def _resolve_model(args):
+    if args.stub:
+        from .stub_model import build_stub_model
+        print(f"🔧 生成桩模型: {args.stub_dir}")
+        return build_stub_model(args.stub_dir, seed=args.seed)
+    import xguard_service
+    config = xguard_service.get_service_config()
+    return args.model_path or config['model_path'], args.tokenizer_path or config['tokenizer_path']
+
+
+def run(args):
+    model_path, tokenizer_path = _resolve_model(args)
+    items = load_corpus(args.corpus) if args.corpus else generate_corpus(size=args.corpus_size, seed=args.seed)
+    results = {
+        "environment": environment_info(),
+        "model": {"stub": args.stub, "model_path": model_path, "precision": args.precision, "backend": args.backend},
+        "corpus": {"source": args.corpus or f"generated(seed={args.seed})", "items": len(items)},
+    }
+
+    if not args.skip_infer:
+        from .bench_infer import load_pipeline, run_infer_benchmark
+        print(f"🔍 推理管线基准 ({len(items)} 条语料)...")
+        started = time.perf_counter()
+        backend = load_pipeline(model_path, tokenizer_path, args.precision, args.backend, args.onnx_cache_dir)
+        load_seconds = time.perf_counter() - started
+        results["infer"] = run_infer_benchmark(
+            backend, items,
+            batch_sizes=args.batch_sizes,
+            max_new_tokens=args.max_new_tokens,
+            use_prefix_cache=not args.no_prefix_cache
+        )
+        results["infer"]["load_seconds"] = round(load_seconds, 3)
+        results["infer"]["peak_rss_bytes"] = peak_rss_bytes()
+        del backend
+
+    if not args.skip_http:
+        from .bench_http import run_http_benchmark
+        print(f"🌐 HTTP接口基准 (并发 {args.concurrency})...")
+        extra_env = {'XGUARD_PRECISION': args.precision, 'XGUARD_INFERENCE_BACKEND': args.backend}
+        if args.onnx_cache_dir:
+            extra_env['XGUARD_ONNX_CACHE_DIR'] = args.onnx_cache_dir
+        if not args.with_cache:
+            # 语料会循环使用，关闭结果缓存避免测到的只是缓存命中
+            extra_env['XGUARD_CACHE_ENABLED'] = 'false'
+        results["http"] = run_http_benchmark(
+            model_path, tokenizer_path, items,
+            concurrency_levels=args.concurrency,
+            requests_per_level=args.requests,
+            score_only=args.score_only,
+            extra_env=extra_env
+        )
+
+    output = args.output or os.path.join(
+        PROJECT_ROOT, 'benchmarks', 'results', time.strftime('%Y%m%d-%H%M%S') + '.json'
+    )
+    save_results(results, output)
+    _print_summary(results)
+    print(f"\n📄 结果已写入 {output}")
+    return True
+
+
+def _print_summary(results):
+    infer = results.get("infer")
+    if infer:
+        latency = infer["single"]["latency"]
+        print(f"\ninfer() 延迟: p50={latency['p50_ms']}ms p95={latency['p95_ms']}ms p99={latency['p99_ms']}ms")
+        print("各阶段耗时:")
+        for stage, stats in infer["single"]["stages"].items():
+            print(f"  {stage:<10} mean={stats['mean_ms']:>10}ms  p95={stats['p95_ms']:>10}ms  {stats['share']:.1%}")
+        for batch_size, stats in infer["batches"].items():
+            print(f"  batch_size={batch_size:<4} 吞吐={stats['items_per_second']} 条/秒")
+        print(f"峰值内存: {infer['peak_rss_bytes']} bytes")
+    http = results.get("http")
+    if http:
+        print("\nHTTP /check-commit:")
+        for concurrency, stats in http["concurrency"].items():
+            latency = stats["latency"]
+            print(f"  并发={concurrency:<4} 吞吐={stats['requests_per_second']} 请求/秒  "
+                  f"p50={latency.get('p50_ms')}ms p95={latency.get('p95_ms')}ms p99={latency.get('p99_ms')}ms  "
+                  f"状态={stats['statuses']}")
+        print(f"服务端峰值内存: {http['server_peak_rss_bytes']} bytes")
+
+
+def parity(args):
+    from .parity import run_parity
+    model_path, tokenizer_path = _resolve_model(args)
+    items = load_corpus(args.corpus) if args.corpus else generate_corpus(size=args.corpus_size, seed=args.seed)
+    print(f"🔍 推理后端一致性检查: {', '.join(args.backends)} ({len(items)} 条语料)...")
+    report = run_parity(model_path, tokenizer_path, items, args.backends,
+                        batch_size=args.batch_size, max_new_tokens=args.max_new_tokens, precision=args.precision,
+                        onnx_cache_dir=args.onnx_cache_dir, tolerance=args.tolerance)
+    for name, timing in report["timings"].items():
+        print(f"  {name:<10} 加载 {timing['load_seconds']}s  推理 {timing['infer_seconds']}s")
+    for name, modes in report["comparisons"].items():
+        for mode, stats in modes.items():
+            marker = '  ' if stats["passed"] else '❌'
+            print(f"{marker} {report['reference']} vs {name:<10} {mode:<14} "
+                  f"token_score最大差 {stats['max_token_score_diff']:<10} risk_score最大差 {stats['max_risk_score_diff']:<10} "
+                  f"解释一致率 {stats['response_agreement']:.1%}")
+    if args.output:
+        save_results(report, args.output)
+        print(f"\n📄 结果已写入 {args.output}")
+    print(f"\n{'✅ 各后端风险分布一致' if report['passed'] else '❌ 风险分布差异超过容差'} (容差 {args.tolerance})")
+    return report["passed"]
+
+
+def compare(args):
+    rows = compare_results(load_results(args.baseline), load_results(args.current), args.tolerance)
+    regressions = [row for row in rows if row[4]]
+    for path, old, new, change, regressed in rows:
+        marker = '❌' if regressed else '  '
+        print(f"{marker} {path:<60} {old:>14} → {new:<14} {change:+.1%}")
+    print(f"\n{len(regressions)} 项指标回归超过 {args.tolerance:.0%}")
+    return not regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='XGuard基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='运行基准测试并保存JSON结果')
+    run_parser.add_argument('--stub', action='store_true', help='使用随机初始化的桩模型（离线、仅CPU）')
+    run_parser.add_argument('--stub-dir', default=os.path.join(tempfile.gettempdir(), 'xguard-bench-stub'),
+                            help='桩模型生成目录')
+    run_parser.add_argument('--model-path', help='模型路径，默认取服务配置')
+    run_parser.add_argument('--tokenizer-path', help='tokenizer路径，默认取服务配置')
+    run_parser.add_argument('--precision', default='auto', help='推理精度模式')
+    run_parser.add_argument('--backend', default='eager', help='推理后端: eager/compile/onnx')
+    run_parser.add_argument('--onnx-cache-dir', help='onnx后端的导出目录，默认取服务配置的默认值')
+    run_parser.add_argument('--corpus', help='JSONL语料（每行含message），默认自动生成')
+    run_parser.add_argument('--corpus-size', type=int, default=200, help='自动生成的语料条数')
+    run_parser.add_argument('--seed', type=int, default=0, help='语料与桩模型的随机种子')
+    run_parser.add_argument('--batch-sizes', type=_int_list, default=[1, 4, 8], help='推理吞吐测试的批大小')
+    run_parser.add_argument('--max-new-tokens', type=int, default=32, help='推理管线基准的生成token数')
+    run_parser.add_argument('--no-prefix-cache', action='store_true', help='推理管线基准不使用前缀KV缓存')
+    run_parser.add_argument('--concurrency', type=_int_list, default=[1, 4, 16], help='HTTP基准的并发度')
+    run_parser.add_argument('--requests', type=int, default=64, help='HTTP基准每个并发度的请求数')
+    run_parser.add_argument('--score-only', action='store_true', help='HTTP请求只输出风险判定')
+    run_parser.add_argument('--with-cache', action='store_true', help='HTTP基准保留检测结果缓存')
+    run_parser.add_argument('--skip-infer', action='store_true', help='跳过推理管线基准')
+    run_parser.add_argument('--skip-http', action='store_true', help='跳过HTTP接口基准')
+    run_parser.add_argument('--output', help='结果JSON路径，默认benchmarks/results/<时间>.json')
+
+    compare_parser = subparsers.add_parser('compare', help='比较两次结果，回归时退出码为1')
+    compare_parser.add_argument('baseline', help='基准结果JSON')
+    compare_parser.add_argument('current', help='当前结果JSON')
+    compare_parser.add_argument('--tolerance', type=float, default=0.1, help='允许的相对变化，默认10%%')
+
+    parity_parser = subparsers.add_parser('parity', help='比较各推理后端的风险分布，不一致时退出码为1')
+    parity_parser.add_argument('--backends', type=_str_list, default=['eager', 'onnx'],
+                               help='逗号分隔的推理后端，第一个为基准')
+    parity_parser.add_argument('--stub', action='store_true', help='使用随机初始化的桩模型（离线、仅CPU）')
+    parity_parser.add_argument('--stub-dir', default=os.path.join(tempfile.gettempdir(), 'xguard-bench-stub'),
+                               help='桩模型生成目录')
+    parity_parser.add_argument('--model-path', help='模型路径，默认取服务配置')
+    parity_parser.add_argument('--tokenizer-path', help='tokenizer路径，默认取服务配置')
+    parity_parser.add_argument('--precision', default='auto', help='推理精度模式')
+    parity_parser.add_argument('--onnx-cache-dir', help='onnx后端的导出目录，默认取服务配置的默认值')
+    parity_parser.add_argument('--corpus', help='JSONL语料（每行含message），默认自动生成')
+    parity_parser.add_argument('--corpus-size', type=int, default=32, help='自动生成的语料条数')
+    parity_parser.add_argument('--seed', type=int, default=0, help='语料与桩模型的随机种子')
+    parity_parser.add_argument('--batch-size', type=int, default=4, help='每批推理条数')
+    parity_parser.add_argument('--max-new-tokens', type=int, default=32, help='解释模式的生成token数')
+    parity_parser.add_argument('--tolerance', type=float, default=1e-3, help='分数允许的最大绝对差')
+    parity_parser.add_argument('--output', help='将报告写入JSON文件')
+
+    args = parser.parse_args()
+    commands = {'run': run, 'compare': compare, 'parity': parity}
+    return commands[args.command](args)
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,137 @@
+"""
+HTTP接口基准 - 在子进程中启动XGuard服务，按不同并发度请求/check-commit，统计延迟、吞吐与服务端峰值内存
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import threading
+import subprocess
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+from . import SERVER_DIR
+from .report import summarize_latencies, peak_rss_bytes
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_service(model_path, tokenizer_path, extra_env=None, ready_timeout=600):
+    """启动服务子进程并等待/ready，返回(进程, 端口)"""
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(port),
+        'HOST': '127.0.0.1',
+        'XGUARD_MODEL_PATH': model_path,
+        'XGUARD_TOKENIZER_PATH': tokenizer_path,
+        'XGUARD_PRELOAD_MODEL': 'true',
+    })
+    env.update(extra_env or {})
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(SERVER_DIR, 'xguard_service.py')],
+        cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    deadline = time.monotonic() + ready_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"XGuard服务启动失败，退出码 {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/ready')
+            response = connection.getresponse()
+            status = json.loads(response.read() or b'{}')
+            connection.close()
+            if response.status == 200:
+                return process, port
+            if status.get('state') == 'failed':
+                stop_service(process)
+                raise RuntimeError(f"XGuard模型加载失败: {status.get('error')}")
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(0.2)
+    stop_service(process)
+    raise RuntimeError("等待XGuard服务就绪超时")
+
+
+def stop_service(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def _run_level(port, items, concurrency, total_requests, score_only):
+    """以concurrency个客户端线程（各自保持长连接）共发送total_requests个请求"""
+    lock = threading.Lock()
+    cursor = [0]
+    latencies = []
+    statuses = {}
+
+    def client():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=300)
+        try:
+            while True:
+                with lock:
+                    index = cursor[0]
+                    if index >= total_requests:
+                        return
+                    cursor[0] += 1
+                body = json.dumps({'message': items[index % len(items)]['message'], 'score_only': score_only})
+                started = time.perf_counter()
+                try:
+                    connection.request('POST', '/check-commit', body, {'Content-Type': 'application/json'})
+                    response = connection.getresponse()
+                    response.read()
+                    status = response.status
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=300)
+                    status = 'connection_error'
+                elapsed = time.perf_counter() - started
+                with lock:
+                    statuses[str(status)] = statuses.get(str(status), 0) + 1
+                    if status == 200:
+                        latencies.append(elapsed)
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(client)
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": total_requests,
+        "statuses": statuses,
+        "requests_per_second": round(len(latencies) / elapsed, 3) if elapsed > 0 else None,
+        "latency": summarize_latencies(latencies),
+    }
+
+
+def run_http_benchmark(model_path, tokenizer_path, items, concurrency_levels=(1, 4, 16), requests_per_level=64,
+                       score_only=False, extra_env=None):
+    process, port = start_service(model_path, tokenizer_path, extra_env)
+    try:
+        # 预热请求不计入结果
+        _run_level(port, items, 1, 1, score_only)
+        levels = {
+            str(concurrency): _run_level(port, items, concurrency, requests_per_level, score_only)
+            for concurrency in concurrency_levels
+        }
+        return {
+            "score_only": score_only,
+            "requests_per_level": requests_per_level,
+            "concurrency": levels,
+            "server_peak_rss_bytes": peak_rss_bytes(process.pid),
+        }
+    finally:
+        stop_service(process)
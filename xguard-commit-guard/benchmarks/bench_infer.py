@@ -0,0 +1,83 @@
+"""
+推理管线基准 - 直接调用推理后端的infer_batch()，测量单条延迟、各阶段耗时与不同批大小下的吞吐
+"""
+
+import time
+
+from .report import summarize_latencies, percentile
+
+STAGES = ('render', 'tokenize', 'prefill', 'decode', 'parse')
+
+
+def load_pipeline(model_path, tokenizer_path, precision='auto', backend='eager', onnx_cache_dir=None):
+    """与服务相同的方式加载tokenizer与推理后端"""
+    from modelscope import AutoTokenizer
+    from backends import load_backend
+
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+    return load_backend(backend, model_path, tokenizer, precision, onnx_cache_dir)
+
+
+def _stage_summary(samples):
+    """各阶段耗时的均值/p95（毫秒）及占总耗时的比例"""
+    totals = {stage: sum(sample[stage] for sample in samples) for stage in STAGES}
+    overall = sum(totals.values()) or 1.0
+    return {
+        stage: {
+            "mean_ms": round(totals[stage] / len(samples) * 1000, 3),
+            "p95_ms": round(percentile([sample[stage] for sample in samples], 95) * 1000, 3),
+            "share": round(totals[stage] / overall, 4),
+        }
+        for stage in STAGES
+    }
+
+
+def run_infer_benchmark(backend, items, batch_sizes=(1, 4, 8), max_new_tokens=32, use_prefix_cache=True):
+    """
+    single: 逐条推理，统计延迟分位数与各阶段耗时
+    batches: 按各批大小批量推理，统计吞吐与批延迟
+    """
+    def messages_of(item):
+        return [{"role": "user", "content": item['message']}]
+
+    # 预热：首次调用的算子初始化（compile后端的编译）、评分token表与前缀KV构建不计入结果
+    backend.infer_batch([messages_of(items[0])], max_new_tokens=2, use_prefix_cache=use_prefix_cache)
+
+    latencies = []
+    samples = []
+    for item in items:
+        stats = {}
+        started = time.perf_counter()
+        backend.infer_batch([messages_of(item)], max_new_tokens=max_new_tokens,
+                            use_prefix_cache=use_prefix_cache, stats=stats)
+        latencies.append(time.perf_counter() - started)
+        samples.append(stats)
+
+    batches = {}
+    for batch_size in batch_sizes:
+        batch_latencies = []
+        started = time.perf_counter()
+        for offset in range(0, len(items), batch_size):
+            batch = items[offset:offset + batch_size]
+            batch_started = time.perf_counter()
+            backend.infer_batch([messages_of(item) for item in batch],
+                                max_new_tokens=max_new_tokens, use_prefix_cache=use_prefix_cache)
+            batch_latencies.append(time.perf_counter() - batch_started)
+        elapsed = time.perf_counter() - started
+        batches[str(batch_size)] = {
+            "items_per_second": round(len(items) / elapsed, 3) if elapsed > 0 else None,
+            "batch_latency": summarize_latencies(batch_latencies),
+        }
+
+    return {
+        "items": len(items),
+        "max_new_tokens": max_new_tokens,
+        "backend": backend.name,
+        "prefix_cache": use_prefix_cache,
+        "single": {
+            "latency": summarize_latencies(latencies),
+            "items_per_second": round(len(items) / sum(latencies), 3) if latencies else None,
+            "stages": _stage_summary(samples),
+        },
+        "batches": batches,
+    }
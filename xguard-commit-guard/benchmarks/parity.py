@@ -0,0 +1,82 @@
+"""
+推理后端一致性检查 - 同一批语料分别在各后端上推理，以第一个后端为基准比较风险分布与解释文本
+
+风险分布（token_score/risk_score）的差异超过容差即判定不一致；
+解释文本按贪心解码应逐字相同，随机初始化的桩模型分布接近均匀，个别近似并列的token可能分叉，只做统计。
+"""
+
+import time
+
+# (模式名, reason_first, 是否只解码评分位置)
+MODES = (
+    ('score_only', False, True),
+    ('explain', False, False),
+    ('reason_first', True, False),
+)
+
+
+def _max_diff(reference, current):
+    """两个分数字典的最大绝对差，某一侧缺失的键按0计"""
+    keys = set(reference) | set(current)
+    return max((abs(reference.get(key, 0.0) - current.get(key, 0.0)) for key in keys), default=0.0)
+
+
+def _infer_all(backend, items, batch_size, max_new_tokens, reason_first):
+    results = []
+    for offset in range(0, len(items), batch_size):
+        batch = items[offset:offset + batch_size]
+        results.extend(backend.infer_batch(
+            [[{"role": "user", "content": item['message']}] for item in batch],
+            max_new_tokens=max_new_tokens, reason_first=reason_first
+        ))
+    return results
+
+
+def run_parity(model_path, tokenizer_path, items, backends, batch_size=4, max_new_tokens=32, precision='auto',
+               onnx_cache_dir=None, tolerance=1e-3):
+    """依次加载各后端推理全部语料，返回一致性报告；report['passed']为所有后端都在容差内"""
+    from .bench_infer import load_pipeline
+
+    outputs = {}
+    timings = {}
+    for name in backends:
+        started = time.perf_counter()
+        backend = load_pipeline(model_path, tokenizer_path, precision, name, onnx_cache_dir)
+        loaded = time.perf_counter()
+        outputs[name] = {
+            mode: _infer_all(backend, items, batch_size, 1 if score_only else max_new_tokens, reason_first)
+            for mode, reason_first, score_only in MODES
+        }
+        timings[name] = {
+            "load_seconds": round(loaded - started, 3),
+            "infer_seconds": round(time.perf_counter() - loaded, 3),
+        }
+        del backend
+
+    reference = backends[0]
+    comparisons = {}
+    passed = True
+    for name in backends[1:]:
+        comparisons[name] = {}
+        for mode, _, _ in MODES:
+            pairs = list(zip(outputs[reference][mode], outputs[name][mode]))
+            token_diff = max((_max_diff(a['token_score'], b['token_score']) for a, b in pairs), default=0.0)
+            risk_diff = max((_max_diff(a['risk_score'], b['risk_score']) for a, b in pairs), default=0.0)
+            same_response = sum(1 for a, b in pairs if a['response'] == b['response'])
+            ok = token_diff <= tolerance and risk_diff <= tolerance
+            passed = passed and ok
+            comparisons[name][mode] = {
+                "max_token_score_diff": round(token_diff, 6),
+                "max_risk_score_diff": round(risk_diff, 6),
+                "response_agreement": round(same_response / max(1, len(pairs)), 4),
+                "passed": ok,
+            }
+
+    return {
+        "reference": reference,
+        "items": len(items),
+        "tolerance": tolerance,
+        "timings": timings,
+        "comparisons": comparisons,
+        "passed": passed,
+    }
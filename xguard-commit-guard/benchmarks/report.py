@@ -0,0 +1,131 @@
+"""
+基准结果 - 延迟统计、环境信息、JSON存储以及两次结果之间的回归比较
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import platform
+import subprocess
+
+from . import PROJECT_ROOT
+
+
+def percentile(values, q):
+    """最近秩百分位数，q取0~100"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(q / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize_latencies(seconds):
+    """延迟列表（秒）→ 毫秒统计"""
+    if not seconds:
+        return {"count": 0}
+    return {
+        "count": len(seconds),
+        "mean_ms": round(sum(seconds) / len(seconds) * 1000, 3),
+        "p50_ms": round(percentile(seconds, 50) * 1000, 3),
+        "p95_ms": round(percentile(seconds, 95) * 1000, 3),
+        "p99_ms": round(percentile(seconds, 99) * 1000, 3),
+        "max_ms": round(max(seconds) * 1000, 3),
+    }
+
+
+def peak_rss_bytes(pid=None):
+    """进程峰值常驻内存（字节）；pid为空时为当前进程"""
+    if pid is None:
+        try:
+            import resource
+        except ImportError:
+            # Windows没有resource模块
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux单位为KB，macOS为字节
+        return peak if sys.platform == 'darwin' else peak * 1024
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _git_revision():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=PROJECT_ROOT, capture_output=True,
+                                  text=True, timeout=5)
+        dirty = subprocess.run(['git', 'status', '--porcelain'], cwd=PROJECT_ROOT, capture_output=True,
+                               text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if revision.returncode != 0:
+        return None
+    return revision.stdout.strip() + ('-dirty' if dirty.stdout.strip() else '')
+
+
+def environment_info():
+    info = {
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+    try:
+        import torch
+        info["torch"] = torch.__version__
+        info["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        pass
+    return info
+
+
+def save_results(results, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _flatten(results, prefix=''):
+    """展开为{路径: 数值}，只保留可比较的延迟/吞吐/内存指标"""
+    metrics = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            if key != 'environment':
+                metrics.update(_flatten(value, path + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            if key.endswith(('_ms', '_seconds', '_bytes', 'per_second')):
+                metrics[path] = value
+    return metrics
+
+
+def compare_results(baseline, current, tolerance=0.1):
+    """
+    比较两次结果：延迟/耗时/内存增长或吞吐下降超过tolerance视为回归
+    返回[(指标, 基准值, 当前值, 相对变化, 是否回归)]
+    """
+    before = _flatten(baseline)
+    after = _flatten(current)
+    rows = []
+    for path in sorted(before.keys() & after.keys()):
+        old, new = before[path], after[path]
+        if not old:
+            continue
+        change = (new - old) / old
+        higher_is_better = path.endswith('per_second')
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        rows.append((path, old, new, change, regressed))
+    return rows
@@ -0,0 +1,102 @@
+"""
+桩模型 - 随机初始化的小型因果语言模型与兼容的tokenizer，离线、仅CPU即可跑通完整推理管线
+
+tokenizer在基准语料上训练字节级BPE，chat template接受policy与reason_first参数，
+init_kwargs中带有id2risk映射，与XGuard模型的评分解析方式一致。
+"""
+
+import os
+import json
+
+from .corpus import generate_corpus
+
+# 风险token文本 → 类别，与XGuard模型tokenizer的id2risk格式一致
+STUB_ID2RISK = {
+    "sec": "Safe-Safe",
+    "pp": "Data Privacy-Personal Privacy",
+    "ac": "Cybersecurity-Access Control",
+    "ha": "Cybersecurity-Hacker Attack",
+    "dw": "Crimes and Illegal Activities-Dangerous Weapons",
+    "vt": "Extremism-Violent Terrorist Activities",
+}
+
+_CHAT_TEMPLATE = (
+    "<|im_start|>system\nYou are a content safety reviewer. Classify the user content into one of the "
+    "risk categories and explain the decision.{% if policy %}\nPolicy: {{ policy }}{% endif %}"
+    "{% if reason_first %}\nExplain first, then give the category.{% endif %}<|im_end|>\n"
+    "{% for message in messages %}<|im_start|>{{ message['role'] }}\n{{ message['content'] }}<|im_end|>\n{% endfor %}"
+    "<|im_start|>assistant\n"
+)
+
+_SPEC_VERSION = 1
+
+
+def _spec(vocab_size, hidden_size, num_layers, seed):
+    return {
+        "version": _SPEC_VERSION,
+        "vocab_size": vocab_size,
+        "hidden_size": hidden_size,
+        "num_layers": num_layers,
+        "seed": seed,
+    }
+
+
+def build_stub_model(output_dir, vocab_size=2048, hidden_size=64, num_layers=2, seed=0):
+    """
+    在output_dir下生成model/与tokenizer/，返回(model_path, tokenizer_path)；
+    已存在相同参数的桩模型时直接复用
+    """
+    import torch
+    from tokenizers import Tokenizer, models, trainers, pre_tokenizers, decoders
+    from transformers import PreTrainedTokenizerFast, Qwen2Config, Qwen2ForCausalLM
+
+    model_path = os.path.join(output_dir, 'model')
+    tokenizer_path = os.path.join(output_dir, 'tokenizer')
+    spec = _spec(vocab_size, hidden_size, num_layers, seed)
+    spec_path = os.path.join(output_dir, 'stub.json')
+    if os.path.exists(spec_path):
+        with open(spec_path, 'r', encoding='utf-8') as f:
+            if json.load(f) == spec:
+                return model_path, tokenizer_path
+
+    special_tokens = ["<|endoftext|>", "<|im_start|>", "<|im_end|>"]
+    backend = Tokenizer(models.BPE())
+    backend.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    backend.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=vocab_size,
+        special_tokens=special_tokens,
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet()
+    )
+    texts = [item['message'] for item in generate_corpus(size=2000, seed=seed)]
+    backend.train_from_iterator(texts + [_CHAT_TEMPLATE], trainer=trainer)
+
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=backend,
+        eos_token="<|im_end|>",
+        pad_token="<|endoftext|>",
+        chat_template=_CHAT_TEMPLATE,
+        id2risk=STUB_ID2RISK,
+    )
+    # 风险token作为独立token，解码文本与id2risk的键一致
+    tokenizer.add_tokens(list(STUB_ID2RISK))
+    tokenizer.save_pretrained(tokenizer_path)
+
+    torch.manual_seed(seed)
+    config = Qwen2Config(
+        vocab_size=len(tokenizer),
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 2,
+        num_hidden_layers=num_layers,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=4096,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+        bos_token_id=tokenizer.eos_token_id,
+    )
+    Qwen2ForCausalLM(config).save_pretrained(model_path)
+
+    with open(spec_path, 'w', encoding='utf-8') as f:
+        json.dump(spec, f)
+    return model_path, tokenizer_path
@@ -38,7 +38,12 @@ var __importDefault = (this && this.__importDefault) || function (mod) {
 Object.defineProperty(exports, "__esModule", { value: true });
 exports.CommitMessageProvider = void 0;
 const vscode = __importStar(require("vscode"));
+const http = __importStar(require("http"));
 const axios_1 = __importDefault(require("axios"));
+// 复用到本地服务的连接，每次检测不必重新建立TCP连接
+const httpClient = axios_1.default.create({ httpAgent: new http.Agent({ keepAlive: true }) });
+// 检测前重新校验服务端配置的最小间隔，配置未变化时服务端返回304
+const CONFIG_REFRESH_INTERVAL_MS = 5000;
 class CommitMessageProvider {
     constructor(statusBar) {
         this.statusBar = statusBar;
@@ -53,13 +58,28 @@ class CommitMessageProvider {
             skip_patterns: ["^fix", "^feat", "^docs", "^chore", "^refactor"],
             min_length: 10
         };
+        this.configEtag = undefined;
+        this.configCheckedAt = 0;
         // 加载配置
         this.loadConfig();
     }
     async loadConfig() {
         try {
-            const response = await axios_1.default.get(`${this.serviceUrl}/config`, { timeout: 3000 });
+            const headers = {};
+            if (this.configEtag) {
+                headers['If-None-Match'] = this.configEtag;
+            }
+            const response = await httpClient.get(`${this.serviceUrl}/config`, {
+                timeout: 3000,
+                headers,
+                validateStatus: status => status === 200 || status === 304
+            });
+            this.configCheckedAt = Date.now();
+            if (response.status === 304) {
+                return;
+            }
             this.config = response.data;
+            this.configEtag = response.headers['etag'];
             console.log('Loaded XGuard configuration:', this.config);
         }
         catch (error) {
@@ -82,6 +102,10 @@ class CommitMessageProvider {
         return false;
     }
     async checkCommitMessage(commitMessage) {
+        // 服务端配置文件修改后阈值与跳过规则即时生效
+        if (Date.now() - this.configCheckedAt > CONFIG_REFRESH_INTERVAL_MS) {
+            await this.loadConfig();
+        }
         // 预筛：跳过明显安全的短消息
         if (this.shouldSkipDetection(commitMessage)) {
             this.statusBar.updateStatus({ safeScore: 1.0, isSafe: true });
@@ -97,11 +121,12 @@ class CommitMessageProvider {
                     reject(new Error('Client timeout: XGuard检测超时'));
                 }, 15000);
             });
-            const responsePromise = axios_1.default.post(`${this.serviceUrl}/check-commit`, { message: commitMessage }, { timeout: this.config.timeout_seconds * 1000 });
-            const response = await Promise.race([responsePromise, clientTimeoutPromise]);
-            console.log('XGuard response received:', response);
-            const result = response.data;
-            console.log('XGuard result parsed:', result);
+            const stream = this.requestStream(commitMessage);
+            // 流式接口：done中途失败时verdict已返回，避免未处理的rejection
+            stream.done.catch(() => undefined);
+            // 评分位置解码后即拿到判定，不必等待解释全部生成
+            let result = await Promise.race([stream.verdict, clientTimeoutPromise]);
+            console.log('XGuard verdict received:', result);
             if (result.error) {
                 vscode.window.showErrorMessage(`XGuard检测错误: ${result.error}`);
                 this.statusBar.updateStatus({ safeScore: 0.5, isSafe: false });
@@ -118,8 +143,10 @@ class CommitMessageProvider {
                 risks: highRisks
             });
             console.log('Status bar updated');
-            // 如果有高风险，显示拦截对话框
+            // 如果有高风险，等待解释生成完毕后显示拦截对话框
             if (isBlocked) {
+                this.statusBar.setLoading(false);
+                result = await Promise.race([stream.done, clientTimeoutPromise]);
                 console.log('Showing security alert');
                 await this.showSecurityAlert(commitMessage, result, highRisks);
                 console.log('Security alert closed');
@@ -156,6 +183,68 @@ class CommitMessageProvider {
             this.statusBar.setLoading(false);
         }
     }
+    /**
+     * 调用流式检测接口，解析Server-Sent Events。
+     * verdict在服务端解码出风险分后即兑现（不含解释），done在收到完整结果后兑现；
+     * token事件只用于保持连接：判定为安全时解释继续在后台读取，服务端生成完毕后才会写入缓存
+     */
+    requestStream(commitMessage) {
+        let resolveVerdict;
+        let rejectVerdict;
+        let resolveDone;
+        let rejectDone;
+        const verdict = new Promise((resolve, reject) => {
+            resolveVerdict = resolve;
+            rejectVerdict = reject;
+        });
+        const done = new Promise((resolve, reject) => {
+            resolveDone = resolve;
+            rejectDone = reject;
+        });
+        // 已兑现的Promise不受后续reject影响
+        const fail = (error) => {
+            rejectVerdict(error);
+            rejectDone(error);
+        };
+        httpClient.post(`${this.serviceUrl}/check-commit/stream`, { message: commitMessage, workspace: this.currentWorkspace() }, { timeout: this.config.timeout_seconds * 1000, responseType: 'stream' }).then(response => {
+            const body = response.data;
+            body.setEncoding('utf8');
+            let buffer = '';
+            body.on('data', (chunk) => {
+                buffer += chunk;
+                let end;
+                while ((end = buffer.indexOf('\n\n')) >= 0) {
+                    const block = buffer.slice(0, end);
+                    buffer = buffer.slice(end + 2);
+                    let event = 'message';
+                    let data = '';
+                    for (const line of block.split('\n')) {
+                        if (line.startsWith('event:')) {
+                            event = line.slice(6).trim();
+                        }
+                        else if (line.startsWith('data:')) {
+                            data += line.slice(5).trim();
+                        }
+                    }
+                    const payload = data ? JSON.parse(data) : {};
+                    if (event === 'verdict') {
+                        resolveVerdict({ ...payload, explanation: '' });
+                    }
+                    else if (event === 'done') {
+                        resolveVerdict({ ...payload, explanation: '' });
+                        resolveDone(payload);
+                    }
+                    else if (event === 'error') {
+                        resolveVerdict(payload);
+                        resolveDone(payload);
+                    }
+                }
+            });
+            body.on('end', () => fail(new Error('XGuard流式响应意外结束')));
+            body.on('error', fail);
+        }).catch(fail);
+        return { verdict, done };
+    }
     getHighRiskCategories(riskScores) {
         const highRisks = [];
         const thresholds = this.config.risk_thresholds;
@@ -222,7 +311,7 @@ class CommitMessageProvider {
                 });
                 if (reason) {
                     // 记录审计日志
-                    this.logAuditEvent(commitMessage, reason, highRisks);
+                    await this.logAuditEvent(commitMessage, reason, highRisks);
                     vscode.window.showInformationMessage('已记录强制提交原因，您可以继续提交');
                 }
                 break;
@@ -238,19 +327,30 @@ class CommitMessageProvider {
         }
         return category;
     }
-    logAuditEvent(commitMessage, bypassReason, risks) {
+    currentWorkspace() {
+        return vscode.workspace.workspaceFolders?.[0]?.uri.fsPath || 'unknown';
+    }
+    async logAuditEvent(commitMessage, bypassReason, risks) {
+        // 审计日志由服务端统一写入（批量落盘、轮转与查询），服务不可用时才写本地文件
+        try {
+            await httpClient.post(`${this.serviceUrl}/audit/bypass`, { message: commitMessage, reason: bypassReason, risks, workspace: this.currentWorkspace() }, { timeout: 3000 });
+            return;
+        }
+        catch (error) {
+            console.warn('Failed to send audit event to XGuard service, writing local audit log:', error);
+        }
         const auditLog = {
             timestamp: new Date().toISOString(),
             commitMessage: commitMessage.substring(0, 100) + (commitMessage.length > 100 ? '...' : ''),
             bypassReason,
             risks: risks.map(r => ({ category: r.category, score: r.score })),
-            workspace: vscode.workspace.workspaceFolders?.[0]?.uri.fsPath || 'unknown'
+            workspace: this.currentWorkspace()
         };
         // 写入审计日志文件
         const fs = require('fs');
         const path = require('path');
         const logPath = path.join(require('os').homedir(), '.xguard_commit_audit.log');
-        fs.appendFileSync(logPath, JSON.stringify(auditLog) + '\n', 'utf8');
+        await fs.promises.appendFile(logPath, JSON.stringify(auditLog) + '\n', 'utf8');
         console.log('Audit log written:', auditLog);
     }
     async startLocalService() {
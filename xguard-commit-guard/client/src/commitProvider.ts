@@ -1,4 +1,5 @@
 import * as vscode from 'vscode';
+import * as http from 'http';
 import axios from 'axios';
 import { StatusBarManager } from './statusBar';
 
@@ -13,10 +14,18 @@ interface RiskThresholdConfig {
     [category: string]: number;
 }
 
+// 复用到本地服务的连接，每次检测不必重新建立TCP连接
+const httpClient = axios.create({ httpAgent: new http.Agent({ keepAlive: true }) });
+
+// 检测前重新校验服务端配置的最小间隔，配置未变化时服务端返回304
+const CONFIG_REFRESH_INTERVAL_MS = 5000;
+
 export class CommitMessageProvider {
     private statusBar: StatusBarManager;
     private serviceUrl: string;
     private config: any;
+    private configEtag: string | undefined;
+    private configCheckedAt: number;
 
     constructor(statusBar: StatusBarManager) {
         this.statusBar = statusBar;
@@ -31,6 +40,8 @@ export class CommitMessageProvider {
             skip_patterns: ["^fix", "^feat", "^docs", "^chore", "^refactor"],
             min_length: 10
         };
+        this.configEtag = undefined;
+        this.configCheckedAt = 0;
         
         // 加载配置
         this.loadConfig();
@@ -38,8 +49,21 @@ export class CommitMessageProvider {
 
     private async loadConfig() {
         try {
-            const response = await axios.get(`${this.serviceUrl}/config`, { timeout: 3000 });
+            const headers: { [name: string]: string } = {};
+            if (this.configEtag) {
+                headers['If-None-Match'] = this.configEtag;
+            }
+            const response = await httpClient.get(`${this.serviceUrl}/config`, {
+                timeout: 3000,
+                headers,
+                validateStatus: status => status === 200 || status === 304
+            });
+            this.configCheckedAt = Date.now();
+            if (response.status === 304) {
+                return;
+            }
             this.config = response.data;
+            this.configEtag = response.headers['etag'];
             console.log('Loaded XGuard configuration:', this.config);
         } catch (error) {
             console.warn('Failed to load XGuard configuration, using defaults:', error);
@@ -66,6 +90,11 @@ export class CommitMessageProvider {
     }
 
     public async checkCommitMessage(commitMessage: string): Promise<XGuardResult | null> {
+        // 服务端配置文件修改后阈值与跳过规则即时生效
+        if (Date.now() - this.configCheckedAt > CONFIG_REFRESH_INTERVAL_MS) {
+            await this.loadConfig();
+        }
+
         // 预筛：跳过明显安全的短消息
         if (this.shouldSkipDetection(commitMessage)) {
             this.statusBar.updateStatus({ safeScore: 1.0, isSafe: true });
@@ -85,17 +114,13 @@ export class CommitMessageProvider {
                 }, 15000);
             });
 
-            const responsePromise = axios.post<XGuardResult>(
-                `${this.serviceUrl}/check-commit`,
-                { message: commitMessage },
-                { timeout: this.config.timeout_seconds * 1000 }
-            );
-
-            const response = await Promise.race([responsePromise, clientTimeoutPromise]);
+            const stream = this.requestStream(commitMessage);
+            // 流式接口：done中途失败时verdict已返回，避免未处理的rejection
+            stream.done.catch(() => undefined);
 
-            console.log('XGuard response received:', response);
-            const result: XGuardResult = response.data;
-            console.log('XGuard result parsed:', result);
+            // 评分位置解码后即拿到判定，不必等待解释全部生成
+            let result = await Promise.race([stream.verdict, clientTimeoutPromise]);
+            console.log('XGuard verdict received:', result);
             
             if (result.error) {
                 vscode.window.showErrorMessage(`XGuard检测错误: ${result.error}`);
@@ -116,8 +141,10 @@ export class CommitMessageProvider {
             });
             console.log('Status bar updated');
 
-            // 如果有高风险，显示拦截对话框
+            // 如果有高风险，等待解释生成完毕后显示拦截对话框
             if (isBlocked) {
+                this.statusBar.setLoading(false);
+                result = await Promise.race([stream.done, clientTimeoutPromise]);
                 console.log('Showing security alert');
                 await this.showSecurityAlert(commitMessage, result, highRisks);
                 console.log('Security alert closed');
@@ -159,6 +186,72 @@ export class CommitMessageProvider {
         }
     }
 
+    /**
+     * 调用流式检测接口，解析Server-Sent Events。
+     * verdict在服务端解码出风险分后即兑现（不含解释），done在收到完整结果后兑现；
+     * token事件只用于保持连接：判定为安全时解释继续在后台读取，服务端生成完毕后才会写入缓存
+     */
+    private requestStream(commitMessage: string): { verdict: Promise<XGuardResult>; done: Promise<XGuardResult> } {
+        let resolveVerdict!: (result: XGuardResult) => void;
+        let rejectVerdict!: (error: any) => void;
+        let resolveDone!: (result: XGuardResult) => void;
+        let rejectDone!: (error: any) => void;
+        const verdict = new Promise<XGuardResult>((resolve, reject) => {
+            resolveVerdict = resolve;
+            rejectVerdict = reject;
+        });
+        const done = new Promise<XGuardResult>((resolve, reject) => {
+            resolveDone = resolve;
+            rejectDone = reject;
+        });
+        // 已兑现的Promise不受后续reject影响
+        const fail = (error: any) => {
+            rejectVerdict(error);
+            rejectDone(error);
+        };
+
+        httpClient.post(
+            `${this.serviceUrl}/check-commit/stream`,
+            { message: commitMessage, workspace: this.currentWorkspace() },
+            { timeout: this.config.timeout_seconds * 1000, responseType: 'stream' }
+        ).then(response => {
+            const body = response.data;
+            body.setEncoding('utf8');
+            let buffer = '';
+            body.on('data', (chunk: string) => {
+                buffer += chunk;
+                let end: number;
+                while ((end = buffer.indexOf('\n\n')) >= 0) {
+                    const block = buffer.slice(0, end);
+                    buffer = buffer.slice(end + 2);
+                    let event = 'message';
+                    let data = '';
+                    for (const line of block.split('\n')) {
+                        if (line.startsWith('event:')) {
+                            event = line.slice(6).trim();
+                        } else if (line.startsWith('data:')) {
+                            data += line.slice(5).trim();
+                        }
+                    }
+                    const payload = data ? JSON.parse(data) : {};
+                    if (event === 'verdict') {
+                        resolveVerdict({ ...payload, explanation: '' });
+                    } else if (event === 'done') {
+                        resolveVerdict({ ...payload, explanation: '' });
+                        resolveDone(payload);
+                    } else if (event === 'error') {
+                        resolveVerdict(payload);
+                        resolveDone(payload);
+                    }
+                }
+            });
+            body.on('end', () => fail(new Error('XGuard流式响应意外结束')));
+            body.on('error', fail);
+        }).catch(fail);
+
+        return { verdict, done };
+    }
+
     public getHighRiskCategories(riskScores: { [key: string]: number }): Array<{ category: string; score: number }> {
         const highRisks: Array<{ category: string; score: number }> = [];
         const thresholds = this.config.risk_thresholds as RiskThresholdConfig;
@@ -253,7 +346,7 @@ export class CommitMessageProvider {
                 });
                 if (reason) {
                     // 记录审计日志
-                    this.logAuditEvent(commitMessage, reason, highRisks);
+                    await this.logAuditEvent(commitMessage, reason, highRisks);
                     vscode.window.showInformationMessage('已记录强制提交原因，您可以继续提交');
                 }
                 break;
@@ -271,17 +364,33 @@ export class CommitMessageProvider {
         return category;
     }
 
-    private logAuditEvent(
+    private currentWorkspace(): string {
+        return vscode.workspace.workspaceFolders?.[0]?.uri.fsPath || 'unknown';
+    }
+
+    private async logAuditEvent(
         commitMessage: string,
         bypassReason: string,
         risks: Array<{ category: string; score: number }>
-    ): void {
+    ): Promise<void> {
+        // 审计日志由服务端统一写入（批量落盘、轮转与查询），服务不可用时才写本地文件
+        try {
+            await httpClient.post(
+                `${this.serviceUrl}/audit/bypass`,
+                { message: commitMessage, reason: bypassReason, risks, workspace: this.currentWorkspace() },
+                { timeout: 3000 }
+            );
+            return;
+        } catch (error) {
+            console.warn('Failed to send audit event to XGuard service, writing local audit log:', error);
+        }
+
         const auditLog = {
             timestamp: new Date().toISOString(),
             commitMessage: commitMessage.substring(0, 100) + (commitMessage.length > 100 ? '...' : ''),
             bypassReason,
             risks: risks.map(r => ({ category: r.category, score: r.score })),
-            workspace: vscode.workspace.workspaceFolders?.[0]?.uri.fsPath || 'unknown'
+            workspace: this.currentWorkspace()
         };
 
         // 写入审计日志文件
@@ -289,7 +398,7 @@ export class CommitMessageProvider {
         const path = require('path');
         const logPath = path.join(require('os').homedir(), '.xguard_commit_audit.log');
         
-        fs.appendFileSync(logPath, JSON.stringify(auditLog) + '\n', 'utf8');
+        await fs.promises.appendFile(logPath, JSON.stringify(auditLog) + '\n', 'utf8');
         console.log('Audit log written:', auditLog);
     }
 
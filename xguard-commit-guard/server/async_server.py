@@ -0,0 +1,442 @@
+"""
+XGuard异步服务循环 - 基于asyncio的HTTP/1.1服务，检测请求等待推理时不占用线程
+
+/health 与 /check-commit 在事件循环中直接处理：推理结果通过asyncio.wrap_future等待，
+超过截止时间或客户端断开连接时立即放弃对应的推理请求。
+其余接口通过WSGI桥接交给Flask应用，在线程池中执行。
+可同时监听Unix域套接字，供命令行与git钩子客户端免去TCP握手。
+"""
+
+import os
+import time
+import atexit
+import queue
+import asyncio
+import logging
+import threading
+from http import HTTPStatus
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+import xguard_service as service
+from batching import BatchFuture, DeadlineExceededError
+from verdict_cache import ComputationAbandonedError
+import metrics
+import wire
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+# 加载模型、WSGI桥接等阻塞操作使用的线程池
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='xguard-async')
+
+
+class ClientDisconnectedError(Exception):
+    """等待推理期间客户端已断开连接"""
+
+
+class HttpRequest:
+    __slots__ = ('method', 'path', 'query', 'version', 'headers', 'body')
+
+    def __init__(self, method, target, version, headers, body):
+        url = urlsplit(target)
+        self.method = method
+        self.path = url.path
+        self.query = url.query
+        self.version = version
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+    @property
+    def media_type(self):
+        """按Accept头选择的响应格式"""
+        return wire.response_type(self.headers.get('accept'))
+
+    def payload(self):
+        """按Content-Type解码请求体（JSON、msgpack或text/plain）"""
+        return wire.decode(self.body, self.headers.get('content-type'), self.query)
+
+
+class _HttpProtocol(asyncio.Protocol):
+    """单个连接：解析请求（支持keep-alive与流水线），按顺序交给dispatch处理"""
+
+    def __init__(self):
+        self.transport = None
+        self._buffer = bytearray()
+        self._pending = None
+        self._requests = asyncio.Queue()
+        self._can_write = asyncio.Event()
+        self._can_write.set()
+        self.disconnected = asyncio.Event()
+        self._task = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self._task = asyncio.get_running_loop().create_task(self._serve())
+
+    def connection_lost(self, exc):
+        self.disconnected.set()
+        self._can_write.set()
+        self._requests.put_nowait(None)
+
+    def pause_writing(self):
+        self._can_write.clear()
+
+    def resume_writing(self):
+        self._can_write.set()
+
+    def data_received(self, data):
+        self._buffer += data
+        try:
+            while self._parse_one():
+                pass
+        except ValueError as e:
+            self._requests.put_nowait(e)
+
+    def _parse_one(self):
+        """从缓冲区解析一个完整请求，数据不足时返回False"""
+        if self._pending is None:
+            end = self._buffer.find(b'\r\n\r\n')
+            if end < 0:
+                if len(self._buffer) > MAX_HEADER_BYTES:
+                    raise ValueError('请求头过大')
+                return False
+            lines = self._buffer[:end].decode('latin-1').split('\r\n')
+            del self._buffer[:end + 4]
+            try:
+                method, target, version = lines[0].split(' ', 2)
+            except ValueError:
+                raise ValueError('无效的请求行')
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            if 'chunked' in headers.get('transfer-encoding', '').lower():
+                raise ValueError('不支持分块编码的请求体，请提供Content-Length')
+            length = int(headers.get('content-length', 0) or 0)
+            if length > MAX_BODY_BYTES:
+                raise ValueError('请求体过大')
+            self._pending = (method, target, version, headers, length)
+
+        method, target, version, headers, length = self._pending
+        if len(self._buffer) < length:
+            return False
+        body = bytes(self._buffer[:length])
+        del self._buffer[:length]
+        self._pending = None
+        self._requests.put_nowait(HttpRequest(method, target, version, headers, body))
+        return True
+
+    async def _serve(self):
+        while True:
+            request = await self._requests.get()
+            if request is None:
+                return
+            if isinstance(request, ValueError):
+                await self.send(400, {"error": str(request)}, keep_alive=False)
+                return
+            try:
+                keep_alive = await dispatch(request, self)
+            except ClientDisconnectedError:
+                logger.info("客户端已断开，停止写出响应")
+                keep_alive = False
+            except Exception as e:
+                logger.error(f"请求处理失败: {e}")
+                keep_alive = False
+            if not keep_alive or self.disconnected.is_set():
+                self.close()
+                return
+
+    async def write(self, data):
+        if self.disconnected.is_set():
+            raise ClientDisconnectedError()
+        self.transport.write(data)
+        await self._can_write.wait()
+
+    async def send(self, status, payload, headers=None, keep_alive=True, media_type=wire.JSON):
+        body, content_type = wire.encode(payload, media_type)
+        head = [('Content-Type', content_type), ('Content-Length', str(len(body)))]
+        head.extend((headers or {}).items())
+        await self.write(_status_line(status, head, keep_alive) + body)
+
+    def close(self):
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.close()
+
+
+def _status_line(status, headers, keep_alive):
+    reason = HTTPStatus(status).phrase if status in HTTPStatus._value2member_map_ else ''
+    lines = [f'HTTP/1.1 {status} {reason}']
+    lines.extend(f'{name}: {value}' for name, value in headers)
+    lines.append('Connection: keep-alive' if keep_alive else 'Connection: close')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+async def _await_results(futures, deadline, disconnected):
+    """
+    等待推理结果；超时或客户端断开时放弃所有未完成的推理请求。
+    与其他请求共享的缓存Future不属于本请求，只停止等待
+    """
+    wrapped = [asyncio.wrap_future(future) for future in futures]
+    # 取消wrap_future的包装会连带取消源Future，共享的Future需shield，只取消本请求的等待
+    waiters = asyncio.gather(*(waiter if isinstance(future, BatchFuture) else asyncio.shield(waiter)
+                               for future, waiter in zip(futures, wrapped)))
+    watcher = asyncio.ensure_future(disconnected.wait())
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    try:
+        done, _ = await asyncio.wait({waiters, watcher}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+    if waiters in done:
+        return waiters.result()
+
+    for future in futures:
+        if isinstance(future, BatchFuture):
+            future.abandon()
+    waiters.cancel()
+    # 取回被取消任务的异常，避免事件循环告警
+    waiters.add_done_callback(lambda task: task.cancelled() or task.exception())
+    for waiter in wrapped:
+        waiter.add_done_callback(lambda task: task.cancelled() or task.exception())
+    if disconnected.is_set():
+        raise ClientDisconnectedError()
+    raise DeadlineExceededError("检测超过截止时间")
+
+
+async def check_text_async(text, score_only, deadline, disconnected):
+    """与service.check_text相同的检测流程，但等待推理时不阻塞线程"""
+    with metrics.track_check() as outcome:
+        if not text.strip():
+            outcome['decided_by'] = 'empty'
+            return service.empty_message_result()
+
+        result, hits = service.run_prechecks(text)
+        if result is not None:
+            outcome['decided_by'] = result.get('decided_by', 'prefilter')
+            return result
+
+        loop = asyncio.get_running_loop()
+        if not service.model_loaded():
+            await loop.run_in_executor(_executor, service.load_model)
+
+        cache = service.get_verdict_cache()
+        key = owner_future = None
+        if cache is not None:
+            key = service.cache_key_for(text, score_only)
+            while True:
+                value, future, owner = cache.reserve(key)
+                if value is not None:
+                    return service.attach_detector_hits(value, hits)
+                if owner:
+                    owner_future = future
+                    break
+                try:
+                    value = (await _await_results([future], deadline, disconnected))[0]
+                except ComputationAbandonedError:
+                    # 执行者已断开或超过它自己的截止时间，重新登记，由本请求或其他等待者接手
+                    continue
+                return service.attach_detector_hits(value, hits)
+
+        try:
+            value = first_scores = None
+            if service.cascade_active():
+                windows, futures = service.submit_text(text, score_only, deadline, service.get_cascade_batcher())
+                results = await _await_results(futures, deadline, disconnected)
+                value, first_scores = service.first_tier_verdict(windows, results, score_only)
+            if value is None:
+                windows, futures = service.submit_text(text, score_only, deadline)
+                results = await _await_results(futures, deadline, disconnected)
+                value = service.build_result(windows, results, score_only)
+                if first_scores is not None:
+                    value = service.escalated_result(value, first_scores)
+        except BaseException as e:
+            if owner_future is not None:
+                # 断开连接、超时与任务取消只与本请求有关，不能作为其他等待者的结果
+                own = isinstance(e, (ClientDisconnectedError, DeadlineExceededError)) or not isinstance(e, Exception)
+                cache.complete(key, owner_future, error=ComputationAbandonedError() if own else e)
+            raise
+        if owner_future is not None:
+            cache.complete(key, owner_future, value=value)
+        outcome['decided_by'] = value.get('decided_by', 'model')
+        return service.attach_detector_hits(value, hits)
+
+
+async def _handle_check_commit(request, protocol):
+    media_type = request.media_type
+    try:
+        data = request.payload()
+    except wire.UnsupportedMediaTypeError as e:
+        await protocol.send(415, {"error": str(e)}, keep_alive=request.keep_alive, media_type=media_type)
+        return
+    except ValueError:
+        await protocol.send(400, {"error": "请求体或查询参数无法解码"}, keep_alive=request.keep_alive, media_type=media_type)
+        return
+    try:
+        message = service.request_message(data)
+        deadline = service.request_deadline(data)
+    except service.InvalidRequestError as e:
+        await protocol.send(400, {"error": str(e)}, keep_alive=request.keep_alive, media_type=media_type)
+        return
+    score_only = bool(data.get('score_only', service.get_service_config()['score_only']))
+    try:
+        result = await check_text_async(message, score_only, deadline, protocol.disconnected)
+    except ClientDisconnectedError:
+        logger.info("客户端已断开，放弃检测")
+        return
+    except Exception as e:
+        logger.error(f"检测过程中发生错误: {e}")
+        status, headers = service.error_status(e)
+        service.audit_check(message, service.error_result(e), 'check-commit', data.get('workspace'))
+        await protocol.send(status, service.error_result(e), headers, keep_alive=request.keep_alive,
+                            media_type=media_type)
+        return
+    service.audit_check(message, result, 'check-commit', data.get('workspace'))
+    if data.get('verdict'):
+        result = dict(result, verdict=service.threshold_verdict(result))
+    await protocol.send(200, result, keep_alive=request.keep_alive, media_type=media_type)
+
+
+def _run_wsgi(request, chunks, stop):
+    """
+    在单个工作线程中调用Flask应用并迭代响应体（stream_with_context依赖线程内的请求上下文），
+    依次放入chunks：(status, headers)、若干响应体片段、结束标记None
+    """
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    builder = EnvironBuilder(
+        path=request.path,
+        method=request.method,
+        query_string=request.query,
+        headers=[(name, value) for name, value in request.headers.items() if name != 'content-length'],
+        data=request.body,
+    )
+    try:
+        environ = builder.get_environ()
+    finally:
+        builder.close()
+    try:
+        app_iter, status, headers = run_wsgi_app(service.app, environ, buffered=False)
+    except Exception as e:
+        put(e)
+        return
+    try:
+        if not put((status, headers)):
+            return
+        for chunk in app_iter:
+            if chunk and not put(chunk):
+                return
+    except Exception as e:
+        put(e)
+        return
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+    put(None)
+
+
+async def _handle_wsgi(request, protocol):
+    """其余接口转发给Flask应用；无Content-Length的响应（如NDJSON流）以分块编码逐段写出"""
+    loop = asyncio.get_running_loop()
+    chunks = queue.Queue(maxsize=16)
+    stop = threading.Event()
+    worker = loop.run_in_executor(_executor, _run_wsgi, request, chunks, stop)
+    try:
+        item = await loop.run_in_executor(None, chunks.get)
+        if isinstance(item, Exception):
+            raise item
+        status, headers = item
+        head = [(name, value) for name, value in headers.items() if name.lower() != 'connection']
+        chunked = 'Content-Length' not in headers
+        if chunked:
+            head.append(('Transfer-Encoding', 'chunked'))
+        await protocol.write(_status_line(int(status.split(' ', 1)[0]), head, request.keep_alive))
+        while True:
+            chunk = await loop.run_in_executor(None, chunks.get)
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            await protocol.write(b'%x\r\n%s\r\n' % (len(chunk), chunk) if chunked else chunk)
+        if chunked:
+            await protocol.write(b'0\r\n\r\n')
+    finally:
+        # 客户端断开或出错时通知工作线程停止迭代
+        stop.set()
+        await worker
+
+
+async def dispatch(request, protocol):
+    """处理一个请求，返回连接是否保持"""
+    if request.method == 'GET' and request.path == '/health':
+        # text/plain只用于检测结果，其余接口仍为JSON或msgpack
+        media_type = wire.MSGPACK if request.media_type == wire.MSGPACK else wire.JSON
+        await protocol.send(200, service.health_status(), keep_alive=request.keep_alive, media_type=media_type)
+    elif request.method == 'POST' and request.path == '/check-commit':
+        await _handle_check_commit(request, protocol)
+    else:
+        await _handle_wsgi(request, protocol)
+    return request.keep_alive
+
+
+def _remove_socket(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+async def _start_unix_server(path):
+    """监听Unix域套接字，仅当前用户可连接；残留的套接字文件会被替换"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    server = await asyncio.get_running_loop().create_unix_server(_HttpProtocol, path=path)
+    os.chmod(path, 0o600)
+    atexit.register(_remove_socket, path)
+    logger.info(f"XGuard服务已监听Unix域套接字 - {path}")
+    return server
+
+
+async def _serve(host, port, unix_socket=None):
+    loop = asyncio.get_running_loop()
+    servers = [await loop.create_server(_HttpProtocol, host, port)]
+    logger.info(f"XGuard异步服务已启动 - http://{host}:{port}")
+    if unix_socket:
+        servers.append(await _start_unix_server(unix_socket))
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+
+async def _serve_unix(path):
+    server = await _start_unix_server(path)
+    async with server:
+        await server.serve_forever()
+
+
+def run(host, port, unix_socket=None):
+    """启动异步服务（阻塞直到进程退出）"""
+    asyncio.run(_serve(host, port, unix_socket))
+
+
+def serve_unix_socket_in_background(path):
+    """在后台线程的事件循环中监听Unix域套接字（flask模式下与TCP端口并存）"""
+    thread = threading.Thread(target=asyncio.run, args=(_serve_unix(path),), name='xguard-unix-socket', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+XGuard审计日志 - 检测结果与强制绕过事件经非阻塞队列交给后台线程，按批写入分段的SQLite文件。
+分段达到大小或时长上限后轮转并gzip压缩，超出保留数量的旧分段删除；按时间、工作区、风险类别建索引查询。
+只记录文本的哈希与长度，不记录检测原文
+
+用法（直接读取审计目录，无需启动服务）:
+    python audit_log.py --since 2024-06-01 --category "Cybersecurity-Access Control"
+    python audit_log.py --workspace /path/to/repo --kind bypass --limit 20
+    python audit_log.py --dir ~/.xguard/audit --since 2024-06-01T08:00 --until 2024-06-02 --json
+"""
+
+import os
+import sys
+import json
+import gzip
+import time
+import queue
+import shutil
+import sqlite3
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+from thresholds import high_risk_categories
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = 'audit-'
+SEGMENT_SUFFIX = '.db'
+COMPRESSED_SUFFIX = '.db.gz'
+SEGMENT_TIME_FORMAT = '%Y%m%dT%H%M%S.%fZ'
+
+# 事件时间戳在入队时取得，可能略早于所在分段的起始时间，按时间筛选分段时放宽的秒数
+SEGMENT_SLACK_SECONDS = 60
+
+# 强制绕过事件保留的提交信息长度（与插件原先的本地审计日志一致）
+EXCERPT_LENGTH = 100
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS events ('
+    'id INTEGER PRIMARY KEY, ts REAL NOT NULL, kind TEXT NOT NULL, source TEXT, workspace TEXT, '
+    'text_sha TEXT, text_length INTEGER, blocked INTEGER, decided_by TEXT, safe_score REAL, '
+    'categories TEXT NOT NULL, detail TEXT NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS events_ts ON events (ts)',
+    'CREATE INDEX IF NOT EXISTS events_workspace_ts ON events (workspace, ts)',
+    'CREATE TABLE IF NOT EXISTS event_categories ('
+    'category TEXT NOT NULL, ts REAL NOT NULL, event_id INTEGER NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS event_categories_category_ts ON event_categories (category, ts)',
+)
+
+
+def text_digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+
+def check_event(text, result, thresholds, source, workspace=None):
+    """
+    检测结果事件。请求路径上只计算文本哈希，拦截类别在写入线程中按thresholds（检测时的配置）计算
+    """
+    return {
+        "ts": time.time(),
+        "kind": "check",
+        "source": source,
+        "workspace": workspace,
+        "text_sha": text_digest(text),
+        "text_length": len(text),
+        "result": result,
+        "thresholds": thresholds,
+    }
+
+
+def bypass_event(message, reason, risks, workspace=None, source='vscode'):
+    """强制绕过事件：绕过原因、被绕过的风险类别与提交信息摘录"""
+    return {
+        "ts": time.time(),
+        "kind": "bypass",
+        "source": source,
+        "workspace": workspace,
+        "text_sha": text_digest(message),
+        "text_length": len(message),
+        "reason": reason,
+        "risks": [{"category": risk['category'], "score": risk.get('score')} for risk in risks or []],
+        "excerpt": message[:EXCERPT_LENGTH] + ('...' if len(message) > EXCERPT_LENGTH else ''),
+    }
+
+
+def _row(event):
+    """事件 → (blocked, decided_by, safe_score, 拦截类别, detail)"""
+    if event['kind'] == 'bypass':
+        categories = [risk['category'] for risk in event['risks']]
+        detail = {"reason": event['reason'], "risks": event['risks'], "excerpt": event['excerpt']}
+        return 1, None, None, categories, detail
+
+    result = event['result']
+    scores = result.get('risk_scores') or {}
+    detail = {"risk_scores": scores}
+    if result.get('error'):
+        detail['error'] = result['error']
+        return None, 'error', None, [], detail
+    if result.get('detector_hits'):
+        detail['detector_rules'] = sorted({hit['rule'] for hit in result['detector_hits']})
+    categories = [category for category, _ in high_risk_categories(scores, event['thresholds'])]
+    return int(bool(categories)), result.get('decided_by', 'model'), result.get('safe_score'), categories, detail
+
+
+def _segment_name(ts):
+    return SEGMENT_PREFIX + datetime.fromtimestamp(ts, timezone.utc).strftime(SEGMENT_TIME_FORMAT) + SEGMENT_SUFFIX
+
+
+def _segment_start(name):
+    """分段文件名中的起始时间戳，不是分段文件时返回None"""
+    if not name.startswith(SEGMENT_PREFIX):
+        return None
+    for suffix in (COMPRESSED_SUFFIX, SEGMENT_SUFFIX):
+        if name.endswith(suffix):
+            stamp = name[len(SEGMENT_PREFIX):-len(suffix)]
+            try:
+                return datetime.strptime(stamp, SEGMENT_TIME_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+            except ValueError:
+                return None
+    return None
+
+
+def list_segments(directory):
+    """审计目录中的分段：[(起始时间戳, 路径)]，按起始时间升序"""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    segments = []
+    for name in names:
+        start = _segment_start(name)
+        if start is not None:
+            segments.append((start, os.path.join(directory, name)))
+    return sorted(segments)
+
+
+def _compress(path):
+    """gzip压缩已轮转的分段，完成后才删除原文件"""
+    target = path[:-len(SEGMENT_SUFFIX)] + COMPRESSED_SUFFIX
+    with open(path, 'rb') as src, gzip.open(target + '.tmp', 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(target + '.tmp', target)
+    for leftover in (path, path + '-wal', path + '-shm'):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+
+
+class AuditLog:
+    """
+    审计日志写入器。record()只做一次非阻塞入队，队列满时丢弃事件并计数，审计I/O不进入请求路径；
+    后台线程凑满batch_size或等待flush_interval秒后在一个事务中写入整批事件
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, rotate_seconds=86400, keep_files=30,
+                 queue_size=10000, batch_size=500, flush_interval=1.0):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.keep_files = keep_files
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.rotations = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._conn = None
+        self._path = None
+        self._started_at = None
+        self._thread = threading.Thread(target=self._run, name='xguard-audit', daemon=True)
+        self._thread.start()
+        logger.info(f"审计日志写入目录: {self.directory}")
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def record(self, event):
+        """提交一个事件，返回是否入队"""
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def close(self, timeout=5.0):
+        """写完队列中已有的事件后停止写入线程"""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.warning("审计日志队列已满，关闭时放弃未写入的事件")
+            return
+        self._thread.join(timeout)
+
+    def _run(self):
+        closing = False
+        while not closing:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    event = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if event is None:
+                    closing = True
+                    break
+                batch.append(event)
+            try:
+                self._write(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(f"写入审计日志失败，丢弃{len(batch)}个事件: {e}")
+                self._close_segment()
+        self._close_segment()
+
+    def _write(self, batch):
+        if self._conn is None or self._due_for_rotation():
+            self._rotate(batch[0]['ts'])
+        with self._conn:
+            for event in batch:
+                blocked, decided_by, safe_score, categories, detail = _row(event)
+                cursor = self._conn.execute(
+                    'INSERT INTO events (ts, kind, source, workspace, text_sha, text_length, blocked, decided_by, '
+                    'safe_score, categories, detail) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (event['ts'], event['kind'], event['source'], event['workspace'], event['text_sha'],
+                     event['text_length'], blocked, decided_by, safe_score,
+                     json.dumps(categories, ensure_ascii=False), json.dumps(detail, ensure_ascii=False))
+                )
+                self._conn.executemany(
+                    'INSERT INTO event_categories (category, ts, event_id) VALUES (?, ?, ?)',
+                    [(category, event['ts'], cursor.lastrowid) for category in categories]
+                )
+        self.written += len(batch)
+
+    def _due_for_rotation(self):
+        if time.time() - self._started_at >= self.rotate_seconds:
+            return True
+        size = sum(os.path.getsize(path) for path in (self._path, self._path + '-wal') if os.path.exists(path))
+        return size >= self.max_bytes
+
+    def _rotate(self, ts):
+        """关闭当前分段（首次写入时沿用未到期的最新分段），压缩其余未压缩分段并清理超出保留数量的旧分段"""
+        if self._conn is not None:
+            self._close_segment()
+            self.rotations += 1
+        else:
+            active = [(start, path) for start, path in list_segments(self.directory) if path.endswith(SEGMENT_SUFFIX)]
+            if active:
+                self._open_segment(*active[-1])
+                if not self._due_for_rotation():
+                    return
+                self._close_segment()
+
+        self._open_segment(ts, os.path.join(self.directory, _segment_name(ts)))
+        for _, path in list_segments(self.directory):
+            if path != self._path and path.endswith(SEGMENT_SUFFIX):
+                _compress(path)
+        if self.keep_files > 0:
+            archived = [path for _, path in list_segments(self.directory) if path != self._path]
+            for path in archived[:max(0, len(archived) - self.keep_files)]:
+                os.remove(path)
+
+    def _open_segment(self, start, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+        self._path = path
+        self._started_at = start
+
+    def _close_segment(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def parse_time(value):
+    """查询时间：Unix时间戳，或ISO 8601日期/时间（未带时区时按本地时间）"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def _open_for_query(path, scratch):
+    """打开分段；压缩的分段解压到临时目录"""
+    if path.endswith(COMPRESSED_SUFFIX):
+        target = os.path.join(scratch, os.path.basename(path)[:-len('.gz')])
+        with gzip.open(path, 'rb') as src, open(target, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        path = target
+    return sqlite3.connect(path)
+
+
+def query(directory, since=None, until=None, workspace=None, category=None, kind=None, limit=100):
+    """
+    按时间倒序查询审计事件；since/until为时间戳，只打开与时间范围相交的分段，
+    分段内按ts、(workspace, ts)、(category, ts)索引筛选
+    """
+    since = float('-inf') if since is None else since
+    until = float('inf') if until is None else until
+    segments = list_segments(os.path.expanduser(directory))
+    selected = []
+    for index, (start, path) in enumerate(segments):
+        end = segments[index + 1][0] if index + 1 < len(segments) else float('inf')
+        if start - SEGMENT_SLACK_SECONDS < until and end + SEGMENT_SLACK_SECONDS > since:
+            selected.append(path)
+
+    sql = ('SELECT ts, kind, source, workspace, text_sha, text_length, blocked, decided_by, safe_score, '
+           'categories, detail FROM events WHERE ts >= ? AND ts < ?')
+    bounds = (max(since, -1e18), min(until, 1e18))
+    params = list(bounds)
+    if workspace:
+        sql += ' AND workspace = ?'
+        params.append(workspace)
+    if kind:
+        sql += ' AND kind = ?'
+        params.append(kind)
+    if category:
+        sql += ' AND id IN (SELECT event_id FROM event_categories WHERE category = ? AND ts >= ? AND ts < ?)'
+        params.extend((category, *bounds))
+    sql += ' ORDER BY ts DESC LIMIT ?'
+
+    events = []
+    with tempfile.TemporaryDirectory(prefix='xguard-audit-') as scratch:
+        for path in reversed(selected):
+            if len(events) >= limit:
+                break
+            conn = _open_for_query(path, scratch)
+            try:
+                rows = conn.execute(sql, (*params, limit - len(events))).fetchall()
+            except sqlite3.DatabaseError as e:
+                logger.warning(f"读取审计分段失败 {path}: {e}")
+                continue
+            finally:
+                conn.close()
+            for ts, kind_, source, workspace_, text_sha, text_length, blocked, decided_by, safe_score, \
+                    categories, detail in rows:
+                events.append({
+                    "time": datetime.fromtimestamp(ts, timezone.utc).isoformat(),
+                    "ts": ts,
+                    "kind": kind_,
+                    "source": source,
+                    "workspace": workspace_,
+                    "text_sha": text_sha,
+                    "text_length": text_length,
+                    "blocked": None if blocked is None else bool(blocked),
+                    "decided_by": decided_by,
+                    "safe_score": safe_score,
+                    "categories": json.loads(categories),
+                    **json.loads(detail),
+                })
+    # 相邻分段在容差范围内可能交错，合并后重新排序
+    events.sort(key=lambda event: event['ts'], reverse=True)
+    return events[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='XGuard审计日志查询')
+    parser.add_argument('--dir', help='审计目录，默认取audit_log_dir配置')
+    parser.add_argument('--since', help='起始时间（含），Unix时间戳或ISO 8601')
+    parser.add_argument('--until', help='截止时间（不含），Unix时间戳或ISO 8601')
+    parser.add_argument('--workspace', help='只看该工作区的事件')
+    parser.add_argument('--category', help='只看拦截或绕过了该风险类别的事件')
+    parser.add_argument('--kind', choices=('check', 'bypass'), help='事件类型')
+    parser.add_argument('--limit', type=int, default=100, help='最多返回的事件数')
+    parser.add_argument('--json', action='store_true', help='每行输出一个JSON事件')
+    args = parser.parse_args()
+
+    directory = args.dir
+    if not directory:
+        from config import ConfigStore
+        directory = ConfigStore().get()['audit_log_dir']
+    events = query(directory, parse_time(args.since), parse_time(args.until), args.workspace,
+                   args.category, args.kind, args.limit)
+    for event in events:
+        if args.json:
+            print(json.dumps(event, ensure_ascii=False))
+            continue
+        local = datetime.fromtimestamp(event['ts']).strftime('%Y-%m-%d %H:%M:%S')
+        status = '绕过' if event['kind'] == 'bypass' else ('拦截' if event['blocked'] else '放行')
+        if event.get('error'):
+            status = '出错'
+        line = f"{local}  {status}  {event['workspace'] or '-'}  {', '.join(event['categories']) or '-'}"
+        if event['kind'] == 'bypass':
+            line += f"  原因: {event['reason']}"
+        print(line)
+    if not args.json:
+        print(f"\n共 {len(events)} 条（{directory}）")
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
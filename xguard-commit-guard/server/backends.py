@@ -0,0 +1,389 @@
+"""
+XGuard推理后端 - 统一"渲染后的prompt → 风险分布 + 可选解释文本"的推理接口
+
+eager: transformers原生model.generate（原有行为）
+compile: 同上，model.forward经torch.compile编译（dynamic=True，首次调用编译较慢，由预热承担）
+onnx: 导出为带KV cache的单步ONNX图，由ONNX Runtime CPU执行贪心解码，需要安装onnxruntime
+
+各后端共用RiskScoreCapture与parse_topk，结果格式与infer()一致。
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import time
+
+import torch
+
+from inference import render_prompts, build_results, infer_prompts, infer_stream
+from prefix_cache import PrefixKVCache, prefix_token_ids, prefix_layout
+from precision import load_causal_lm, model_memory_bytes
+from scoring import RiskScoreCapture
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('eager', 'compile', 'onnx')
+
+# 导出格式变化时递增，旧的导出产物随之失效
+ONNX_EXPORT_VERSION = 1
+ONNX_OPSET = 17
+
+
+def _check_backend(name):
+    if name not in BACKENDS:
+        raise ValueError(f"不支持的推理后端: {name}，可选: {', '.join(BACKENDS)}")
+
+
+class InferenceBackend:
+    """
+    推理后端基类：infer()接收已渲染的prompt，返回与infer()相同格式的结果列表；
+    stats(dict)的键与infer_batch一致。model为torch模型，ONNX后端为None
+    """
+
+    name = None
+    supports_streaming = False
+
+    def __init__(self, tokenizer, model=None):
+        self.tokenizer = tokenizer
+        self.model = model
+
+    def infer(self, prompts, policy=None, max_new_tokens=500, reason_first=False, should_stop=None, stats=None,
+              use_prefix_cache=True):
+        raise NotImplementedError
+
+    def infer_batch(self, batch_messages, policy=None, max_new_tokens=500, reason_first=False, stats=None, **kwargs):
+        """渲染对话后调用infer()，参数与inference.infer_batch一致"""
+        started = time.perf_counter()
+        prompts = render_prompts(self.tokenizer, batch_messages, policy, reason_first)
+        rendered = time.perf_counter()
+        results = self.infer(prompts, policy=policy, max_new_tokens=max_new_tokens, reason_first=reason_first,
+                             stats=stats, **kwargs)
+        if stats is not None:
+            stats['render'] = rendered - started
+        return results
+
+    def memory_bytes(self):
+        raise NotImplementedError
+
+
+class EagerBackend(InferenceBackend):
+    """transformers原生推理；前缀KV与模型绑定，模型重新加载后旧前缀全部失效"""
+
+    name = 'eager'
+    supports_streaming = True
+
+    def __init__(self, model, tokenizer):
+        super().__init__(tokenizer, model)
+        self.prefix_cache = PrefixKVCache()
+
+    def infer(self, prompts, policy=None, max_new_tokens=500, reason_first=False, should_stop=None, stats=None,
+              use_prefix_cache=True):
+        prefix_cache = self.prefix_cache if use_prefix_cache else None
+        return infer_prompts(self.model, self.tokenizer, prompts, policy, max_new_tokens, reason_first,
+                             prefix_cache, should_stop, stats)
+
+    def infer_stream(self, messages, policy=None, max_new_tokens=500, use_prefix_cache=True, **kwargs):
+        """单条流式推理，参数与inference.infer_stream一致"""
+        prefix_cache = self.prefix_cache if use_prefix_cache else None
+        return infer_stream(self.model, self.tokenizer, messages, policy=policy, max_new_tokens=max_new_tokens,
+                            prefix_cache=prefix_cache, **kwargs)
+
+    def memory_bytes(self):
+        return model_memory_bytes(self.model)
+
+
+class CompiledBackend(EagerBackend):
+    """model.forward经torch.compile编译；prefill与逐token解码的形状各异，使用dynamic=True减少重新编译"""
+
+    name = 'compile'
+
+    def __init__(self, model, tokenizer):
+        model.forward = torch.compile(model.forward, dynamic=True)
+        super().__init__(model, tokenizer)
+
+
+def _cache_layers(cache):
+    """DynamicCache各层的(key, value)，兼容transformers 4.x与5.x的属性名"""
+    if hasattr(cache, 'layers'):
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    return list(zip(cache.key_cache, cache.value_cache))
+
+
+def _weights_signature(model_path):
+    """模型目录中配置与权重文件的(文件名, 大小, mtime)，文件被替换后导出产物随之失效"""
+    signature = []
+    for name in sorted(os.listdir(model_path)):
+        if name.endswith(('.json', '.safetensors', '.bin')):
+            stat = os.stat(os.path.join(model_path, name))
+            signature.append([name, stat.st_size, stat.st_mtime_ns])
+    return signature
+
+
+def onnx_export_dir(model_path, cache_dir):
+    """模型对应的ONNX导出目录：按模型文件、torch/transformers版本与导出格式版本区分"""
+    import transformers
+
+    model_path = os.path.abspath(model_path)
+    key = json.dumps({
+        'model_path': model_path,
+        'files': _weights_signature(model_path),
+        'torch': torch.__version__,
+        'transformers': transformers.__version__,
+        'export_version': ONNX_EXPORT_VERSION,
+    }, sort_keys=True)
+    return os.path.join(cache_dir, hashlib.sha256(key.encode('utf-8')).hexdigest()[:16])
+
+
+class _DecodeStep(torch.nn.Module):
+    """单步前向：由扁平的past key/value构建DynamicCache，返回最后一个位置的logits与各层present key/value"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+        self.num_layers = model.config.num_hidden_layers
+
+    def forward(self, input_ids, attention_mask, position_ids, *past):
+        from transformers import DynamicCache
+
+        cache = DynamicCache()
+        for layer in range(self.num_layers):
+            cache.update(past[2 * layer], past[2 * layer + 1], layer)
+        outputs = self.model(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids,
+                             past_key_values=cache, use_cache=True)
+        present = []
+        for key, value in _cache_layers(outputs.past_key_values):
+            present += [key, value]
+        return (outputs.logits[:, -1, :], *present)
+
+
+def _past_names(num_layers, kind):
+    return [f'{kind}_{part}_{layer}' for layer in range(num_layers) for part in ('key', 'value')]
+
+
+def export_onnx(model_path, output_dir):
+    """
+    将模型导出为单步ONNX图（float32、eager attention）并写入export.json元数据。
+    导出时past长度非零：以空past追踪会把"cache为空"的分支固化进图中，解码步的结果随之出错
+    """
+    from transformers import AutoModelForCausalLM
+
+    model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=torch.float32,
+                                                 attn_implementation='eager').eval()
+    step = _DecodeStep(model)
+    num_layers = step.num_layers
+    batch, length, past_length = 2, 5, 3
+    input_ids = torch.ones(batch, length, dtype=torch.long)
+    attention_mask = torch.ones(batch, past_length + length, dtype=torch.long)
+    position_ids = torch.arange(past_length, past_length + length).expand(batch, length)
+    with torch.no_grad():
+        # 先普通前向一次得到各层KV的形状
+        probe = model(input_ids=input_ids[:, :1], use_cache=True)
+        _, kv_heads, _, head_dim = _cache_layers(probe.past_key_values)[0][0].shape
+        past = [torch.zeros(batch, kv_heads, past_length, head_dim) for _ in range(2 * num_layers)]
+
+        past_names = _past_names(num_layers, 'past')
+        present_names = _past_names(num_layers, 'present')
+        dynamic_axes = {
+            'input_ids': {0: 'batch', 1: 'length'},
+            'attention_mask': {0: 'batch', 1: 'total_length'},
+            'position_ids': {0: 'batch', 1: 'length'},
+            'logits': {0: 'batch'},
+        }
+        dynamic_axes.update({name: {0: 'batch', 2: 'past_length'} for name in past_names})
+        dynamic_axes.update({name: {0: 'batch', 2: 'total_length'} for name in present_names})
+        torch.onnx.export(
+            step, (input_ids, attention_mask, position_ids, *past), os.path.join(output_dir, 'model.onnx'),
+            input_names=['input_ids', 'attention_mask', 'position_ids', *past_names],
+            output_names=['logits', *present_names], dynamic_axes=dynamic_axes,
+            opset_version=ONNX_OPSET, dynamo=False
+        )
+
+    eos_token_id = model.generation_config.eos_token_id
+    if eos_token_id is not None and not isinstance(eos_token_id, list):
+        eos_token_id = [eos_token_id]
+    metadata = {
+        'num_layers': num_layers,
+        'kv_heads': int(kv_heads),
+        'head_dim': int(head_dim),
+        'eos_token_id': eos_token_id or [],
+        'model_path': os.path.abspath(model_path),
+    }
+    with open(os.path.join(output_dir, 'export.json'), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata
+
+
+def ensure_onnx_export(model_path, cache_dir):
+    """返回模型的ONNX导出目录，不存在时先导出到临时目录再原子改名，多个进程同时导出时只保留一份"""
+    target = onnx_export_dir(model_path, cache_dir)
+    if os.path.exists(os.path.join(target, 'export.json')):
+        return target
+
+    os.makedirs(cache_dir, exist_ok=True)
+    logger.info(f"正在导出ONNX模型: {model_path} → {target}")
+    started = time.monotonic()
+    staging = tempfile.mkdtemp(prefix='.export-', dir=cache_dir)
+    try:
+        export_onnx(model_path, staging)
+        try:
+            os.replace(staging, target)
+        except OSError:
+            if not os.path.exists(os.path.join(target, 'export.json')):
+                raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    logger.info(f"ONNX模型导出完成 - 耗时 {time.monotonic() - started:.1f}s")
+    return target
+
+
+class OnnxBackend(InferenceBackend):
+    """
+    ONNX Runtime CPU推理：逐步执行单步图完成贪心解码，语义与model.generate(do_sample=False)一致——
+    左填充（或[前缀][填充][后缀]布局）输入，position_ids由attention_mask累加得到，
+    已结束的行补pad，遇到eos、should_stop()为True或达到max_new_tokens时结束。
+    前缀KV由同一个图计算并按(policy, reason_first)缓存。不支持逐token流式输出
+    """
+
+    name = 'onnx'
+
+    def __init__(self, export_dir, tokenizer, threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("onnx推理后端需要安装onnxruntime: pip install onnxruntime onnx")
+        super().__init__(tokenizer)
+        with open(os.path.join(export_dir, 'export.json'), 'r', encoding='utf-8') as f:
+            self.metadata = json.load(f)
+        self.export_dir = export_dir
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads or torch.get_num_threads()
+        self.session = ort.InferenceSession(os.path.join(export_dir, 'model.onnx'), options,
+                                            providers=['CPUExecutionProvider'])
+        num_layers = self.metadata['num_layers']
+        self._past_names = _past_names(num_layers, 'past')
+        self._eos = torch.tensor(self.metadata['eos_token_id'] or [tokenizer.eos_token_id], dtype=torch.long)
+        self._prefixes = {}
+        self._prefix_lock = threading.Lock()
+
+    def _empty_past(self, batch_size):
+        shape = (batch_size, self.metadata['kv_heads'], 0, self.metadata['head_dim'])
+        return [torch.zeros(shape).numpy() for _ in self._past_names]
+
+    def _run(self, input_ids, attention_mask, position_ids, past):
+        feed = {
+            'input_ids': input_ids.numpy(),
+            'attention_mask': attention_mask.numpy(),
+            'position_ids': position_ids.numpy(),
+        }
+        feed.update(zip(self._past_names, past))
+        outputs = self.session.run(None, feed)
+        return torch.from_numpy(outputs[0]), outputs[1:]
+
+    def _prefix(self, policy, reason_first):
+        """共享前缀的(token id, 各层KV)，首次调用时计算，无法提取有效前缀时为None"""
+        key = (json.dumps(policy, sort_keys=True, ensure_ascii=False), reason_first)
+        with self._prefix_lock:
+            if key not in self._prefixes:
+                prefix_ids = prefix_token_ids(self.tokenizer, policy, reason_first)
+                entry = None
+                if prefix_ids:
+                    input_ids = torch.tensor([prefix_ids])
+                    _, past = self._run(input_ids, torch.ones_like(input_ids),
+                                        torch.arange(len(prefix_ids)).unsqueeze(0), self._empty_past(1))
+                    entry = (prefix_ids, past)
+                    logger.info(f"ONNX前缀KV缓存已构建 - {len(prefix_ids)} tokens")
+                self._prefixes[key] = entry
+            return self._prefixes[key]
+
+    def _prepare_inputs(self, prompts, policy, reason_first, use_prefix_cache):
+        """返回(input_ids, attention_mask, 已缓存的前缀长度, 各层past)"""
+        tokenizer = self.tokenizer
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+
+        if use_prefix_cache:
+            entry = self._prefix(policy, reason_first)
+            if entry is not None:
+                prefix_ids, past = entry
+                layout = prefix_layout(prefix_ids, tokenizer(prompts)['input_ids'], tokenizer.pad_token_id)
+                if layout is not None:
+                    input_ids, attention_mask = layout
+                    past = [value.repeat(len(prompts), axis=0) for value in past]
+                    return torch.tensor(input_ids), torch.tensor(attention_mask), len(prefix_ids), past
+
+        padding_side = tokenizer.padding_side
+        tokenizer.padding_side = 'left'
+        try:
+            encoded = tokenizer(prompts, return_tensors="pt", padding=True)
+        finally:
+            tokenizer.padding_side = padding_side
+        return encoded['input_ids'], encoded['attention_mask'], 0, self._empty_past(len(prompts))
+
+    def infer(self, prompts, policy=None, max_new_tokens=500, reason_first=False, should_stop=None, stats=None,
+              use_prefix_cache=True):
+        pad_token_id = self.tokenizer.pad_token_id
+        started = time.perf_counter()
+        sequences, attention_mask, cached, past = self._prepare_inputs(prompts, policy, reason_first, use_prefix_cache)
+        tokenized = time.perf_counter()
+
+        input_length = sequences.shape[1]
+        score_capture = RiskScoreCapture(input_length, pad_token_id, reason_first=reason_first)
+        unfinished = torch.ones(sequences.shape[0], dtype=torch.bool)
+        position_ids = (attention_mask.cumsum(-1) - 1).masked_fill(attention_mask == 0, 1)
+        step_ids = sequences[:, cached:]
+        step_positions = position_ids[:, cached:]
+        prefilled = None
+        for _ in range(max_new_tokens):
+            logits, past = self._run(step_ids, attention_mask, step_positions, past)
+            if prefilled is None:
+                prefilled = time.perf_counter()
+            score_capture(sequences, logits)
+            next_tokens = logits.argmax(-1)
+            next_tokens = torch.where(unfinished, next_tokens, pad_token_id)
+            sequences = torch.cat([sequences, next_tokens[:, None]], dim=-1)
+            unfinished &= ~torch.isin(next_tokens, self._eos)
+            if should_stop is not None:
+                unfinished &= ~torch.tensor(should_stop(), dtype=torch.bool)
+            if not bool(unfinished.any()):
+                break
+            attention_mask = torch.cat([attention_mask, attention_mask.new_ones((attention_mask.shape[0], 1))], dim=-1)
+            step_ids = next_tokens[:, None]
+            step_positions = step_positions[:, -1:] + 1
+        generated = time.perf_counter()
+
+        generated_tokens = sequences[:, input_length:]
+        results = build_results(self.tokenizer, generated_tokens.tolist(), score_capture.finalize(sequences))
+
+        if stats is not None:
+            prefilled = prefilled or generated
+            stats.update(
+                tokenize=tokenized - started,
+                prefill=prefilled - tokenized,
+                decode=generated - prefilled,
+                parse=time.perf_counter() - generated,
+                input_tokens=attention_mask[:, :input_length].sum(dim=1).tolist(),
+                generated_tokens=(generated_tokens != pad_token_id).sum(dim=1).tolist()
+            )
+        return results
+
+    def memory_bytes(self):
+        """导出目录中图与外部权重文件的大小，近似为ONNX Runtime持有的权重内存"""
+        return sum(entry.stat().st_size for entry in os.scandir(self.export_dir) if entry.is_file())
+
+
+def load_backend(name, model_path, tokenizer, precision='auto', onnx_cache_dir=None):
+    """按名称加载推理后端；onnx后端以float32导出与执行，只支持precision=auto"""
+    _check_backend(name)
+    if name == 'onnx':
+        if precision != 'auto':
+            raise ValueError(f"onnx推理后端不支持精度模式: {precision}，请使用auto")
+        cache_dir = onnx_cache_dir or os.path.join(os.path.expanduser('~'), '.cache', 'xguard', 'onnx')
+        return OnnxBackend(ensure_onnx_export(model_path, cache_dir), tokenizer)
+    model = load_causal_lm(model_path, precision)
+    if name == 'compile':
+        return CompiledBackend(model, tokenizer)
+    return EagerBackend(model, tokenizer)
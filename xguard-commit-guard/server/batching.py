@@ -0,0 +1,202 @@
+"""
+XGuard动态微批调度器 - 将短时间窗口内到达的请求合并为一次model.generate调用
+"""
+
+import json
+import math
+import time
+import queue
+import logging
+import threading
+import contextlib
+from concurrent.futures import Future
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """等待队列已满，调用方应返回429并携带Retry-After"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"XGuard推理队列已满，请{retry_after}秒后重试")
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(Exception):
+    """请求在推理前或推理中超过截止时间，或已被调用方放弃"""
+
+
+class BatchFuture(Future):
+    """可被调用方放弃的Future：未开始时直接取消，推理中则在下一个解码步停止该行"""
+
+    def __init__(self, deadline=None):
+        super().__init__()
+        self.deadline = deadline
+        self.abandoned = False
+
+    def abandon(self):
+        self.abandoned = True
+        self.cancel()
+
+    def expired(self, now=None):
+        if self.abandoned:
+            return True
+        return self.deadline is not None and (now if now is not None else time.monotonic()) >= self.deadline
+
+
+class _BatchItem:
+    """单条待推理请求"""
+
+    __slots__ = ('messages', 'params', 'key', 'future', 'enqueued')
+
+    def __init__(self, messages, policy, max_new_tokens, reason_first, deadline):
+        self.messages = messages
+        self.params = {'policy': policy, 'max_new_tokens': max_new_tokens, 'reason_first': reason_first}
+        # policy可能是list/dict，序列化后作为分组键
+        self.key = json.dumps(self.params, sort_keys=True, ensure_ascii=False)
+        self.future = BatchFuture(deadline)
+        self.enqueued = time.monotonic()
+
+
+class MicroBatcher:
+    """
+    动态微批调度器
+
+    单个后台线程独占模型：收到第一条请求后最多再等待batch_window_ms，
+    期间到达的请求（最多max_batch_size条）按生成参数分组后一次性推理，
+    再按batch_idx把结果分发回各自的Future。
+
+    等待队列最多max_queue_depth条，满时submit抛出QueueFullError。
+    已过截止时间或被放弃的请求在推理前直接丢弃；推理中则通过should_stop
+    回调让对应行在下一个解码步结束。
+
+    concurrency>1时启动多个调度线程，各自凑批并同时推理（用于多进程推理池）。
+    """
+
+    def __init__(self, infer_fn, max_batch_size=8, batch_window_ms=10, lock=None, max_queue_depth=64,
+                 concurrency=1):
+        """
+        infer_fn: 批量推理函数，签名为 infer_fn(batch_messages, policy=..., max_new_tokens=..., reason_first=..., should_stop=...)，
+                  返回与batch_messages等长的结果列表；should_stop()返回每行是否应停止解码的bool列表
+        """
+        self.infer_fn = infer_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.batch_window = max(0.0, float(batch_window_ms) / 1000.0)
+        self.lock = lock if lock is not None else contextlib.nullcontext()
+        self.max_queue_depth = max(1, int(max_queue_depth))
+        self.concurrency = max(1, int(concurrency))
+        self._queue = queue.Queue(maxsize=self.max_queue_depth)
+        # 单批推理耗时的指数滑动平均，用于估算Retry-After
+        self._avg_batch_seconds = 1.0
+        self.dropped = 0
+        self._threads = [
+            threading.Thread(target=self._run, name=f'xguard-batcher-{i}', daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def depth(self):
+        """当前排队的请求数"""
+        return self._queue.qsize()
+
+    def retry_after(self):
+        """按当前队列深度与平均批耗时估算多久后重试（秒）"""
+        batches_ahead = self._queue.qsize() / (self.max_batch_size * self.concurrency) + 1
+        return max(1, math.ceil(self._avg_batch_seconds * batches_ahead))
+
+    def submit(self, messages, policy=None, max_new_tokens=500, reason_first=False, deadline=None):
+        """
+        提交一条请求，返回BatchFuture，结果为infer()同格式的dict
+        deadline: time.monotonic()时间戳，超过后请求被丢弃并以DeadlineExceededError结束
+        """
+        item = _BatchItem(messages, policy, max_new_tokens, reason_first, deadline)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            raise QueueFullError(self.retry_after())
+        return item.future
+
+    def _collect(self):
+        """阻塞等待第一条请求，然后在时间窗口内尽量凑满一个批次"""
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+
+            # 生成参数不同的请求不能合并，按参数分组依次推理
+            groups = {}
+            for item in items:
+                groups.setdefault(item.key, []).append(item)
+
+            for group in groups.values():
+                self._run_group(group)
+
+    def _drop_expired(self, group):
+        """丢弃已取消或已过期的请求，返回仍需推理的请求"""
+        now = time.monotonic()
+        alive = []
+        for item in group:
+            if not item.future.set_running_or_notify_cancel():
+                self.dropped += 1
+                continue
+            if item.future.expired(now):
+                self.dropped += 1
+                item.future.set_exception(DeadlineExceededError("请求在推理开始前已超时"))
+                continue
+            alive.append(item)
+        return alive
+
+    def _run_group(self, group):
+        group = self._drop_expired(group)
+        if not group:
+            return
+
+        batch_messages = [item.messages for item in group]
+        futures = [item.future for item in group]
+        stopped = [False] * len(group)
+
+        def should_stop():
+            now = time.monotonic()
+            for index, future in enumerate(futures):
+                stopped[index] = stopped[index] or future.expired(now)
+            return list(stopped)
+
+        wait_started = time.monotonic()
+        for item in group:
+            metrics.QUEUE_WAIT_SECONDS.observe(wait_started - item.enqueued)
+        try:
+            with self.lock:
+                started = time.monotonic()
+                metrics.LOCK_WAIT_SECONDS.observe(started - wait_started)
+                results = self.infer_fn(batch_messages, should_stop=should_stop, **group[0].params)
+        except Exception as e:
+            logger.error(f"批量推理失败 (batch_size={len(group)}): {e}")
+            for item in group:
+                item.future.set_exception(e)
+            return
+        elapsed = time.monotonic() - started
+        self._avg_batch_seconds = 0.8 * self._avg_batch_seconds + 0.2 * elapsed
+
+        logger.debug(f"批量推理完成 - batch_size={len(group)}, {elapsed:.3f}s")
+        for item, result, was_stopped in zip(group, results, stopped):
+            if was_stopped:
+                # 解码被提前终止的行结果不完整，不返回给调用方
+                self.dropped += 1
+                item.future.set_exception(DeadlineExceededError("请求在推理过程中超时或已被放弃"))
+            else:
+                item.future.set_result(result)
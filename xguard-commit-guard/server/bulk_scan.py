@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+"""
+XGuard仓库批量扫描工具 - 启用提交拦截前审计已有仓库：git log中的全部提交信息与HEAD中的全部文件
+
+对象直接从git对象库流式读取（git log / git ls-tree / git cat-file --batch），
+跳过二进制、第三方目录与超大文件，文件按blob SHA去重。读取线程经有界队列把对象交给推理线程，
+推理线程凑满max_batch_size个窗口后调用与服务相同的批量推理入口。
+结果逐批写入SQLite报告，报告同时作为断点：中断后以相同参数重新运行，已扫描的对象直接跳过。
+
+用法:
+    python bulk_scan.py /path/to/repo --report audit.db
+    python bulk_scan.py /path/to/repo --report audit.db --all --jsonl findings.jsonl
+    python bulk_scan.py /path/to/repo --report audit.db --no-history --exclude 'docs/*'
+
+退出码：0 未发现风险，1 报告中存在被拦截的对象，2 参数或报告错误，130 被中断（可重新运行续扫）。
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import sqlite3
+import fnmatch
+import logging
+import argparse
+import threading
+import subprocess
+
+import xguard_service as service
+from chunking import split_windows
+from thresholds import high_risk_categories
+
+# 路径中包含这些目录时视为第三方或生成代码
+VENDORED_DIRS = frozenset((
+    'node_modules', 'bower_components', 'vendor', 'third_party', 'third-party', 'site-packages',
+    '.venv', 'venv', 'dist', 'build', '__pycache__', '.yarn',
+))
+VENDORED_SUFFIXES = (
+    '.min.js', '.min.css', '.map', '.lock', 'package-lock.json', 'pnpm-lock.yaml', 'go.sum',
+)
+# 不读取内容即可确定为二进制的扩展名；其余文件按内容判断
+BINARY_SUFFIXES = (
+    '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.ico', '.webp', '.pdf', '.zip', '.gz', '.tgz', '.bz2',
+    '.xz', '.7z', '.jar', '.class', '.so', '.dll', '.dylib', '.exe', '.bin', '.o', '.a', '.pyc',
+    '.woff', '.woff2', '.ttf', '.otf', '.mp3', '.mp4', '.mov', '.avi', '.wav', '.safetensors', '.pt',
+)
+# 与git相同：前8000字节中出现NUL即视为二进制
+BINARY_SNIFF_BYTES = 8000
+
+DEFAULT_MAX_BLOB_BYTES = 1024 * 1024
+DEFAULT_QUEUE_SIZE = 256
+PROGRESS_INTERVAL_SECONDS = 10.0
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS objects ('
+    'id TEXT PRIMARY KEY, kind TEXT NOT NULL, ref TEXT, path TEXT, blocked INTEGER NOT NULL, '
+    'safe_score REAL, high_risks TEXT, detector_hits TEXT, decided_by TEXT, scanned_at REAL NOT NULL)',
+)
+
+
+class ScanItem:
+    """待扫描的对象：id为'commit:<sha>'或'blob:<sha>'，ref为所在提交"""
+
+    __slots__ = ('id', 'kind', 'ref', 'path', 'text', 'windows', 'result')
+
+    def __init__(self, id, kind, ref, path, text):
+        self.id = id
+        self.kind = kind
+        self.ref = ref
+        self.path = path
+        self.text = text
+        self.windows = None
+        self.result = None
+
+
+class ScanReport:
+    """
+    SQLite扫描报告：每个已扫描对象一行，被拦截的对象即为发现的问题。
+    meta中记录判定策略指纹，策略变化后继续写入同一报告会混合两种判定，需--restart重新扫描。
+    """
+
+    def __init__(self, path, jsonl_path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+        self._jsonl = open(jsonl_path, 'a', encoding='utf-8') if jsonl_path else None
+
+    def get_meta(self, key):
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+            self._conn.commit()
+
+    def reset(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM objects')
+            self._conn.commit()
+
+    def scanned_ids(self):
+        return {row[0] for row in self._conn.execute('SELECT id FROM objects')}
+
+    def blocked_count(self):
+        return self._conn.execute('SELECT COUNT(*) FROM objects WHERE blocked = 1').fetchone()[0]
+
+    def write(self, items, thresholds):
+        """写入一批结果并提交，作为断点；返回其中被拦截的条数"""
+        rows = []
+        findings = []
+        for item in items:
+            result = item.result
+            risks = high_risk_categories(result.get('risk_scores', {}), thresholds)
+            hits = result.get('detector_hits', [])
+            rows.append((
+                item.id, item.kind, item.ref, item.path, int(bool(risks)), result.get('safe_score'),
+                json.dumps(risks, ensure_ascii=False), json.dumps(hits, ensure_ascii=False),
+                result.get('decided_by', 'model'), time.time()
+            ))
+            if risks:
+                findings.append({
+                    "id": item.id, "kind": item.kind, "ref": item.ref, "path": item.path,
+                    "high_risks": [{"category": category, "score": score} for category, score in risks],
+                    "detector_hits": hits,
+                })
+        with self._lock:
+            self._conn.executemany('INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self._conn.commit()
+            if self._jsonl is not None and findings:
+                self._jsonl.write(''.join(json.dumps(finding, ensure_ascii=False) + '\n' for finding in findings))
+                self._jsonl.flush()
+        return len(findings)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+            if self._jsonl is not None:
+                self._jsonl.close()
+
+
+class GitObjects:
+    """从git对象库流式读取提交信息与文件内容"""
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    def _popen(self, *args, stdin=None):
+        return subprocess.Popen(['git', '-C', self.repo, *args], stdin=stdin, stdout=subprocess.PIPE)
+
+    def resolve(self, rev):
+        return subprocess.check_output(['git', '-C', self.repo, 'rev-parse', '--verify', f'{rev}^{{commit}}'],
+                                       text=True).strip()
+
+    def commits(self, rev, all_refs=False):
+        """产出(提交SHA, 提交信息)"""
+        process = self._popen('log', '-z', '--format=%H%n%B', *(['--all'] if all_refs else [rev]))
+        try:
+            pending = b''
+            for chunk in iter(lambda: process.stdout.read(65536), b''):
+                records = (pending + chunk).split(b'\0')
+                pending = records.pop()
+                for record in records:
+                    sha, _, message = record.partition(b'\n')
+                    yield sha.decode('ascii'), message.decode('utf-8', 'replace')
+            if pending:
+                sha, _, message = pending.partition(b'\n')
+                yield sha.decode('ascii'), message.decode('utf-8', 'replace')
+        finally:
+            process.stdout.close()
+            process.wait()
+
+    def tree(self, rev):
+        """产出HEAD树中的(blob SHA, 大小, 路径)，子模块与符号链接除外"""
+        process = self._popen('ls-tree', '-r', '-z', '--long', '--full-tree', rev)
+        try:
+            for entry in process.stdout.read().split(b'\0'):
+                if not entry:
+                    continue
+                info, _, path = entry.partition(b'\t')
+                mode, kind, sha, size = info.split()
+                if kind != b'blob' or mode == b'120000':
+                    continue
+                yield sha.decode('ascii'), int(size), path.decode('utf-8', 'surrogateescape')
+        finally:
+            process.stdout.close()
+            process.wait()
+
+    def blob_reader(self):
+        """返回(read(sha) -> bytes, close())，复用同一个git cat-file --batch进程"""
+        process = self._popen('cat-file', '--batch', stdin=subprocess.PIPE)
+
+        def read(sha):
+            process.stdin.write(sha.encode('ascii') + b'\n')
+            process.stdin.flush()
+            header = process.stdout.readline().split()
+            if len(header) < 3 or header[1] != b'blob':
+                raise ValueError(f'无法读取blob {sha}')
+            data = process.stdout.read(int(header[2]) + 1)
+            return data[:-1]
+
+        def close():
+            process.stdin.close()
+            process.stdout.close()
+            process.wait()
+
+        return read, close
+
+
+def is_vendored(path, excludes=()):
+    parts = path.split('/')
+    if VENDORED_DIRS.intersection(parts[:-1]) or path.endswith(VENDORED_SUFFIXES):
+        return True
+    return any(fnmatch.fnmatchcase(path, pattern) for pattern in excludes)
+
+
+def decode_text(data):
+    """文本文件解码为str，二进制（含NUL或非UTF-8）返回None"""
+    if b'\0' in data[:BINARY_SNIFF_BYTES]:
+        return None
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+
+class BulkScanner:
+    """
+    读取线程：遍历对象、跳过已扫描/重复/二进制/第三方文件，执行确定性检查与分窗口后放入有界队列。
+    推理线程：从队列凑批调用service._infer_with_loaded_model，结果逐批写入报告。
+    推理线程数与worker_processes一致，进程内推理时只用一个线程。
+    """
+
+    def __init__(self, git, report, options):
+        self.git = git
+        self.report = report
+        self.options = options
+        config = service.get_service_config()
+        self.thresholds = config['risk_thresholds']
+        self.batch_size = options.batch_size or config['max_batch_size']
+        self.chunk_max_tokens = config['chunk_max_tokens']
+        self.chunk_overlap_tokens = config['chunk_overlap_tokens']
+        self.queue = queue.Queue(maxsize=options.queue_size)
+        self.stop = threading.Event()
+        self.error = None
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "commits": 0, "blobs": 0, "resumed": 0, "duplicates": 0, "skipped_binary": 0,
+            "skipped_vendored": 0, "skipped_large": 0, "scanned": 0, "model_scanned": 0,
+            "blocked": 0, "input_tokens": 0, "generated_tokens": 0,
+        }
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for key, delta in deltas.items():
+                self.stats[key] += delta
+
+    def _put(self, item):
+        """
+        放入队列，停止时放弃；确定性检查已有结论的对象不分窗口。
+        提交信息的skip_patterns/min_length预筛会把约定式提交信息直接判为安全，审计时默认只运行敏感信息检测器
+        """
+        if item.text.strip():
+            result, hits = service.run_prechecks(item.text, prefilter=self.options.prefilter)
+        else:
+            result, hits = service.empty_message_result(), []
+        if result is not None:
+            result.setdefault('decided_by', 'prefilter')
+            item.result = result
+        else:
+            item.result = {'detector_hits': [hit.to_dict() for hit in hits]} if hits else {}
+            item.windows = split_windows(service._tokenizer, item.text, self.chunk_max_tokens, self.chunk_overlap_tokens)
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(self):
+        options = self.options
+        done = self.report.scanned_ids()
+        seen = set()
+        try:
+            head = self.git.resolve(options.rev)
+            if options.history:
+                for sha, message in self.git.commits(options.rev, options.all):
+                    if self.stop.is_set():
+                        return
+                    self._count(commits=1)
+                    item_id = f'commit:{sha}'
+                    if item_id in done:
+                        self._count(resumed=1)
+                    elif not self._put(ScanItem(item_id, 'commit', sha, None, message.strip())):
+                        return
+            if options.tree:
+                read, close = self.git.blob_reader()
+                try:
+                    for sha, size, path in self.git.tree(head):
+                        if self.stop.is_set():
+                            return
+                        self._count(blobs=1)
+                        item_id = f'blob:{sha}'
+                        if item_id in seen:
+                            self._count(duplicates=1)
+                        elif item_id in done:
+                            seen.add(item_id)
+                            self._count(resumed=1)
+                        elif is_vendored(path, options.exclude):
+                            self._count(skipped_vendored=1)
+                        elif path.lower().endswith(BINARY_SUFFIXES):
+                            self._count(skipped_binary=1)
+                        elif size > options.max_blob_bytes:
+                            self._count(skipped_large=1)
+                        else:
+                            seen.add(item_id)
+                            text = decode_text(read(sha))
+                            if text is None:
+                                self._count(skipped_binary=1)
+                            elif not self._put(ScanItem(item_id, 'blob', head, path, text)):
+                                return
+                finally:
+                    close()
+        except Exception as e:
+            self.error = e
+            self.stop.set()
+
+    def _next_batch(self, producer):
+        """取出若干对象，累计窗口数达到batch_size或队列暂时为空时返回"""
+        items = []
+        windows = 0
+        while windows < self.batch_size and not self.stop.is_set():
+            try:
+                item = self.queue.get(timeout=0.05 if items else 0.5)
+            except queue.Empty:
+                if items or not producer.is_alive():
+                    break
+                continue
+            items.append(item)
+            windows += len(item.windows or ())
+        return items
+
+    def _infer(self, items):
+        """对需要模型判定的对象分批推理，窗口结果按对象聚合"""
+        jobs = [(item, window) for item in items if item.windows for window in item.windows]
+        results = []
+        for offset in range(0, len(jobs), self.batch_size):
+            batch = jobs[offset:offset + self.batch_size]
+            stats = {}
+            messages = [[{"role": "user", "content": window.text}] for _, window in batch]
+            if service._worker_pool is None:
+                with service.model_lock:
+                    results.extend(service._infer_with_loaded_model(
+                        messages, stats=stats, max_new_tokens=service.SCORE_ONLY_MAX_NEW_TOKENS, reason_first=False))
+            else:
+                results.extend(service._infer_with_loaded_model(
+                    messages, stats=stats, max_new_tokens=service.SCORE_ONLY_MAX_NEW_TOKENS, reason_first=False))
+            self._count(input_tokens=sum(stats.get('input_tokens', ())),
+                        generated_tokens=sum(stats.get('generated_tokens', ())))
+
+        position = 0
+        for item in items:
+            if not item.windows:
+                continue
+            count = len(item.windows)
+            hits = item.result.get('detector_hits')
+            item.result = service.build_result(item.windows, results[position:position + count], score_only=True)
+            if hits:
+                item.result['detector_hits'] = hits
+            position += count
+
+    def consume(self, producer):
+        try:
+            while not self.stop.is_set():
+                items = self._next_batch(producer)
+                if not items:
+                    if not producer.is_alive() and self.queue.empty():
+                        return
+                    continue
+                self._infer(items)
+                blocked = self.report.write(items, self.thresholds)
+                self._count(scanned=len(items), model_scanned=sum(1 for item in items if item.windows),
+                            blocked=blocked)
+        except Exception as e:
+            self.error = e
+            self.stop.set()
+
+    def run(self, consumers=1, progress=None):
+        producer = threading.Thread(target=self.produce, name='xguard-scan-reader', daemon=True)
+        workers = [
+            threading.Thread(target=self.consume, args=(producer,), name=f'xguard-scan-infer-{i}', daemon=True)
+            for i in range(consumers)
+        ]
+        producer.start()
+        for worker in workers:
+            worker.start()
+        try:
+            while any(worker.is_alive() for worker in workers):
+                for worker in workers:
+                    worker.join(timeout=PROGRESS_INTERVAL_SECONDS / max(1, len(workers)))
+                if progress is not None and any(worker.is_alive() for worker in workers):
+                    progress()
+        except KeyboardInterrupt:
+            # 已写入报告的批次即为断点，正在推理的批次重新运行时会再次扫描
+            self.stop.set()
+            for worker in workers:
+                worker.join()
+            raise
+        finally:
+            self.stop.set()
+            producer.join(timeout=5)
+        if self.error is not None:
+            raise self.error
+
+
+def throughput(stats, elapsed):
+    """对象/秒与token/秒（输入与生成token之和，只计模型推理）"""
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "objects_per_second": round(stats['scanned'] / elapsed, 3) if elapsed > 0 else None,
+        "tokens_per_second": round((stats['input_tokens'] + stats['generated_tokens']) / elapsed, 3)
+        if elapsed > 0 else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='XGuard仓库批量扫描工具')
+    parser.add_argument('repo', nargs='?', default='.', help='git仓库路径')
+    parser.add_argument('--report', required=True, help='SQLite报告（兼作断点）路径')
+    parser.add_argument('--jsonl', help='另将发现的问题逐条追加到JSONL文件')
+    parser.add_argument('--rev', default='HEAD', help='扫描的提交，默认HEAD')
+    parser.add_argument('--all', action='store_true', help='提交信息扫描所有引用而不只是--rev的历史')
+    parser.add_argument('--no-history', dest='history', action='store_false', help='不扫描提交信息')
+    parser.add_argument('--no-tree', dest='tree', action='store_false', help='不扫描--rev中的文件')
+    parser.add_argument('--exclude', action='append', default=[], help='额外跳过的路径glob，可多次指定')
+    parser.add_argument('--max-blob-bytes', type=int, default=DEFAULT_MAX_BLOB_BYTES, help='跳过超过该大小的文件')
+    parser.add_argument('--batch-size', type=int, default=0, help='每批推理的窗口数，默认取max_batch_size')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help='读取线程与推理线程之间的队列长度')
+    parser.add_argument('--prefilter', action='store_true',
+                        help='对提交信息与文件同样应用min_length/skip_patterns预筛（默认全部交给模型检测）')
+    parser.add_argument('--restart', action='store_true', help='清空报告重新扫描')
+    parser.add_argument('--verbose', action='store_true', help='输出每条检测的日志')
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.getLogger('xguard_service').setLevel(logging.WARNING)
+
+    git = GitObjects(os.path.abspath(args.repo))
+    try:
+        git.resolve(args.rev)
+    except (OSError, subprocess.CalledProcessError):
+        print(f"❌ 无法解析 {args.repo} 中的 {args.rev}", file=sys.stderr)
+        return 2
+
+    service.load_model()
+    report = ScanReport(args.report, args.jsonl)
+    # 是否预筛改变检测结论，与判定配置一样需要与报告一致
+    policy = service.verdict_policy() + ('|prefilter' if args.prefilter else '')
+    if args.restart:
+        report.reset()
+    elif report.get_meta('policy') not in (None, policy):
+        print("❌ 报告由不同的模型或判定配置生成，使用--restart重新扫描", file=sys.stderr)
+        report.close()
+        return 2
+    report.set_meta('policy', policy)
+    report.set_meta('repo', git.repo)
+
+    scanner = BulkScanner(git, report, args)
+    started = time.perf_counter()
+
+    def progress():
+        stats = dict(scanner.stats)
+        rate = throughput(stats, time.perf_counter() - started)
+        print(f"已扫描 {stats['scanned']}（续扫跳过 {stats['resumed']}），发现 {stats['blocked']}，"
+              f"{rate['objects_per_second']} 对象/秒，{rate['tokens_per_second']} token/秒，"
+              f"队列 {scanner.queue.qsize()}", file=sys.stderr)
+
+    interrupted = False
+    try:
+        scanner.run(consumers=max(1, service.get_service_config()['worker_processes']), progress=progress)
+    except KeyboardInterrupt:
+        interrupted = True
+    summary = dict(scanner.stats, **throughput(scanner.stats, time.perf_counter() - started))
+    summary['total_blocked'] = report.blocked_count()
+    report.close()
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if interrupted:
+        print(f"⚠️  扫描已中断，以相同参数重新运行即可从 {args.report} 续扫", file=sys.stderr)
+        return 130
+    return 1 if summary['total_blocked'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
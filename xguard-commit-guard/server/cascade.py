@@ -0,0 +1,62 @@
+"""
+XGuard两级级联 - 小模型先判定，风险分落在阈值附近不确定区间内的输入才交给完整模型
+"""
+
+from thresholds import threshold_for, high_risk_categories
+
+SAFE = 'safe'
+RISKY = 'risky'
+UNCERTAIN = 'uncertain'
+
+
+def first_tier_decision(risk_scores, thresholds, band):
+    """
+    按第一级模型的分数判定：任一风险类别超过阈值+band为risky；
+    否则任一类别落在[阈值-band, 阈值+band]内为uncertain，需交给完整模型；其余为safe。
+    第一级没有解析出任何标签时同样交给完整模型
+    """
+    if not risk_scores:
+        return UNCERTAIN
+    uncertain = False
+    for category, score in risk_scores.items():
+        if 'safe' in category.lower():
+            continue
+        threshold = threshold_for(category, thresholds)
+        if score > threshold + band:
+            return RISKY
+        if score >= threshold - band:
+            uncertain = True
+    return UNCERTAIN if uncertain else SAFE
+
+
+def evaluate_band(first_scores, full_scores, thresholds, band):
+    """
+    离线评估某个band：升级率，以及级联最终的拦截结论与完整模型的一致率。
+    first_scores/full_scores为同一批输入在两级模型上的risk_scores列表
+    """
+    escalated = 0
+    agree = 0
+    missed = 0
+    extra = 0
+    for first, full in zip(first_scores, full_scores):
+        decision = first_tier_decision(first, thresholds, band)
+        full_blocked = bool(high_risk_categories(full, thresholds))
+        if decision == UNCERTAIN:
+            escalated += 1
+            blocked = full_blocked
+        else:
+            blocked = decision == RISKY
+        if blocked == full_blocked:
+            agree += 1
+        elif full_blocked:
+            missed += 1
+        else:
+            extra += 1
+    total = len(full_scores) or 1
+    return {
+        "band": band,
+        "escalation_rate": round(escalated / total, 4),
+        "agreement": round(agree / total, 4),
+        "missed_blocks": missed,
+        "extra_blocks": extra,
+    }
@@ -0,0 +1,97 @@
+"""
+XGuard长文本分块 - 按token预算切分为有重叠的窗口，批量检测后按类别聚合
+"""
+
+
+class TextWindow:
+    """一个检测窗口：text为原文片段，byte_range为其在原文UTF-8编码中的字节区间"""
+
+    __slots__ = ('text', 'char_range', 'byte_range')
+
+    def __init__(self, text, char_range, byte_range):
+        self.text = text
+        self.char_range = char_range
+        self.byte_range = byte_range
+
+
+def _byte_offsets(text):
+    """字符下标 → UTF-8字节偏移，长度为len(text)+1"""
+    offsets = [0] * (len(text) + 1)
+    total = 0
+    for i, ch in enumerate(text):
+        offsets[i] = total
+        total += len(ch.encode('utf-8'))
+    offsets[len(text)] = total
+    return offsets
+
+
+def split_windows(tokenizer, text, max_tokens, overlap_tokens=0):
+    """
+    按token预算切分文本，相邻窗口重叠overlap_tokens个token，避免密钥恰好被切断。
+    token数不超过max_tokens时返回单个窗口。
+    """
+    # 一个token至少对应一个字符，字符数不超过预算时无需分词即可判定
+    if len(text) <= max_tokens:
+        return [TextWindow(text, (0, len(text)), (0, len(text.encode('utf-8'))))]
+
+    encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+    offsets = encoding['offset_mapping']
+    bytes_at = _byte_offsets(text)
+    if len(offsets) <= max_tokens:
+        return [TextWindow(text, (0, len(text)), (0, bytes_at[-1]))]
+
+    stride = max(1, max_tokens - max(0, overlap_tokens))
+    windows = []
+    start = 0
+    while start < len(offsets):
+        end = min(start + max_tokens, len(offsets))
+        char_start = offsets[start][0]
+        char_end = offsets[end - 1][1]
+        windows.append(TextWindow(
+            text[char_start:char_end],
+            (char_start, char_end),
+            (bytes_at[char_start], bytes_at[char_end])
+        ))
+        if end == len(offsets):
+            break
+        start += stride
+    return windows
+
+
+def aggregate_windows(windows, results, mode='max', top_k=2):
+    """
+    按类别聚合各窗口的risk_scores
+    - 风险类别: mode='max'取最高分，mode='topk'取最高top_k个窗口的平均分
+    - Safe-Safe: 取所有窗口中的最小值（整体安全性由最危险的窗口决定）
+    返回(risk_scores, 每个类别得分来源的字节区间, 风险最高的窗口下标)
+    """
+    per_category = {}
+    safe_scores = []
+    for index, result in enumerate(results):
+        risk_scores = result.get('risk_score', {})
+        safe_scores.append(risk_scores.get('Safe-Safe', 0))
+        for category, score in risk_scores.items():
+            if category != 'Safe-Safe':
+                per_category.setdefault(category, []).append((score, index))
+
+    risk_scores = {}
+    sources = {}
+    for category, scored in per_category.items():
+        scored.sort(key=lambda entry: entry[0], reverse=True)
+        used = scored[:1] if mode == 'max' else scored[:max(1, top_k)]
+        risk_scores[category] = round(sum(score for score, _ in used) / len(used), 4)
+        sources[category] = [
+            {"byte_range": list(windows[index].byte_range), "score": score}
+            for score, index in used
+        ]
+
+    safe_score = min(safe_scores) if safe_scores else 0
+    if safe_score > 0:
+        risk_scores['Safe-Safe'] = safe_score
+        sources['Safe-Safe'] = [
+            {"byte_range": list(windows[index].byte_range), "score": score}
+            for index, score in enumerate(safe_scores) if score == safe_score
+        ][:1]
+
+    riskiest = min(range(len(safe_scores)), key=lambda index: safe_scores[index]) if safe_scores else 0
+    return risk_scores, sources, riskiest
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+XGuard精度模式对比工具 - 用同一份带标注的语料分别在两种精度模式下推理，
+报告速度/内存差异、各类别risk_score漂移以及按risk_thresholds判定的结论翻转
+
+语料为JSONL，每行: {"id": "...", "message": "...", "label": "Safe-Safe或风险类别（可选）"}
+
+用法:
+    python compare_precision.py corpus.jsonl --candidate int8-dynamic
+    python compare_precision.py corpus.jsonl --baseline auto --candidate bf16 --output report.json
+"""
+
+import gc
+import os
+import sys
+import json
+import time
+import argparse
+
+import xguard_service as service
+from precision import PRECISION_MODES, load_causal_lm, model_memory_bytes
+from thresholds import high_risk_categories
+
+
+def load_corpus(path):
+    items = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            item.setdefault('id', str(line_no))
+            items.append(item)
+    return items
+
+
+def _current_rss():
+    """当前进程常驻内存（字节），无法获取时返回None"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def run_mode(precision, tokenizer, items, batch_size, max_new_tokens):
+    """加载指定精度的模型并推理全部语料，返回(各条目risk_scores, 性能统计)"""
+    from inference import infer_batch
+
+    gc.collect()
+    rss_before = _current_rss()
+    started = time.perf_counter()
+    model = load_causal_lm(service.get_service_config()['model_path'], precision)
+    load_seconds = time.perf_counter() - started
+    rss_after = _current_rss()
+
+    # 预热一次，避免首批的算子初始化计入延迟
+    infer_batch(model, tokenizer, [[{"role": "user", "content": "XGuard warm-up"}]], max_new_tokens=1)
+
+    scores = []
+    batch_seconds = []
+    started = time.perf_counter()
+    for offset in range(0, len(items), batch_size):
+        batch = items[offset:offset + batch_size]
+        batch_started = time.perf_counter()
+        results = infer_batch(
+            model, tokenizer,
+            [[{"role": "user", "content": item['message']}] for item in batch],
+            max_new_tokens=max_new_tokens,
+            reason_first=False
+        )
+        batch_seconds.append(time.perf_counter() - batch_started)
+        scores.extend(result['risk_score'] for result in results)
+    total_seconds = time.perf_counter() - started
+
+    stats = {
+        "precision": precision,
+        "load_seconds": round(load_seconds, 3),
+        "model_bytes": model_memory_bytes(model),
+        "rss_delta_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+        "items_per_second": round(len(items) / total_seconds, 3) if total_seconds > 0 else None,
+        "mean_item_ms": round(total_seconds / max(1, len(items)) * 1000, 2),
+        "p50_batch_ms": round(_percentile(batch_seconds, 0.5) * 1000, 2),
+        "p95_batch_ms": round(_percentile(batch_seconds, 0.95) * 1000, 2),
+    }
+    del model
+    gc.collect()
+    return scores, stats
+
+
+def _is_risky_label(label):
+    return label is not None and 'safe' not in label.lower()
+
+
+def label_accuracy(items, verdicts):
+    """带标注条目上的判定准确率：风险/安全二分类，以及标注类别是否被判为高风险"""
+    labelled = [(item['label'], verdict) for item, verdict in zip(items, verdicts) if item.get('label')]
+    if not labelled:
+        return None
+    correct = sum(1 for label, verdict in labelled if _is_risky_label(label) == bool(verdict))
+    risky = [(label, verdict) for label, verdict in labelled if _is_risky_label(label)]
+    category_hits = sum(1 for label, verdict in risky if label in {category for category, _ in verdict})
+    return {
+        "labelled": len(labelled),
+        "accuracy": round(correct / len(labelled), 4),
+        "category_recall": round(category_hits / len(risky), 4) if risky else None,
+    }
+
+
+def compare(items, baseline_scores, candidate_scores, thresholds):
+    """各类别risk_score漂移（candidate - baseline）与按阈值判定的翻转"""
+    categories = sorted({category for scores in baseline_scores + candidate_scores for category in scores})
+    drift = {}
+    for category in categories:
+        deltas = [
+            candidate.get(category, 0.0) - baseline.get(category, 0.0)
+            for baseline, candidate in zip(baseline_scores, candidate_scores)
+        ]
+        drift[category] = {
+            "mean_abs": round(sum(abs(delta) for delta in deltas) / len(deltas), 4),
+            "max_abs": round(max(abs(delta) for delta in deltas), 4),
+            "mean_signed": round(sum(deltas) / len(deltas), 4),
+        }
+
+    baseline_verdicts = [high_risk_categories(scores, thresholds) for scores in baseline_scores]
+    candidate_verdicts = [high_risk_categories(scores, thresholds) for scores in candidate_scores]
+    flips = []
+    flips_by_category = {}
+    for item, before, after in zip(items, baseline_verdicts, candidate_verdicts):
+        before_set = {category for category, _ in before}
+        after_set = {category for category, _ in after}
+        if before_set == after_set:
+            continue
+        for category in after_set - before_set:
+            flips_by_category.setdefault(category, {"to_risky": 0, "to_safe": 0})["to_risky"] += 1
+        for category in before_set - after_set:
+            flips_by_category.setdefault(category, {"to_risky": 0, "to_safe": 0})["to_safe"] += 1
+        flips.append({
+            "id": item['id'],
+            "label": item.get('label'),
+            "baseline": sorted(before_set),
+            "candidate": sorted(after_set),
+            "blocked_changed": bool(before_set) != bool(after_set),
+        })
+
+    return {
+        "drift": drift,
+        "verdict_flips": len(flips),
+        "blocking_flips": sum(1 for flip in flips if flip['blocked_changed']),
+        "flips_by_category": flips_by_category,
+        "flipped_items": flips,
+        "accuracy": {
+            "baseline": label_accuracy(items, baseline_verdicts),
+            "candidate": label_accuracy(items, candidate_verdicts),
+        },
+    }
+
+
+def print_report(report):
+    baseline, candidate = report['baseline'], report['candidate']
+    print(f"\n语料条目: {report['items']}")
+    print(f"{'':<20}{baseline['precision']:>16}{candidate['precision']:>16}")
+    for key in ('load_seconds', 'model_bytes', 'rss_delta_bytes', 'items_per_second', 'mean_item_ms', 'p50_batch_ms', 'p95_batch_ms'):
+        print(f"{key:<20}{str(baseline[key]):>16}{str(candidate[key]):>16}")
+
+    comparison = report['comparison']
+    print("\n各类别risk_score漂移 (candidate - baseline):")
+    for category, drift in comparison['drift'].items():
+        print(f"  {category:<50} mean_abs={drift['mean_abs']:<8} max_abs={drift['max_abs']:<8} mean={drift['mean_signed']}")
+
+    print(f"\n判定翻转: {comparison['verdict_flips']} 条（其中拦截结论改变 {comparison['blocking_flips']} 条）")
+    for category, counts in comparison['flips_by_category'].items():
+        print(f"  {category:<50} 新增高风险={counts['to_risky']} 不再高风险={counts['to_safe']}")
+
+    for mode in ('baseline', 'candidate'):
+        accuracy = comparison['accuracy'][mode]
+        if accuracy:
+            print(f"{mode} 标注准确率: {accuracy['accuracy']:.2%} "
+                  f"(类别召回: {accuracy['category_recall']}, 标注条目: {accuracy['labelled']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='XGuard精度模式对比工具')
+    parser.add_argument('corpus', help='带标注的JSONL语料')
+    parser.add_argument('--baseline', default='auto', choices=PRECISION_MODES, help='基准精度模式')
+    parser.add_argument('--candidate', required=True, choices=PRECISION_MODES, help='待评估的精度模式')
+    parser.add_argument('--batch-size', type=int, default=8, help='每批推理条数')
+    parser.add_argument('--max-new-tokens', type=int, default=service.SCORE_ONLY_MAX_NEW_TOKENS,
+                        help='生成token数，默认只取风险判定')
+    parser.add_argument('--output', help='将完整报告写入JSON文件')
+    args = parser.parse_args()
+
+    from modelscope import AutoTokenizer
+
+    items = load_corpus(args.corpus)
+    if not items:
+        print("❌ 语料为空")
+        return False
+    config = service.get_service_config()
+    tokenizer = AutoTokenizer.from_pretrained(config['tokenizer_path'])
+
+    print(f"🔍 基准模式 {args.baseline} 推理中...")
+    baseline_scores, baseline_stats = run_mode(args.baseline, tokenizer, items, args.batch_size, args.max_new_tokens)
+    print(f"🔍 候选模式 {args.candidate} 推理中...")
+    candidate_scores, candidate_stats = run_mode(args.candidate, tokenizer, items, args.batch_size, args.max_new_tokens)
+
+    report = {
+        "items": len(items),
+        "risk_thresholds": dict(config['risk_thresholds']),
+        "baseline": baseline_stats,
+        "candidate": candidate_stats,
+        "comparison": compare(items, baseline_scores, candidate_scores, config['risk_thresholds']),
+    }
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n📄 完整报告已写入 {args.output}")
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
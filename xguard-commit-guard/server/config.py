@@ -1,60 +1,353 @@
 """
 XGuard服务配置模块
+
+配置来源按优先级：内置默认值 < .xguard-config.json < XGUARD_*环境变量。
+ConfigStore只在首次使用时查找一次配置文件，之后对外提供不可变的配置快照；
+文件的mtime或大小变化时才重新读取，阈值、skip_patterns等按请求读取的配置即时生效，
+模型、进程池等启动时使用的配置需重启服务。
 """
 
 import os
 import json
+import time
+import hashlib
+import logging
+import threading
+from types import MappingProxyType
+from collections.abc import Mapping
+
+from thresholds import DEFAULT_RISK_THRESHOLDS
+
+logger = logging.getLogger(__name__)
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SERVER_DIR)
+
+CONFIG_FILE_NAME = '.xguard-config.json'
+
+# model_artifacts.py prepare的默认输出目录与其中的清单文件名；
+# 未配置model_path/tokenizer_path且该目录有清单时优先使用，否则使用local_model/local_tokenizer
+PREPARED_MODEL_DIR = os.path.join(PROJECT_ROOT, 'prepared_model')
+MANIFEST_NAME = 'xguard-manifest.json'
+
+# 两次检查配置文件mtime/大小的最小间隔（秒）
+CHECK_INTERVAL_SECONDS = 1.0
+
+DEFAULTS = {
+    'model_path': None,
+    'tokenizer_path': None,
+    'max_batch_size': 8,
+    'batch_window_ms': 10,
+    'score_only': False,
+    'cache_enabled': True,
+    'cache_max_entries': 4096,
+    'cache_db_path': None,
+    'prefilter_enabled': True,
+    'skip_patterns': ["^fix", "^feat", "^docs", "^chore", "^refactor", "^style", "^test"],
+    'min_length': 10,
+    'secret_detector_enabled': True,
+    'secret_detector_confidence': 0.9,
+    'secret_detector_pass_to_model': True,
+    'chunk_max_tokens': 1024,
+    'chunk_overlap_tokens': 64,
+    'chunk_aggregation': 'max',
+    'chunk_top_k': 2,
+    'prefix_cache_enabled': True,
+    'timeout_seconds': 10,
+    'max_queue_depth': 64,
+    'server_mode': 'flask',
+    'unix_socket': None,
+    'worker_processes': 0,
+    'worker_threads': 0,
+    'preload_model': True,
+    'warmup_enabled': True,
+    'precision': 'auto',
+    'model_verify': 'fast',
+    'inference_backend': 'eager',
+    'onnx_cache_dir': None,
+    'cascade_enabled': False,
+    'cascade_model_path': None,
+    'cascade_tokenizer_path': None,
+    'cascade_uncertainty_band': 0.15,
+    'audit_log_enabled': True,
+    'audit_log_dir': None,
+    'audit_log_max_mb': 64,
+    'audit_log_rotate_hours': 24,
+    'audit_log_keep_files': 30,
+    'router_backends': [],
+    'router_health_interval': 1.0,
+    'router_slow_ms': 500,
+    'router_max_inflight': 32,
+    'router_upstream_timeout': 30,
+    'risk_thresholds': DEFAULT_RISK_THRESHOLDS,
+}
+
+# 环境变量优先级最高，覆盖配置文件
+ENV_OVERRIDES = {
+    'model_path': 'XGUARD_MODEL_PATH',
+    'tokenizer_path': 'XGUARD_TOKENIZER_PATH',
+    'max_batch_size': 'XGUARD_MAX_BATCH_SIZE',
+    'batch_window_ms': 'XGUARD_BATCH_WINDOW_MS',
+    'score_only': 'XGUARD_SCORE_ONLY',
+    'cache_enabled': 'XGUARD_CACHE_ENABLED',
+    'cache_max_entries': 'XGUARD_CACHE_MAX_ENTRIES',
+    'cache_db_path': 'XGUARD_CACHE_DB_PATH',
+    'prefilter_enabled': 'XGUARD_PREFILTER_ENABLED',
+    'secret_detector_enabled': 'XGUARD_SECRET_DETECTOR_ENABLED',
+    'secret_detector_pass_to_model': 'XGUARD_SECRET_DETECTOR_PASS_TO_MODEL',
+    'prefix_cache_enabled': 'XGUARD_PREFIX_CACHE_ENABLED',
+    'timeout_seconds': 'XGUARD_TIMEOUT_SECONDS',
+    'max_queue_depth': 'XGUARD_MAX_QUEUE_DEPTH',
+    'server_mode': 'XGUARD_SERVER_MODE',
+    'unix_socket': 'XGUARD_UNIX_SOCKET',
+    'worker_processes': 'XGUARD_WORKER_PROCESSES',
+    'worker_threads': 'XGUARD_WORKER_THREADS',
+    'preload_model': 'XGUARD_PRELOAD_MODEL',
+    'warmup_enabled': 'XGUARD_WARMUP_ENABLED',
+    'precision': 'XGUARD_PRECISION',
+    'model_verify': 'XGUARD_MODEL_VERIFY',
+    'inference_backend': 'XGUARD_INFERENCE_BACKEND',
+    'onnx_cache_dir': 'XGUARD_ONNX_CACHE_DIR',
+    'cascade_enabled': 'XGUARD_CASCADE_ENABLED',
+    'cascade_model_path': 'XGUARD_CASCADE_MODEL_PATH',
+    'cascade_tokenizer_path': 'XGUARD_CASCADE_TOKENIZER_PATH',
+    'cascade_uncertainty_band': 'XGUARD_CASCADE_UNCERTAINTY_BAND',
+    'audit_log_enabled': 'XGUARD_AUDIT_LOG_ENABLED',
+    'audit_log_dir': 'XGUARD_AUDIT_LOG_DIR',
+    'router_backends': 'XGUARD_ROUTER_BACKENDS',
+    'router_slow_ms': 'XGUARD_ROUTER_SLOW_MS',
+    'router_max_inflight': 'XGUARD_ROUTER_MAX_INFLIGHT',
+}
+
+_BOOL_KEYS = ('score_only', 'cache_enabled', 'prefilter_enabled', 'secret_detector_enabled',
+              'secret_detector_pass_to_model', 'prefix_cache_enabled', 'preload_model', 'warmup_enabled',
+              'cascade_enabled', 'audit_log_enabled')
+_INT_KEYS = ('max_batch_size', 'cache_max_entries', 'min_length', 'chunk_max_tokens', 'chunk_overlap_tokens',
+             'chunk_top_k', 'max_queue_depth', 'worker_processes', 'worker_threads', 'audit_log_keep_files',
+             'router_max_inflight')
+_FLOAT_KEYS = ('batch_window_ms', 'secret_detector_confidence', 'timeout_seconds', 'cascade_uncertainty_band',
+               'audit_log_max_mb', 'audit_log_rotate_hours', 'router_health_interval', 'router_slow_ms',
+               'router_upstream_timeout')
+
+# 只在模型加载或调度器创建时读取，修改后需重启服务
+RESTART_KEYS = ('model_path', 'tokenizer_path', 'precision', 'model_verify', 'inference_backend', 'onnx_cache_dir',
+                'server_mode', 'unix_socket', 'worker_processes', 'worker_threads',
+                'max_batch_size', 'batch_window_ms', 'max_queue_depth', 'cache_enabled', 'cache_max_entries',
+                'cache_db_path', 'preload_model', 'warmup_enabled', 'cascade_enabled', 'cascade_model_path',
+                'cascade_tokenizer_path', 'audit_log_dir', 'audit_log_max_mb', 'audit_log_rotate_hours',
+                'audit_log_keep_files', 'router_backends', 'router_health_interval', 'router_slow_ms',
+                'router_max_inflight', 'router_upstream_timeout')
+
+# GET /config返回给VSCode插件的配置项
+CLIENT_KEYS = ('risk_thresholds', 'timeout_seconds', 'skip_patterns', 'min_length')
+
+# 影响检测结论的配置项，变化后客户端缓存的放行记录随之失效
+VERDICT_KEYS = ('risk_thresholds', 'skip_patterns', 'min_length', 'prefilter_enabled', 'secret_detector_enabled',
+                'secret_detector_confidence', 'secret_detector_pass_to_model', 'chunk_max_tokens',
+                'chunk_overlap_tokens', 'chunk_aggregation', 'chunk_top_k', 'cascade_enabled',
+                'cascade_uncertainty_band')
+
+# 影响模型检测结果本身（检测结果缓存中的值）的可热加载配置项，计入缓存键；
+# 阈值、预筛等在取得检测结果之后才应用，修改它们不必使缓存失效
+RESULT_KEYS = ('chunk_max_tokens', 'chunk_overlap_tokens', 'chunk_aggregation', 'chunk_top_k',
+               'cascade_uncertainty_band')
+
+
+def find_config_file():
+    """按优先级查找配置文件：当前工作目录 → server目录 → 项目根目录"""
+    for directory in (os.getcwd(), SERVER_DIR, PROJECT_ROOT):
+        path = os.path.join(directory, CONFIG_FILE_NAME)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _coerce(key, value):
+    if key in _BOOL_KEYS and isinstance(value, str):
+        return value.lower() == 'true'
+    if key in _INT_KEYS:
+        return int(value)
+    if key in _FLOAT_KEYS:
+        return float(value)
+    return value
+
+
+def build_config(user_config=None, environ=None, overrides=None):
+    """合并默认值、配置文件内容、环境变量与overrides，返回类型规整后的普通dict"""
+    config = {key: dict(value) if isinstance(value, Mapping) else value for key, value in DEFAULTS.items()}
+    for key, value in (user_config or {}).items():
+        if key not in config:
+            continue
+        if isinstance(config[key], dict) and isinstance(value, Mapping):
+            config[key].update(value)
+        else:
+            config[key] = value
+
+    environ = os.environ if environ is None else environ
+    for key, env_name in ENV_OVERRIDES.items():
+        if environ.get(env_name):
+            config[key] = environ[env_name]
+    config.update(overrides or {})
+
+    for key in config:
+        config[key] = _coerce(key, config[key])
+    config['skip_patterns'] = list(config['skip_patterns'] or [])
+    # 环境变量中的后端列表以逗号分隔
+    backends = config['router_backends'] or []
+    if isinstance(backends, str):
+        backends = backends.split(',')
+    config['router_backends'] = [url.strip().rstrip('/') for url in backends if url.strip()]
+    config['risk_thresholds'] = {category: float(value) for category, value in config['risk_thresholds'].items()}
+
+    # 未设置时使用项目根目录下的默认相对路径
+    prepared = os.path.exists(os.path.join(PREPARED_MODEL_DIR, MANIFEST_NAME))
+    if not config['model_path']:
+        config['model_path'] = PREPARED_MODEL_DIR if prepared else os.path.join(PROJECT_ROOT, 'local_model')
+    if not config['tokenizer_path']:
+        config['tokenizer_path'] = PREPARED_MODEL_DIR if prepared else os.path.join(PROJECT_ROOT, 'local_tokenizer')
+    if config['unix_socket']:
+        config['unix_socket'] = os.path.expanduser(config['unix_socket'])
+    config['onnx_cache_dir'] = os.path.expanduser(config['onnx_cache_dir'] or os.path.join('~', '.cache', 'xguard', 'onnx'))
+    config['audit_log_dir'] = os.path.expanduser(config['audit_log_dir'] or os.path.join('~', '.xguard', 'audit'))
+    return config
+
+
+def _digest(value):
+    text = json.dumps(value, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, Mapping):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+class ConfigSnapshot(Mapping):
+    """
+    某一时刻的配置：只读映射，嵌套的dict/list分别冻结为只读映射/元组。
+    version随每次重新加载递增，etag为插件可见配置的内容哈希，verdict_etag为影响检测结论的配置的哈希，
+    result_etag为影响检测结果本身的配置的哈希。
+    """
+
+    def __init__(self, values, source=None, version=1):
+        self._values = _freeze(dict(values))
+        self.source = source
+        self.version = version
+        self.loaded_at = time.time()
+        self.etag = _digest(self.client_view())
+        self.verdict_etag = _digest({key: _thaw(self._values[key]) for key in VERDICT_KEYS})
+        self.result_etag = _digest({key: _thaw(self._values[key]) for key in RESULT_KEYS})
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def to_dict(self):
+        """可JSON序列化、可pickle的普通dict副本"""
+        return _thaw(self._values)
+
+    def client_view(self):
+        return {key: _thaw(self._values[key]) for key in CLIENT_KEYS}
+
+
+class ConfigStore:
+    """
+    配置快照的持有者，get()线程安全且开销极低：
+    最多每CHECK_INTERVAL_SECONDS检查一次配置文件的mtime与大小，变化时才重新解析。
+    重新加载失败（JSON无效、类型错误）时保留上一份快照。
+    """
+
+    def __init__(self, path=None, overrides=None, check_interval=CHECK_INTERVAL_SECONDS):
+        self._path = path
+        self._find = path is None
+        self._overrides = dict(overrides or {})
+        self._check_interval = check_interval
+        self._lock = threading.Lock()
+        self._signature = None
+        self._next_check = 0.0
+        self._snapshot = None
+        self.reloads = 0
+
+    def _stat(self):
+        """配置文件的(路径, mtime_ns, 大小)，文件不存在时为None"""
+        if self._find and (self._path is None or not os.path.exists(self._path)):
+            self._path = find_config_file()
+        if self._path is None:
+            return None
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            return None
+        return self._path, stat.st_mtime_ns, stat.st_size
+
+    def _read(self, signature):
+        if signature is None:
+            return {}
+        with open(signature[0], 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def get(self):
+        """当前配置快照"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() < self._next_check:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None or time.monotonic() >= self._next_check:
+                self._refresh()
+            return self._snapshot
+
+    def reload(self):
+        """立即检查配置文件，返回是否生成了新快照"""
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self):
+        """调用方需持有self._lock"""
+        self._next_check = time.monotonic() + self._check_interval
+        signature = self._stat()
+        if self._snapshot is not None and signature == self._signature:
+            return False
+
+        previous = self._snapshot
+        try:
+            user_config = self._read(signature)
+            values = build_config(user_config, overrides=self._overrides)
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            if previous is None:
+                # 首次加载：与配置文件不存在时相同，使用默认值与环境变量
+                logger.warning(f"加载配置文件失败: {e}")
+                values = build_config(overrides=self._overrides)
+            else:
+                logger.warning(f"重新加载配置文件失败，继续使用上一份配置: {e}")
+                self._signature = signature
+                return False
 
-class Config:
-    """XGuard服务配置类"""
-    
-    def __init__(self):
-        self.port = int(os.environ.get('PORT', 8765))
-        self.host = os.environ.get('HOST', '127.0.0.1')
-        self.debug = os.environ.get('DEBUG', 'false').lower() == 'true'
-        self.timeout_seconds = 10
-        self.model_path = "Alibaba-AAIG/YuFeng-XGuard-Reason-8B"
-        
-        # 风险阈值配置
-        self.risk_thresholds = {
-            "Data Privacy-Personal Privacy": 0.4,
-            "Cybersecurity-Access Control": 0.3,
-            "Cybersecurity-Hacker Attack": 0.5,
-            "Crimes and Illegal Activities-Dangerous Weapons": 0.6,
-            "Extremism-Violent Terrorist Activities": 0.7
-        }
-        
-        # 跳过检测的模式
-        self.skip_patterns = [
-            "^fix",
-            "^feat", 
-            "^docs",
-            "^chore",
-            "^refactor",
-            "^style",
-            "^test"
-        ]
-        
-        self.min_length = 10
-        self.audit_log_enabled = True
-        
-        # 加载用户配置
-        self.load_user_config()
-    
-    def load_user_config(self):
-        """加载用户自定义配置"""
-        config_path = os.path.join(os.getcwd(), '.xguard-config.json')
-        if os.path.exists(config_path):
-            try:
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    user_config = json.load(f)
-                    for key, value in user_config.items():
-                        if hasattr(self, key):
-                            setattr(self, key, value)
-            except Exception as e:
-                print(f"加载用户配置失败: {e}")
-
-
-
-
-                
\ No newline at end of file
+        self._signature = signature
+        self._snapshot = ConfigSnapshot(
+            values, source=signature[0] if signature else None,
+            version=previous.version + 1 if previous is not None else 1
+        )
+        if previous is not None:
+            self.reloads += 1
+            changed = sorted(key for key in values if previous.get(key) != self._snapshot[key])
+            logger.info(f"配置已重新加载 - {self._snapshot.source or '默认配置'}, 变更: {changed or '无'}")
+            pending = [key for key in changed if key in RESTART_KEYS]
+            if pending:
+                logger.warning(f"以下配置项需重启服务才能生效: {pending}")
+        return True
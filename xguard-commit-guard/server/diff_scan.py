@@ -0,0 +1,182 @@
+"""
+XGuard暂存区diff扫描 - 按hunk提取新增行并哈希，只有未放行过的hunk需要送检
+
+    hunk内被上下文行隔开的新增行各自作为一段，哈希只取决于新增内容，与diff的-U上下文行数无关；
+    修改提交后重新扫描时，未变化的段哈希相同，直接命中本地放行记录。
+
+只依赖标准库且不导入re，供xguard_cli在pre-commit钩子中使用。
+"""
+
+import os
+import hashlib
+
+# 本地放行记录的最大条目数，超过后保留最近的一半
+MAX_CLEARED_ENTRIES = 50000
+
+_POLICY_PREFIX = '# policy '
+
+
+class Hunk:
+    """diff中一段连续的新增行：文件路径、在新文件中的起始行号、新增行文本"""
+
+    __slots__ = ('path', 'line', 'text', 'digest')
+
+    def __init__(self, path, line, text):
+        self.path = path
+        self.line = line
+        self.text = text
+        self.digest = hashlib.sha256(text.encode('utf-8', 'surrogateescape')).hexdigest()[:32]
+
+    def line_of(self, offset):
+        """text内字符偏移对应的新文件行号"""
+        return self.line + self.text.count('\n', 0, offset)
+
+    def __repr__(self):
+        return f'Hunk({self.path}:{self.line}, {self.digest})'
+
+
+def _range(text):
+    """'a,b' 或 'a'（行数省略时为1）"""
+    start, _, count = text.partition(',')
+    return int(start), int(count) if count else 1
+
+
+def _hunk_range(header):
+    """
+    '@@ -a,b +c,d @@ ...' 中的(c, b, d)：新文件起始行号，以及hunk在旧、新文件中各占的行数
+    无法解析时行数为None，hunk延续到下一个hunk或文件头
+    """
+    parts = header.split(' ', 3)
+    try:
+        _, old_count = _range(parts[1][1:])
+        new_start, new_count = _range(parts[2][1:])
+    except (IndexError, ValueError):
+        return 1, None, None
+    return new_start, old_count, new_count
+
+
+def _unquote_path(path):
+    """git对含特殊字符的路径加引号并转义（core.quotePath），这里只去引号，不还原转义"""
+    if len(path) >= 2 and path[0] == path[-1] == '"':
+        return path[1:-1]
+    return path
+
+
+def parse_diff(text):
+    """
+    解析unified diff，返回新增行组成的Hunk列表。
+    删除行、上下文行、二进制文件与只有空白的新增段不返回。
+
+    hunk的结束位置由 '@@' 头中的行数确定：hunk内以 '--- '/'+++ ' 开头的删除、新增行不会被误认为文件头，
+    hunk之外的 '--- '/'+++ ' 行对开始下一个文件，非git的多文件diff（diff -ru等）因此也能逐文件解析。
+    """
+    hunks = []
+    path = None
+    line_number = None
+    old_remaining = new_remaining = None
+    start = None
+    added = []
+
+    def flush():
+        if path is not None and added and any(line.strip() for line in added):
+            hunks.append(Hunk(path, start, '\n'.join(added)))
+        added.clear()
+
+    for line in text.splitlines():
+        if line_number is not None and old_remaining is not None and old_remaining <= 0 and new_remaining <= 0:
+            # 上一个hunk的行数已经读满
+            flush()
+            line_number = None
+        if line.startswith('@@'):
+            flush()
+            line_number, old_remaining, new_remaining = _hunk_range(line)
+        elif line.startswith('diff --git '):
+            flush()
+            path, line_number = None, None
+        elif line_number is None:
+            # 文件头：--- 行开始新文件，只有 +++ 行给出新文件路径，/dev/null表示文件被删除
+            if line.startswith('--- '):
+                path = None
+            elif line.startswith('+++ '):
+                target = _unquote_path(line[4:].split('\t', 1)[0])
+                path = None if target == '/dev/null' else (target[2:] if target.startswith('b/') else target)
+        elif line.startswith('+'):
+            if not added:
+                start = line_number
+            added.append(line[1:])
+            line_number += 1
+            if new_remaining is not None:
+                new_remaining -= 1
+        elif line.startswith('-'):
+            if old_remaining is not None:
+                old_remaining -= 1
+        elif line.startswith(' ') or not line:
+            flush()
+            line_number += 1
+            if old_remaining is not None:
+                old_remaining -= 1
+                new_remaining -= 1
+    flush()
+    return hunks
+
+
+def unique_hunks(hunks):
+    """按digest去重，保留首次出现的顺序"""
+    seen = {}
+    for hunk in hunks:
+        seen.setdefault(hunk.digest, hunk)
+    return list(seen.values())
+
+
+class ClearedStore:
+    """
+    本地放行记录：首行为服务端判定策略的指纹，其后每行一个已放行hunk的digest。
+    策略（模型、阈值等）变化后旧记录全部作废。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.policy = None
+        self.digests = set()
+        self._order = []
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='ascii', errors='ignore') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return self
+        if lines and lines[0].startswith(_POLICY_PREFIX):
+            self.policy = lines[0][len(_POLICY_PREFIX):].strip()
+            self._order = [line for line in lines[1:] if line]
+            self.digests = set(self._order)
+        return self
+
+    def cleared(self, policy):
+        """当前策略下已放行的digest集合"""
+        return self.digests if policy and policy == self.policy else set()
+
+    def add(self, policy, digests):
+        """记录新放行的digest：策略未变时追加写入，否则重写整个文件"""
+        if not policy:
+            return
+        digests = [digest for digest in digests if digest not in self.cleared(policy)]
+        if not digests and policy == self.policy:
+            return
+        if policy == self.policy and len(self._order) + len(digests) <= MAX_CLEARED_ENTRIES:
+            with open(self.path, 'a', encoding='ascii') as f:
+                f.write(''.join(f'{digest}\n' for digest in digests))
+            self._order.extend(digests)
+        else:
+            kept = self._order[-(MAX_CLEARED_ENTRIES // 2):] if policy == self.policy else []
+            self._order = kept + digests
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(temp_path, 'w', encoding='ascii') as f:
+                f.write(f'{_POLICY_PREFIX}{policy}\n')
+                f.write(''.join(f'{digest}\n' for digest in self._order))
+            os.replace(temp_path, self.path)
+        self.policy = policy
+        self.digests = set(self._order)
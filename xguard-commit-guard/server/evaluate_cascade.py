@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+XGuard级联评估工具 - 用同一份语料分别在第一级小模型与完整模型上推理，
+报告不同uncertainty_band下的升级率、级联结论与完整模型的一致率，以及预计的单条耗时
+
+语料格式与compare_precision.py相同，每行: {"id": "...", "message": "..."}
+
+用法:
+    python evaluate_cascade.py corpus.jsonl --cascade-model /path/to/small_model
+    python evaluate_cascade.py corpus.jsonl --bands 0.05,0.1,0.15,0.2 --output cascade.json
+"""
+
+import sys
+import json
+import time
+import argparse
+
+import xguard_service as service
+from cascade import evaluate_band
+from compare_precision import load_corpus
+from precision import load_causal_lm
+
+
+def run_tier(model_path, tokenizer, items, batch_size, precision):
+    """加载模型并推理全部语料，返回(各条目risk_scores, 每条平均耗时秒数)"""
+    from inference import infer_batch
+
+    model = load_causal_lm(model_path, precision)
+    infer_batch(model, tokenizer, [[{"role": "user", "content": "XGuard warm-up"}]], max_new_tokens=1)
+
+    scores = []
+    started = time.perf_counter()
+    for offset in range(0, len(items), batch_size):
+        batch = items[offset:offset + batch_size]
+        results = infer_batch(
+            model, tokenizer,
+            [[{"role": "user", "content": item['message']}] for item in batch],
+            max_new_tokens=service.SCORE_ONLY_MAX_NEW_TOKENS,
+            reason_first=False
+        )
+        scores.extend(result['risk_score'] for result in results)
+    seconds = (time.perf_counter() - started) / max(1, len(items))
+    del model
+    return scores, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description='XGuard级联评估工具')
+    parser.add_argument('corpus', help='JSONL语料')
+    parser.add_argument('--cascade-model', help='第一级模型路径，默认取cascade_model_path配置')
+    parser.add_argument('--cascade-tokenizer', help='第一级tokenizer路径，默认取cascade_tokenizer_path或tokenizer_path')
+    parser.add_argument('--bands', default='', help='逗号分隔的uncertainty_band列表，默认取配置值')
+    parser.add_argument('--batch-size', type=int, default=8, help='每批推理条数')
+    parser.add_argument('--output', help='将完整报告写入JSON文件')
+    args = parser.parse_args()
+
+    from modelscope import AutoTokenizer
+
+    config = service.get_service_config()
+    cascade_model = args.cascade_model or config['cascade_model_path']
+    if not cascade_model:
+        print("❌ 请通过--cascade-model或cascade_model_path指定第一级模型")
+        return False
+    items = load_corpus(args.corpus)
+    if not items:
+        print("❌ 语料为空")
+        return False
+    bands = [float(band) for band in args.bands.split(',') if band.strip()] or [config['cascade_uncertainty_band']]
+
+    tokenizer = AutoTokenizer.from_pretrained(config['tokenizer_path'])
+    first_tokenizer = AutoTokenizer.from_pretrained(
+        args.cascade_tokenizer or config['cascade_tokenizer_path'] or config['tokenizer_path']
+    )
+    print(f"🔍 第一级模型 {cascade_model} 推理中...")
+    first_scores, first_seconds = run_tier(cascade_model, first_tokenizer, items, args.batch_size, config['precision'])
+    print(f"🔍 完整模型 {config['model_path']} 推理中...")
+    full_scores, full_seconds = run_tier(config['model_path'], tokenizer, items, args.batch_size, config['precision'])
+
+    results = []
+    for band in bands:
+        result = evaluate_band(first_scores, full_scores, config['risk_thresholds'], band)
+        # 级联的单条耗时：第一级全部推理，升级的部分再由完整模型推理
+        result['estimated_item_ms'] = round((first_seconds + result['escalation_rate'] * full_seconds) * 1000, 2)
+        results.append(result)
+
+    report = {
+        "items": len(items),
+        "risk_thresholds": dict(config['risk_thresholds']),
+        "first_tier_item_ms": round(first_seconds * 1000, 2),
+        "full_model_item_ms": round(full_seconds * 1000, 2),
+        "bands": results,
+    }
+    print(f"\n语料条目: {len(items)}  第一级 {report['first_tier_item_ms']} ms/条  完整模型 {report['full_model_item_ms']} ms/条")
+    print(f"{'band':>8}{'升级率':>10}{'一致率':>10}{'漏拦截':>8}{'多拦截':>8}{'预计ms/条':>12}")
+    for result in results:
+        print(f"{result['band']:>8}{result['escalation_rate']:>12.2%}{result['agreement']:>12.2%}"
+              f"{result['missed_blocks']:>10}{result['extra_blocks']:>10}{result['estimated_item_ms']:>14}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n📄 完整报告已写入 {args.output}")
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,202 @@
+"""
+XGuard推理 - 批量生成与风险评分（依赖torch/transformers，由服务在加载模型时再导入）
+"""
+
+import time
+import torch
+from transformers import LogitsProcessor, LogitsProcessorList, StoppingCriteria, StoppingCriteriaList, TextStreamer
+from scoring import RiskScoreCapture, get_token_table, parse_topk, SCORE_TOPK
+from prefix_cache import PrefixKVCache
+
+class _RowStopCriteria(StoppingCriteria):
+    """按行停止解码：should_stop()返回True的行（已超时或被放弃）在下一步结束"""
+
+    def __init__(self, should_stop):
+        self.should_stop = should_stop
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.tensor(self.should_stop(), dtype=torch.bool, device=input_ids.device)
+
+class _PrefillTimer(LogitsProcessor):
+    """记录首次取得logits的时间点，即prefill结束、开始逐token解码的时刻"""
+
+    def __init__(self):
+        self.at = None
+
+    def __call__(self, input_ids, scores):
+        if self.at is None:
+            self.at = time.perf_counter()
+        return scores
+
+class _FirstStepScores(LogitsProcessor):
+    """
+    单条流式推理的评分钩子：reason_first=False时第一个解码步即评分位置，
+    取得该步logits后立即回调top-k，判定无需等待解释文本生成完
+    """
+
+    def __init__(self, callback, k=SCORE_TOPK):
+        self.callback = callback
+        self.k = k
+        self.topk = None
+
+    def __call__(self, input_ids, scores):
+        if self.topk is None:
+            values, indices = scores[0].float().softmax(-1).topk(k=self.k)
+            self.topk = (values.tolist(), indices.tolist())
+            if self.callback is not None:
+                self.callback(self.topk)
+        return scores
+
+class _CallbackStreamer(TextStreamer):
+    """把model.generate逐步解码出的文本交给回调（按词边界缓冲，跳过提示部分）"""
+
+    def __init__(self, tokenizer, on_text):
+        super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        self.on_text = on_text
+
+    def on_finalized_text(self, text, stream_end=False):
+        if text:
+            self.on_text(text)
+
+def _prepare_inputs(model, tokenizer, rendered_queries, policy=None, reason_first=False, prefix_cache=None):
+    """分词并左填充；传入prefix_cache时复用共享前缀的KV，只对后缀做prefill"""
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    
+    if prefix_cache is not None:
+        entry = prefix_cache.get(model, tokenizer, policy=policy, reason_first=reason_first)
+        if entry is not None:
+            batch_ids = tokenizer(rendered_queries)['input_ids']
+            model_inputs = PrefixKVCache.build_inputs(entry, batch_ids, tokenizer.pad_token_id, model.device)
+            # 有行的分词结果不以缓存的前缀开头（如前缀边界处的token合并）时改走普通路径
+            if model_inputs is not None:
+                return model_inputs
+
+    # decoder-only模型批量生成必须左填充，保证各行的生成起点对齐
+    padding_side = tokenizer.padding_side
+    tokenizer.padding_side = 'left'
+    try:
+        return tokenizer(rendered_queries, return_tensors="pt", padding=True).to(model.device)
+    finally:
+        tokenizer.padding_side = padding_side
+
+def infer(model, tokenizer, messages, policy=None, max_new_tokens=500, reason_first=False, **kwargs):
+    """从example.ipynb复制的推理函数；其余参数（prefix_cache、stats等）透传给infer_batch"""
+    return infer_batch(model, tokenizer, [messages], policy=policy, max_new_tokens=max_new_tokens, reason_first=reason_first, **kwargs)[0]
+
+def render_prompts(tokenizer, batch_messages, policy=None, reason_first=False):
+    """按chat template渲染每条对话，得到模型输入文本"""
+    return [
+        tokenizer.apply_chat_template(messages, policy=policy, reason_first=reason_first, tokenize=False)
+        for messages in batch_messages
+    ]
+
+def build_results(tokenizer, generated_tokens, score_topks):
+    """按行解码解释文本并解析评分位置的top-k，得到与infer()相同格式的结果"""
+    table = get_token_table(tokenizer)
+    results = []
+    for output_ids, topk in zip(generated_tokens, score_topks):
+        token_score, risk_score = parse_topk(table, topk)
+        results.append({
+            'response': tokenizer.decode(output_ids, skip_special_tokens=True),
+            'token_score': token_score,
+            'risk_score': risk_score,
+        })
+    return results
+
+def infer_batch(model, tokenizer, batch_messages, policy=None, max_new_tokens=500, reason_first=False, prefix_cache=None, should_stop=None, stats=None):
+    """
+    批量推理：多条对话左填充后合并为一次model.generate调用，按batch_idx拆分出与infer()相同格式的结果
+    传入prefix_cache时复用共享的系统/策略前缀KV，只对用户相关的后缀做prefill
+    传入should_stop时每个解码步调用一次，返回True的行提前结束解码
+    传入stats(dict)时写入各阶段耗时（秒）：render、tokenize、prefill、decode、parse，
+    以及每行的输入token数input_tokens与生成token数generated_tokens
+    """
+    started = time.perf_counter()
+    rendered_queries = render_prompts(tokenizer, batch_messages, policy, reason_first)
+    rendered = time.perf_counter()
+    results = infer_prompts(model, tokenizer, rendered_queries, policy, max_new_tokens, reason_first, prefix_cache, should_stop, stats)
+    if stats is not None:
+        stats['render'] = rendered - started
+    return results
+
+def infer_prompts(model, tokenizer, rendered_queries, policy=None, max_new_tokens=500, reason_first=False, prefix_cache=None, should_stop=None, stats=None):
+    """对已渲染的prompt执行infer_batch的分词、生成与评分解析；policy只用于查找前缀KV"""
+    started = time.perf_counter()
+    model_inputs = _prepare_inputs(model, tokenizer, rendered_queries, policy, reason_first, prefix_cache)
+    tokenized = time.perf_counter()
+    
+    input_length = model_inputs['input_ids'].shape[1]
+    # 评分钩子只保留评分位置的top-k，无需output_scores堆叠全部步骤的词表分布
+    score_capture = RiskScoreCapture(input_length, tokenizer.pad_token_id, reason_first=reason_first)
+    
+    stopping_criteria = StoppingCriteriaList([_RowStopCriteria(should_stop)]) if should_stop is not None else None
+    processors = [score_capture]
+    prefill_timer = None
+    if stats is not None:
+        prefill_timer = _PrefillTimer()
+        processors.insert(0, prefill_timer)
+    
+    sequences = model.generate(**model_inputs, max_new_tokens=max_new_tokens, do_sample=False, pad_token_id=tokenizer.pad_token_id, logits_processor=LogitsProcessorList(processors), stopping_criteria=stopping_criteria)
+    generated = time.perf_counter()
+
+    generated_tokens = sequences[:, input_length:]
+    
+    ### parse score ###
+    results = build_results(tokenizer, generated_tokens.tolist(), score_capture.finalize(sequences))
+
+    if stats is not None:
+        prefilled = prefill_timer.at or generated
+        stats.update(
+            tokenize=tokenized - started,
+            prefill=prefilled - tokenized,
+            decode=generated - prefilled,
+            parse=time.perf_counter() - generated,
+            input_tokens=model_inputs['attention_mask'].sum(dim=1).tolist(),
+            generated_tokens=(generated_tokens != tokenizer.pad_token_id).sum(dim=1).tolist()
+        )
+    return results
+
+def infer_stream(model, tokenizer, messages, policy=None, max_new_tokens=500, prefix_cache=None, should_stop=None, on_scores=None, on_text=None, stats=None):
+    """
+    单条流式推理（reason_first=False）：评分位置解码后立即调用on_scores((token_score, risk_score))，
+    之后每解码出一段解释文本调用一次on_text(text)；should_stop()返回True时停止生成。
+    返回与infer()相同格式的结果，stats含义同infer_batch
+    """
+    started = time.perf_counter()
+    rendered_query = tokenizer.apply_chat_template(messages, policy=policy, reason_first=False, tokenize=False)
+    model_inputs = _prepare_inputs(model, tokenizer, [rendered_query], policy, False, prefix_cache)
+    tokenized = time.perf_counter()
+
+    table = get_token_table(tokenizer)
+    scored_at = []
+
+    def scored(topk):
+        scored_at.append(time.perf_counter())
+        if on_scores is not None:
+            on_scores(parse_topk(table, topk))
+
+    first_step = _FirstStepScores(scored)
+    streamer = _CallbackStreamer(tokenizer, on_text) if on_text is not None else None
+    stopping_criteria = StoppingCriteriaList([_RowStopCriteria(lambda: [bool(should_stop())])]) if should_stop is not None else None
+    input_length = model_inputs['input_ids'].shape[1]
+    sequences = model.generate(**model_inputs, max_new_tokens=max_new_tokens, do_sample=False, pad_token_id=tokenizer.pad_token_id, logits_processor=LogitsProcessorList([first_step]), stopping_criteria=stopping_criteria, streamer=streamer)
+    generated = time.perf_counter()
+
+    output_ids = sequences[0, input_length:].tolist()
+    token_score, risk_score = parse_topk(table, first_step.topk)
+    result = {
+        'response': tokenizer.decode(output_ids, skip_special_tokens=True),
+        'token_score': token_score,
+        'risk_score': risk_score,
+    }
+    if stats is not None:
+        prefilled = scored_at[0] if scored_at else generated
+        stats.update(
+            tokenize=tokenized - started,
+            prefill=prefilled - tokenized,
+            decode=generated - prefilled,
+            input_tokens=model_inputs['attention_mask'].sum(dim=1).tolist(),
+            generated_tokens=[sum(1 for token in output_ids if token != tokenizer.pad_token_id)]
+        )
+    return result
@@ -0,0 +1,219 @@
+"""
+XGuard运行指标 - 轻量的计数器/仪表/直方图，以Prometheus文本格式在/metrics输出
+
+每次记录只做一次加锁的整数累加（直方图额外一次二分查找），可在生产环境常开。
+"""
+
+import os
+import sys
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# 秒级延迟直方图的默认桶：覆盖从亚毫秒的模板渲染到数十秒的长解释生成
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (1, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """指标基类：按标签值元组保存子序列；callback指标在输出时现取值"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self):
+        """产出(后缀, 标签文本, 数值)"""
+        if self.callback is not None:
+            value = self.callback()
+            if isinstance(value, dict):
+                for label_value, sample in value.items():
+                    yield '', _format_labels(self.labelnames, (label_value,)), sample
+            elif value is not None:
+                yield '', '', value
+            return
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield '', _format_labels(self.labelnames, key), value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for suffix, labels, value in self.samples():
+            lines.append(f'{self.name}{suffix}{labels} {_format_value(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # [各桶计数..., +Inf桶计数, 总和]
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._values.items()]
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                yield '_bucket', _format_labels(self.labelnames, key, f'le="{_format_value(float(bound))}"'), cumulative
+            yield '_sum', _format_labels(self.labelnames, key), series[-1]
+            yield '_count', _format_labels(self.labelnames, key), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def process_resident_memory():
+    """当前进程常驻内存（字节）"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # 无/proc时退而使用峰值常驻内存（Linux单位为KB，macOS为字节）
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'xguard_stage_seconds', '推理各阶段耗时：render模板渲染、tokenize分词、prefill、decode、parse评分解析',
+    labelnames=('stage',)))
+INPUT_TOKENS = REGISTRY.register(Histogram(
+    'xguard_input_tokens', '每行推理输入的token数', buckets=TOKEN_BUCKETS))
+GENERATED_TOKENS = REGISTRY.register(Histogram(
+    'xguard_generated_tokens', '每行推理生成的token数', buckets=TOKEN_BUCKETS))
+BATCH_SIZE = REGISTRY.register(Histogram(
+    'xguard_batch_size', '每次model.generate合并的请求数', buckets=BATCH_SIZE_BUCKETS))
+QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    'xguard_queue_wait_seconds', '请求从入队到所在批次开始推理的等待时间'))
+LOCK_WAIT_SECONDS = REGISTRY.register(Histogram(
+    'xguard_model_lock_wait_seconds', '批次等待模型锁的时间'))
+CHECK_SECONDS = REGISTRY.register(Histogram(
+    'xguard_check_seconds', '单次检测的端到端耗时，按判定来源区分', labelnames=('decided_by',)))
+CHECKS = REGISTRY.register(Counter(
+    'xguard_checks_total', '完成的检测次数，按判定来源区分', labelnames=('decided_by',)))
+ERRORS = REGISTRY.register(Counter(
+    'xguard_errors_total', '检测失败次数，按异常类型区分', labelnames=('error',)))
+INFLIGHT = REGISTRY.register(Gauge(
+    'xguard_inflight_checks', '正在进行的检测数'))
+MODEL_MEMORY_BYTES = REGISTRY.register(Gauge(
+    'xguard_model_memory_bytes', '模型权重与缓冲区占用的字节数'))
+PROCESS_MEMORY_BYTES = REGISTRY.register(Gauge(
+    'xguard_process_resident_memory_bytes', '服务进程常驻内存', callback=process_resident_memory))
+
+
+def observe_inference(stats, batch_size):
+    """记录一次批量推理的阶段耗时与token数（stats为infer_batch填充的dict）"""
+    BATCH_SIZE.observe(batch_size)
+    for stage in ('render', 'tokenize', 'prefill', 'decode', 'parse'):
+        if stage in stats:
+            STAGE_SECONDS.observe(stats[stage], stage=stage)
+    for count in stats.get('input_tokens', ()):
+        INPUT_TOKENS.observe(count)
+    for count in stats.get('generated_tokens', ()):
+        GENERATED_TOKENS.observe(count)
+
+
+@contextmanager
+def track_check():
+    """统计进行中的检测数与端到端耗时；调用方把判定来源写入yield出的dict"""
+    outcome = {'decided_by': 'model'}
+    INFLIGHT.inc()
+    started = time.perf_counter()
+    try:
+        yield outcome
+    except Exception as e:
+        ERRORS.inc(error=type(e).__name__)
+        raise
+    else:
+        CHECKS.inc(decided_by=outcome['decided_by'])
+        CHECK_SECONDS.observe(time.perf_counter() - started, decided_by=outcome['decided_by'])
+    finally:
+        INFLIGHT.dec()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+XGuard模型产物 - 将检查点转换为目标精度对应dtype的分片safetensors，预先计算评分用的token查找表，
+并写入记录各文件大小与sha256的清单（xguard-manifest.json）
+
+服务加载带清单的模型目录前先校验：文件齐全、大小与哈希一致、产物精度与precision配置一致、
+tokenizer与查找表匹配，任一项不满足即拒绝加载。校验通过后权重以safetensors内存映射加载，
+无需转换格式或dtype，评分查找表直接从token_table.json载入。
+
+用法:
+    python model_artifacts.py prepare --precision bf16        # local_model + local_tokenizer → prepared_model
+    python model_artifacts.py prepare --model /path/model --tokenizer /path/tokenizer --output /path/prepared
+    python model_artifacts.py verify                          # 完整校验prepared_model的哈希
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+from datetime import datetime, timezone
+
+from config import PREPARED_MODEL_DIR, MANIFEST_NAME
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+TOKEN_TABLE_NAME = 'token_table.json'
+# 记录已通过哈希校验的文件的(大小, mtime)，fast模式下未变化的文件只需stat
+STAMP_NAME = '.xguard-verified.json'
+DEFAULT_SHARD_SIZE = '1GB'
+
+# full: 每次启动都校验全部哈希；fast: 只对大小或mtime与上次校验不同的文件计算哈希；off: 只检查文件齐全与大小
+VERIFY_MODES = ('fast', 'full', 'off')
+
+# 各精度模式的产物dtype：int8模式保存量化前的权重，加载时只需量化，无需再转换dtype
+ARTIFACT_DTYPES = {
+    'auto': None,
+    'bf16': 'bfloat16',
+    'int8-dynamic': 'float32',
+    'int8-weight-only': 'bfloat16',
+}
+
+_WEIGHT_SUFFIXES = ('.safetensors', '.bin')
+_HASH_CHUNK_BYTES = 4 * 1024 * 1024
+# 抽查的token数：按等间隔抽取，确认配置的tokenizer与查找表来自同一词表
+_TOKEN_SAMPLE = 64
+
+
+class ArtifactError(RuntimeError):
+    """模型产物缺失、损坏或与当前配置不匹配"""
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(_HASH_CHUNK_BYTES)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(directory):
+    """目录中的清单，不存在时返回None"""
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        raise ArtifactError(f"模型清单无法读取: {path}: {e}")
+
+
+def _list_files(directory):
+    """目录中除清单与校验记录外的全部文件（相对路径）"""
+    files = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            relative = os.path.relpath(os.path.join(root, name), directory)
+            if relative not in (MANIFEST_NAME, STAMP_NAME):
+                files.append(relative)
+    return sorted(files)
+
+
+def _read_stamp(directory):
+    try:
+        with open(os.path.join(directory, STAMP_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_stamp(directory, stamp):
+    """记录已校验文件的(大小, mtime)；目录只读时跳过，下次启动重新计算哈希"""
+    try:
+        with open(os.path.join(directory, STAMP_NAME), 'w', encoding='utf-8') as f:
+            json.dump(stamp, f)
+    except OSError as e:
+        logger.debug(f"无法写入校验记录: {e}")
+
+
+def verify(directory, precision=None, mode='full'):
+    """
+    校验目录中的产物，返回清单；产物缺失、损坏、出现清单外的权重文件，
+    或precision与产物精度不一致时抛出ArtifactError
+    """
+    if mode not in VERIFY_MODES:
+        raise ValueError(f"不支持的校验模式: {mode}，可选: {', '.join(VERIFY_MODES)}")
+    manifest = load_manifest(directory)
+    if manifest is None:
+        raise ArtifactError(f"{directory} 中没有模型清单 {MANIFEST_NAME}，请先运行 model_artifacts.py prepare")
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ArtifactError(f"模型清单格式版本 {manifest.get('format_version')} 不受支持，请重新运行prepare")
+    if precision is not None and manifest['precision'] != precision:
+        raise ArtifactError(f"模型产物按precision={manifest['precision']}准备，与当前配置precision={precision}不一致")
+
+    files = manifest['files']
+    extra = [name for name in _list_files(directory) if name not in files and name.endswith(_WEIGHT_SUFFIXES)]
+    if extra:
+        raise ArtifactError(f"模型目录中有清单未记录的权重文件: {', '.join(extra)}")
+
+    stamp = _read_stamp(directory) if mode == 'fast' else {}
+    verified = {}
+    for name, expected in files.items():
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            raise ArtifactError(f"模型产物缺少文件: {name}")
+        if stat.st_size != expected['size']:
+            raise ArtifactError(f"模型产物文件大小不符: {name}（清单 {expected['size']}，实际 {stat.st_size}）")
+        signature = [stat.st_size, stat.st_mtime_ns]
+        if mode == 'off' or stamp.get(name) == signature:
+            verified[name] = signature
+            continue
+        if sha256_file(path) != expected['sha256']:
+            raise ArtifactError(f"模型产物文件哈希不符，可能已损坏: {name}")
+        verified[name] = signature
+    if mode != 'off' and verified != stamp:
+        _write_stamp(directory, verified)
+    return manifest
+
+
+def check_model_dir(model_path, precision, mode='fast'):
+    """服务加载前调用：带清单的目录按mode校验并返回清单，未经prepare的目录返回None（走原有加载方式）"""
+    if load_manifest(model_path) is None:
+        return None
+    started = time.monotonic()
+    manifest = verify(model_path, precision, mode)
+    logger.info(f"模型产物校验通过 - {len(manifest['files'])} 个文件, mode={mode}, "
+                f"耗时 {time.monotonic() - started:.2f}s")
+    return manifest
+
+
+def load_token_table(directory, tokenizer):
+    """
+    从产物载入评分查找表并注册给scoring；tokenizer的词表大小、id2risk或抽查的token文本与查找表不一致时
+    抛出ArtifactError（tokenizer_path与模型产物不是同一次prepare生成的）
+    """
+    from scoring import register_token_table
+
+    with open(os.path.join(directory, TOKEN_TABLE_NAME), 'r', encoding='utf-8') as f:
+        table = json.load(f)
+    id2text = table['id2text']
+    if len(id2text) != len(tokenizer):
+        raise ArtifactError(f"tokenizer词表大小 {len(tokenizer)} 与模型产物的查找表 {len(id2text)} 不一致")
+    if table['id2risk'] != tokenizer.init_kwargs.get('id2risk'):
+        raise ArtifactError("tokenizer的id2risk与模型产物的查找表不一致")
+    step = max(1, len(id2text) // _TOKEN_SAMPLE)
+    sample = list(range(0, len(id2text), step))
+    if tokenizer.batch_decode([[i] for i in sample]) != [id2text[i] for i in sample]:
+        raise ArtifactError("tokenizer的token文本与模型产物的查找表不一致")
+    return register_token_table(tokenizer, id2text)
+
+
+def _apply_umask(directory):
+    """mkdtemp创建的目录（及部分库写出的文件）权限为仅属主可读，改为按umask的常规权限，供服务账号读取"""
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(directory, 0o777 & ~umask)
+    for root, dirs, names in os.walk(directory):
+        for name in dirs:
+            os.chmod(os.path.join(root, name), 0o777 & ~umask)
+        for name in names:
+            os.chmod(os.path.join(root, name), 0o666 & ~umask)
+
+
+def _replace_dir(staging, output_dir):
+    """用准备好的临时目录替换输出目录，旧产物在新目录就位后才删除"""
+    backup = None
+    if os.path.exists(output_dir):
+        backup = tempfile.mkdtemp(prefix='.previous-', dir=os.path.dirname(output_dir))
+        os.rmdir(backup)
+        os.replace(output_dir, backup)
+    os.replace(staging, output_dir)
+    if backup is not None:
+        shutil.rmtree(backup, ignore_errors=True)
+
+
+def prepare(model_path, tokenizer_path, output_dir, precision='auto', max_shard_size=DEFAULT_SHARD_SIZE):
+    """
+    生成模型产物：目标dtype的分片safetensors权重、tokenizer文件、token_table.json与清单。
+    先写入同级临时目录，全部完成后再替换output_dir，中途失败不影响已有产物
+    """
+    import torch
+    import transformers
+    from modelscope import AutoTokenizer, AutoModelForCausalLM
+    from scoring import TokenTable
+
+    if precision not in ARTIFACT_DTYPES:
+        raise ValueError(f"不支持的精度模式: {precision}，可选: {', '.join(ARTIFACT_DTYPES)}")
+    output_dir = os.path.abspath(output_dir)
+    parent = os.path.dirname(output_dir)
+    os.makedirs(parent, exist_ok=True)
+
+    dtype = ARTIFACT_DTYPES[precision]
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+    if 'id2risk' not in tokenizer.init_kwargs:
+        raise ArtifactError(f"{tokenizer_path} 的tokenizer没有id2risk映射，不是XGuard模型的tokenizer")
+    model = AutoModelForCausalLM.from_pretrained(
+        model_path, torch_dtype=getattr(torch, dtype) if dtype else "auto", device_map="cpu"
+    ).eval()
+
+    staging = tempfile.mkdtemp(prefix='.prepare-', dir=parent)
+    try:
+        model.save_pretrained(staging, safe_serialization=True, max_shard_size=max_shard_size)
+        tokenizer.save_pretrained(staging)
+        with open(os.path.join(staging, TOKEN_TABLE_NAME), 'w', encoding='utf-8') as f:
+            json.dump({'id2text': TokenTable(tokenizer).id2text, 'id2risk': tokenizer.init_kwargs['id2risk']},
+                      f, ensure_ascii=False)
+
+        files = {}
+        stamp = {}
+        for name in _list_files(staging):
+            path = os.path.join(staging, name)
+            stat = os.stat(path)
+            files[name] = {'size': stat.st_size, 'sha256': sha256_file(path)}
+            stamp[name] = [stat.st_size, stat.st_mtime_ns]
+        manifest = {
+            'format_version': FORMAT_VERSION,
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'source': {'model_path': os.path.abspath(model_path), 'tokenizer_path': os.path.abspath(tokenizer_path)},
+            'precision': precision,
+            'dtype': str(model.dtype).replace('torch.', ''),
+            'vocab_size': len(tokenizer),
+            'versions': {'torch': torch.__version__, 'transformers': transformers.__version__},
+            'files': files,
+        }
+        with open(os.path.join(staging, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        # 产物刚由本进程写出并计算过哈希，服务首次启动无需再算
+        _write_stamp(staging, stamp)
+        _apply_umask(staging)
+        _replace_dir(staging, output_dir)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='XGuard模型产物准备与校验')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    prepare_parser = subparsers.add_parser('prepare', help='转换检查点并生成清单')
+    prepare_parser.add_argument('--model', help='源模型路径，默认取model_path配置')
+    prepare_parser.add_argument('--tokenizer', help='源tokenizer路径，默认取tokenizer_path配置')
+    prepare_parser.add_argument('--output', default=PREPARED_MODEL_DIR, help='产物目录，默认项目根目录下的prepared_model')
+    prepare_parser.add_argument('--precision', default='auto', choices=tuple(ARTIFACT_DTYPES),
+                                help='服务将使用的精度模式，决定权重的保存dtype')
+    prepare_parser.add_argument('--max-shard-size', default=DEFAULT_SHARD_SIZE, help='单个safetensors分片的大小上限')
+
+    verify_parser = subparsers.add_parser('verify', help='完整校验产物的文件与哈希')
+    verify_parser.add_argument('directory', nargs='?', default=PREPARED_MODEL_DIR, help='产物目录')
+    verify_parser.add_argument('--precision', help='同时检查产物精度是否与之一致')
+    args = parser.parse_args()
+
+    if args.command == 'verify':
+        try:
+            manifest = verify(args.directory, args.precision, mode='full')
+        except ArtifactError as e:
+            print(f"❌ {e}")
+            return False
+        size = sum(entry['size'] for entry in manifest['files'].values())
+        print(f"✅ 校验通过: {len(manifest['files'])} 个文件, {size / 1024 ** 2:.1f} MB, "
+              f"precision={manifest['precision']}, dtype={manifest['dtype']}")
+        return True
+
+    from config import ConfigStore
+    config = ConfigStore().get()
+    model_path = args.model or config['model_path']
+    tokenizer_path = args.tokenizer or config['tokenizer_path']
+    existing = load_manifest(args.output) if os.path.isdir(args.output) else None
+    if existing is not None:
+        # 重新准备已有产物（如更换精度）时默认使用上次的源检查点
+        if os.path.abspath(model_path) == os.path.abspath(args.output):
+            model_path = existing['source']['model_path']
+        if os.path.abspath(tokenizer_path) == os.path.abspath(args.output):
+            tokenizer_path = existing['source']['tokenizer_path']
+    if os.path.abspath(model_path) == os.path.abspath(args.output):
+        print("❌ 输出目录不能与源模型目录相同")
+        return False
+    print(f"🔧 准备模型产物: {model_path} → {args.output} (precision={args.precision})")
+    started = time.monotonic()
+    try:
+        manifest = prepare(model_path, tokenizer_path, args.output, args.precision, args.max_shard_size)
+    except ArtifactError as e:
+        print(f"❌ {e}")
+        return False
+    shards = [name for name in manifest['files'] if name.endswith('.safetensors')]
+    print(f"✅ 完成: {len(shards)} 个权重分片, dtype={manifest['dtype']}, 耗时 {time.monotonic() - started:.1f}s")
+    if os.path.abspath(args.output) != PREPARED_MODEL_DIR:
+        print(f"   请将model_path与tokenizer_path配置为 {args.output}")
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
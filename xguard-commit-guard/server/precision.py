@@ -0,0 +1,57 @@
+"""
+XGuard推理精度模式 - 在CPU上以bf16或int8量化加载模型，降低内存占用与延迟
+"""
+
+import logging
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# auto: 按权重文件的dtype加载（原有行为）
+# bf16: bfloat16权重与计算
+# int8-dynamic: Linear层int8动态量化（权重int8，激活按批次动态量化），仅CPU
+# int8-weight-only: Linear层仅权重int8，计算仍为bf16，需要安装torchao，仅CPU
+PRECISION_MODES = ('auto', 'bf16', 'int8-dynamic', 'int8-weight-only')
+
+
+def _check_mode(precision):
+    if precision not in PRECISION_MODES:
+        raise ValueError(f"不支持的精度模式: {precision}，可选: {', '.join(PRECISION_MODES)}")
+
+
+def load_causal_lm(model_path, precision='auto'):
+    """按精度模式加载模型并完成量化，返回eval模式的模型"""
+    from modelscope import AutoModelForCausalLM
+
+    _check_mode(precision)
+    if precision == 'auto':
+        return AutoModelForCausalLM.from_pretrained(model_path, torch_dtype="auto", device_map="auto").eval()
+    if precision == 'bf16':
+        return AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=torch.bfloat16, device_map="auto").eval()
+
+    if precision == 'int8-dynamic':
+        # 动态量化只支持float32的Linear
+        model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=torch.float32, device_map="cpu").eval()
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    try:
+        from torchao.quantization import quantize_, int8_weight_only
+    except ImportError:
+        raise RuntimeError("int8-weight-only精度模式需要安装torchao: pip install torchao")
+    model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=torch.bfloat16, device_map="cpu").eval()
+    quantize_(model, int8_weight_only())
+    return model
+
+
+def _tensor_bytes(value):
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        return sum(_tensor_bytes(item) for item in value)
+    return 0
+
+
+def model_memory_bytes(model):
+    """模型权重与缓冲区占用的字节数（量化层的打包权重同样计入）"""
+    return sum(_tensor_bytes(value) for value in model.state_dict().values())
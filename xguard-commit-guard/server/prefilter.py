@@ -0,0 +1,104 @@
+"""
+XGuard服务端预筛 - 按min_length与skip_patterns在推理前跳过明显安全的文本
+"""
+
+import re
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PrefilterResult:
+    """预筛结果：rule为命中的规则描述，未命中时为None"""
+
+    __slots__ = ('rule',)
+
+    def __init__(self, rule=None):
+        self.rule = rule
+
+    @property
+    def skipped(self):
+        return self.rule is not None
+
+
+class Prefilter:
+    """
+    服务端预筛引擎
+
+    所有skip_patterns合并编译为一个带命名分组的正则，一次search即可判断并通过
+    lastgroup得知命中的是哪条规则；与VSCode插件一致，匹配不区分大小写。
+    只有配置内容变化时才重新编译。
+    """
+
+    def __init__(self, skip_patterns=(), min_length=0):
+        self._lock = threading.Lock()
+        self._patterns = None
+        self._min_length = 0
+        self._combined = None
+        self._individual = []
+        self.update(skip_patterns, min_length)
+
+    def update(self, skip_patterns, min_length):
+        """配置变化时重新编译，未变化时直接返回"""
+        patterns = tuple(skip_patterns or ())
+        min_length = int(min_length or 0)
+        with self._lock:
+            if patterns == self._patterns and min_length == self._min_length:
+                return
+            self._combined, self._individual = self._compile(patterns)
+            self._patterns = patterns
+            self._min_length = min_length
+        logger.info(f"预筛规则已编译 - {len(patterns)} 条skip_patterns, min_length={min_length}")
+
+    @staticmethod
+    def _compile(patterns):
+        """
+        无分组的规则合并编译为单个正则；自带分组的规则（可能含反向引用）合并后
+        编号会错位，单独编译。无效的规则记录警告后忽略。
+        """
+        mergeable = []
+        individual = []
+        for index, pattern in enumerate(patterns):
+            try:
+                regex = re.compile(pattern, re.IGNORECASE)
+            except re.error as e:
+                logger.warning(f"忽略无效的skip_pattern {pattern!r}: {e}")
+                continue
+            if regex.groups:
+                individual.append((index, regex))
+            else:
+                mergeable.append((index, pattern))
+
+        combined = None
+        if mergeable:
+            try:
+                combined = re.compile(
+                    '|'.join(f'(?P<p{index}>{pattern})' for index, pattern in mergeable),
+                    re.IGNORECASE
+                )
+            except re.error:
+                # 例如规则中含只能出现在开头的内联标志(?i)，整体退回逐条匹配
+                individual.extend((index, re.compile(pattern, re.IGNORECASE)) for index, pattern in mergeable)
+                individual.sort(key=lambda entry: entry[0])
+        return combined, individual
+
+    def check(self, text):
+        """判断文本是否可跳过推理"""
+        with self._lock:
+            patterns, min_length = self._patterns, self._min_length
+            combined, individual = self._combined, self._individual
+
+        if len(text) < min_length:
+            return PrefilterResult(f'min_length:{min_length}')
+
+        if combined is not None:
+            match = combined.search(text)
+            if match is not None:
+                index = int(match.lastgroup[1:])
+                return PrefilterResult(f'skip_patterns[{index}]:{patterns[index]}')
+        for index, regex in individual:
+            if regex.search(text):
+                return PrefilterResult(f'skip_patterns[{index}]:{patterns[index]}')
+
+        return PrefilterResult()
@@ -0,0 +1,127 @@
+"""
+XGuard前缀KV缓存 - 预先计算chat template中与用户输入无关的系统/策略前缀的past_key_values
+"""
+
+import copy
+import json
+import logging
+import threading
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# 用两段不同的占位内容渲染模板，公共前缀即为与用户输入无关的部分
+_SENTINELS = ("\x00xguard-prefix-a\x00", "\x01xguard-prefix-b\x01")
+
+
+def _common_prefix(a, b):
+    length = min(len(a), len(b))
+    index = 0
+    while index < length and a[index] == b[index]:
+        index += 1
+    return a[:index]
+
+
+def prefix_token_ids(tokenizer, policy=None, reason_first=False):
+    """chat template中与用户输入无关的前缀token id，无法提取时返回空列表"""
+    rendered = [
+        tokenizer.apply_chat_template([{"role": "user", "content": sentinel}], policy=policy,
+                                      reason_first=reason_first, tokenize=False)
+        for sentinel in _SENTINELS
+    ]
+    prefix_ids = tokenizer(_common_prefix(*rendered))['input_ids']
+    # 末尾token可能与用户内容合并成不同的token，丢弃后只保留稳定部分
+    return prefix_ids[:-1]
+
+
+def prefix_layout(prefix_ids, batch_ids, pad_token_id):
+    """
+    按[前缀][填充][后缀]布局返回(input_ids, attention_mask)二维列表；
+    任一行不以前缀开头或没有后缀时返回None
+    """
+    prefix_len = len(prefix_ids)
+    if any(ids[:prefix_len] != prefix_ids for ids in batch_ids):
+        return None
+
+    suffixes = [ids[prefix_len:] for ids in batch_ids]
+    if any(not suffix for suffix in suffixes):
+        return None
+    suffix_len = max(len(suffix) for suffix in suffixes)
+    input_ids = []
+    attention_mask = []
+    for suffix in suffixes:
+        padding = suffix_len - len(suffix)
+        input_ids.append(prefix_ids + [pad_token_id] * padding + suffix)
+        attention_mask.append([1] * prefix_len + [0] * padding + [1] * len(suffix))
+    return input_ids, attention_mask
+
+
+class PrefixEntry:
+    """一个policy对应的前缀：token id与其past_key_values（batch维为1）"""
+
+    __slots__ = ('prefix_ids', 'past_key_values')
+
+    def __init__(self, prefix_ids, past_key_values):
+        self.prefix_ids = prefix_ids
+        self.past_key_values = past_key_values
+
+
+class PrefixKVCache:
+    """
+    按(模型, tokenizer, policy, reason_first)缓存共享前缀的KV
+
+    请求只需对用户相关的后缀做prefill。批量推理时布局为[前缀][填充][后缀]，
+    填充位置的attention_mask为0，position_ids由attention_mask累加得到，
+    因此各行后缀的位置编码与单独推理时一致。
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get(self, model, tokenizer, policy=None, reason_first=False):
+        """获取前缀条目（首次调用时计算），无法提取有效前缀时返回None"""
+        key = (id(model), id(tokenizer), json.dumps(policy, sort_keys=True, ensure_ascii=False), reason_first)
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key]
+            entry = self._build(model, tokenizer, policy, reason_first)
+            self._entries[key] = entry
+            return entry
+
+    @staticmethod
+    def _build(model, tokenizer, policy, reason_first):
+        prefix_ids = prefix_token_ids(tokenizer, policy, reason_first)
+        if not prefix_ids:
+            return None
+
+        with torch.no_grad():
+            outputs = model(input_ids=torch.tensor([prefix_ids], device=model.device), use_cache=True)
+        logger.info(f"前缀KV缓存已构建 - {len(prefix_ids)} tokens")
+        return PrefixEntry(prefix_ids, outputs.past_key_values)
+
+    @staticmethod
+    def build_inputs(entry, batch_ids, pad_token_id, device):
+        """
+        以[前缀][填充][后缀]布局构建generate输入及对应batch大小的past_key_values；
+        任一行的token序列不以前缀开头时返回None，由调用方走普通路径
+        """
+        layout = prefix_layout(entry.prefix_ids, batch_ids, pad_token_id)
+        if layout is None:
+            return None
+        input_ids, attention_mask = layout
+
+        # generate会原地扩展cache，每次调用使用副本
+        past_key_values = copy.deepcopy(entry.past_key_values)
+        if len(batch_ids) > 1:
+            past_key_values.batch_repeat_interleave(len(batch_ids))
+        return {
+            'input_ids': torch.tensor(input_ids, device=device),
+            'attention_mask': torch.tensor(attention_mask, device=device),
+            'past_key_values': past_key_values,
+        }
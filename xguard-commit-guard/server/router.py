@@ -0,0 +1,666 @@
+#!/usr/bin/env python3
+"""
+XGuard路由网关 - 在多个xguard_service实例前提供同一套HTTP API
+
+- 按检测文本的一致性哈希选择实例，相同文本总落在已缓存其结果的实例上；增删实例只迁移约1/N的文本
+- 后台定期探测各实例的/health：不可达或未就绪的实例不参与路由，恢复后自动重新加入
+- 实例探测延迟超过router_slow_ms、排队过深或本网关转发给它的在途请求达到router_max_inflight时，
+  沿哈希环顺延到下一个实例；所有实例都饱和时返回429并带Retry-After
+- 转发时连接失败、超时或实例返回429/503，同一请求换下一个实例重试
+- /check-batch按条目拆分到各自的实例并行转发，结果合并为一个NDJSON流
+
+用法: python router.py --backends http://127.0.0.1:8801,http://127.0.0.1:8802 --port 8765
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import bisect
+import hashlib
+import logging
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+from flask import Flask, Response, request, jsonify, stream_with_context
+
+import metrics
+import wire
+
+logger = logging.getLogger(__name__)
+
+# 每个实例在哈希环上的虚拟节点数，越多负载越均匀
+VIRTUAL_NODES = 64
+
+# 探测延迟的指数滑动平均系数
+LATENCY_EWMA_ALPHA = 0.3
+
+# 所有实例都不可用时建议客户端等待的秒数
+RETRY_AFTER_SECONDS = 1
+
+# 转发给实例的请求头与回传给客户端的响应头
+_FORWARD_REQUEST_HEADERS = ('Content-Type', 'Accept', 'If-None-Match')
+_FORWARD_RESPONSE_HEADERS = ('Content-Type', 'ETag', 'Cache-Control', 'Retry-After', 'X-Accel-Buffering')
+
+# 实例返回这些状态码时换下一个实例重试
+_RETRY_STATUSES = (429, 503)
+
+
+class BackendUnavailableError(Exception):
+    """转发过程中实例不可达、超时或主动拒绝"""
+
+
+class Backend:
+    """一个xguard_service实例：健康状态、在途请求数与空闲连接池"""
+
+    def __init__(self, url, timeout, max_inflight, slow_seconds):
+        parts = urlsplit(url)
+        if parts.scheme != 'http' or not parts.hostname:
+            raise ValueError(f"后端地址必须是http://host:port形式: {url}")
+        self.url = url
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.max_inflight = max_inflight
+        self.slow_seconds = slow_seconds
+        self.healthy = False
+        self.ready = False
+        self.queue_depth = 0
+        self.probe_latency = None
+        self.inflight = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._idle = []
+
+    @property
+    def routable(self):
+        return self.healthy and self.ready
+
+    @property
+    def slow(self):
+        return self.probe_latency is not None and self.probe_latency > self.slow_seconds
+
+    @property
+    def saturated(self):
+        return self.inflight >= self.max_inflight or self.queue_depth >= self.max_inflight
+
+    def try_acquire(self, force=False):
+        """占用一个在途名额；force为True时不受上限约束（批量子请求）"""
+        with self._lock:
+            if not force and self.inflight >= self.max_inflight:
+                return False
+            self.inflight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.inflight -= 1
+
+    def mark_down(self, error):
+        """转发失败后立即摘除，等下次探测成功再恢复"""
+        if self.healthy:
+            logger.warning(f"后端 {self.url} 不可用: {error}")
+        self.healthy = False
+        self.last_error = str(error)
+
+    def record_probe(self, status, latency, error=None):
+        if status is None:
+            self.mark_down(error)
+            return
+        if not self.healthy:
+            logger.info(f"后端 {self.url} 已恢复")
+        self.healthy = True
+        self.ready = bool(status.get('ready'))
+        self.queue_depth = int(status.get('queue_depth') or 0)
+        self.last_error = None
+        if self.probe_latency is None:
+            self.probe_latency = latency
+        else:
+            self.probe_latency += LATENCY_EWMA_ALPHA * (latency - self.probe_latency)
+
+    def connection(self):
+        """取一个空闲的keep-alive连接，没有则新建"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+
+    def put_back(self, connection):
+        with self._lock:
+            self._idle.append(connection)
+
+    def status(self):
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "ready": self.ready,
+            "slow": self.slow,
+            "inflight": self.inflight,
+            "queue_depth": self.queue_depth,
+            "probe_latency_ms": round(self.probe_latency * 1000, 2) if self.probe_latency is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.sha256(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """一致性哈希环：按键的哈希值顺时针遍历，依次产出互不相同的实例"""
+
+    def __init__(self, backends, virtual_nodes=VIRTUAL_NODES):
+        points = sorted(((_hash(f"{backend.url}#{index}"), backend)
+                         for backend in backends for index in range(virtual_nodes)), key=lambda point: point[0])
+        self._hashes = [point for point, _ in points]
+        self._backends = [backend for _, backend in points]
+        self._count = len(backends)
+
+    def walk(self, key):
+        start = bisect.bisect(self._hashes, _hash(key))
+        seen = []
+        for offset in range(len(self._backends)):
+            backend = self._backends[(start + offset) % len(self._backends)]
+            if backend not in seen:
+                seen.append(backend)
+                yield backend
+                if len(seen) == self._count:
+                    return
+
+
+class Router:
+    """按一致性哈希选择实例，顺延跳过不可用、变慢或饱和的实例"""
+
+    def __init__(self, urls, health_interval=1.0, slow_ms=500, max_inflight=32, upstream_timeout=30):
+        if not urls:
+            raise ValueError("至少需要配置一个后端实例（router_backends）")
+        self.backends = [Backend(url, upstream_timeout, max_inflight, slow_ms / 1000) for url in urls]
+        self.ring = HashRing(self.backends)
+        self.health_interval = health_interval
+        self._stopped = threading.Event()
+        self._register_metrics()
+
+    def _register_metrics(self):
+        self.registry = metrics.Registry()
+        self.requests_total = self.registry.register(metrics.Counter(
+            'xguard_router_requests_total', '转发给各实例的请求数（按响应状态码）', labelnames=('backend', 'status')))
+        self.failovers_total = self.registry.register(metrics.Counter(
+            'xguard_router_failovers_total', '未由哈希环上的首选实例处理的请求数（按原因）', labelnames=('reason',)))
+        self.shed_total = self.registry.register(metrics.Counter(
+            'xguard_router_shed_total', '所有实例都不可用或饱和而直接拒绝的请求数'))
+        self.upstream_seconds = self.registry.register(metrics.Histogram(
+            'xguard_router_upstream_seconds', '实例返回响应头的耗时', labelnames=('backend',)))
+        self.registry.register(metrics.Gauge(
+            'xguard_router_backend_up', '实例是否可路由（可达且模型就绪）', labelnames=('backend',),
+            callback=lambda: {backend.url: int(backend.routable) for backend in self.backends}))
+        self.registry.register(metrics.Gauge(
+            'xguard_router_backend_inflight', '本网关转发给各实例的在途请求数', labelnames=('backend',),
+            callback=lambda: {backend.url: backend.inflight for backend in self.backends}))
+        self.registry.register(metrics.Gauge(
+            'xguard_router_backend_probe_seconds', '各实例/health探测延迟的滑动平均', labelnames=('backend',),
+            callback=lambda: {backend.url: backend.probe_latency for backend in self.backends
+                              if backend.probe_latency is not None}))
+
+    # ---- 健康探测 ----
+
+    def probe(self, backend):
+        """请求一次/health；探测使用独立的短连接与较短的超时，不占用转发连接池"""
+        started = time.monotonic()
+        connection = http.client.HTTPConnection(backend.host, backend.port,
+                                                timeout=max(self.health_interval, backend.slow_seconds * 4))
+        try:
+            connection.request('GET', '/health')
+            response = connection.getresponse()
+            body = response.read()
+            if response.status != 200:
+                raise BackendUnavailableError(f"/health返回{response.status}")
+            backend.record_probe(json.loads(body), time.monotonic() - started)
+        except (OSError, http.client.HTTPException, ValueError, BackendUnavailableError) as e:
+            backend.record_probe(None, None, e)
+        finally:
+            connection.close()
+
+    def probe_all(self):
+        threads = [threading.Thread(target=self.probe, args=(backend,), daemon=True) for backend in self.backends]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def start_health_checks(self):
+        def run():
+            while not self._stopped.wait(self.health_interval):
+                self.probe_all()
+
+        self.probe_all()
+        threading.Thread(target=run, name='xguard-router-health', daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    # ---- 选择实例 ----
+
+    def select(self, key, exclude=(), acquire=True):
+        """
+        沿哈希环选择实例并占用在途名额，返回(实例, 顺延原因)；首选实例可用时原因为None。
+        变慢的实例只在其后没有正常实例时使用；全部不可用或饱和时返回(None, 原因)
+        """
+        reason = None
+        fallback = None
+        for backend in self.ring.walk(key):
+            if backend in exclude:
+                cause = 'retry'
+            elif not backend.routable:
+                cause = 'unhealthy'
+            elif backend.saturated:
+                cause = 'saturated'
+            elif backend.slow:
+                cause = 'slow'
+                fallback = fallback or backend
+            elif not acquire or backend.try_acquire():
+                return backend, reason
+            else:
+                cause = 'saturated'
+            reason = reason or cause
+        if fallback is not None and (not acquire or fallback.try_acquire()):
+            return fallback, reason
+        return None, reason
+
+    def owner(self, key, exclude=()):
+        """批量条目的归属实例：与select相同的顺延规则，但不占用在途名额"""
+        return self.select(key, exclude, acquire=False)
+
+    def any_routable(self):
+        return any(backend.routable for backend in self.backends)
+
+    # ---- 转发 ----
+
+    def send(self, backend, method, path, body, headers):
+        """
+        向实例发送请求并返回响应对象与所用连接；复用的连接已被实例关闭时换新连接重发一次。
+        连接失败或超时抛出BackendUnavailableError
+        """
+        for attempt in range(2):
+            connection, reused = backend.connection()
+            started = time.monotonic()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                if reused and attempt == 0 and not isinstance(e, TimeoutError):
+                    continue
+                raise BackendUnavailableError(f"{backend.url}: {e}") from e
+            self.upstream_seconds.observe(time.monotonic() - started, backend=backend.url)
+            self.requests_total.inc(backend=backend.url, status=response.status)
+            return response, connection
+
+    def finish(self, backend, response, connection):
+        """响应体读完后归还连接；实例要求关闭的连接直接丢弃"""
+        if response.will_close:
+            connection.close()
+        else:
+            backend.put_back(connection)
+
+    def forward(self, key, method, path, body, headers):
+        """
+        按key选择实例转发，失败或被拒绝时沿哈希环重试下一个实例。
+        返回(实例, 响应, 连接)，调用方读完响应后需调用finish与backend.release；
+        没有可用实例时返回(None, 最后一次被拒绝的响应状态与响应头, None)
+        """
+        tried = []
+        rejected = None
+        while True:
+            backend, reason = self.select(key, tried)
+            if backend is None:
+                if not tried:
+                    self.shed_total.inc()
+                return None, rejected, None
+            if reason is not None:
+                self.failovers_total.inc(reason=reason)
+            try:
+                response, connection = self.send(backend, method, path, body, headers)
+            except BackendUnavailableError as e:
+                backend.release()
+                backend.mark_down(e)
+                tried.append(backend)
+                continue
+            if response.status in _RETRY_STATUSES and len(tried) + 1 < len(self.backends):
+                # 实例自身排队已满或尚未就绪，换下一个实例
+                rejected = (response.status, dict(response.getheaders()), response.read())
+                self.finish(backend, response, connection)
+                backend.release()
+                tried.append(backend)
+                continue
+            return backend, response, connection
+
+
+def routing_key(body, content_type):
+    """检测请求的路由键：请求体中的message文本，无法解析时退回整个请求体"""
+    try:
+        message = wire.decode(body, content_type).get('message')
+    except ValueError:
+        message = None
+    if isinstance(message, str):
+        return message
+    return body.decode('utf-8', errors='replace')
+
+
+def parse_batch(body, mimetype, args):
+    """
+    解析/check-batch请求，返回(条目列表, 转发给实例的选项)；
+    请求体无法解析、条目不是对象或message不是字符串时抛出ValueError，网关据此返回400
+    """
+    if mimetype == 'application/x-ndjson':
+        items = []
+        for number, line in enumerate(body.splitlines(), 1):
+            if line.strip():
+                try:
+                    items.append(json.loads(line))
+                except ValueError as e:
+                    raise ValueError(f"第{number}行不是有效的JSON: {e}") from e
+        options = {name: args[name] for name in ('workspace',) if name in args}
+        for name in ('score_only', 'verdict', 'prefilter'):
+            if name in args:
+                options[name] = args[name].lower() == 'true'
+    else:
+        try:
+            data = json.loads(body) if body.strip() else None
+        except ValueError as e:
+            raise ValueError(f"请求体不是有效的JSON: {e}") from e
+        items = data.get('items') if isinstance(data, dict) else data
+        options = {key: value for key, value in data.items() if key != 'items'} if isinstance(data, dict) else {}
+    if not isinstance(items, list):
+        raise ValueError("请求体应为 {\"items\": [...]}、条目列表或application/x-ndjson")
+    for number, item in enumerate(items, 1):
+        if not isinstance(item, dict):
+            raise ValueError(f"第{number}个条目必须是JSON对象")
+        if not isinstance(item.get('message', ''), str):
+            raise ValueError(f"第{number}个条目的message必须是字符串")
+    return items, options
+
+
+def create_app(router):
+    app = Flask(__name__)
+
+    def forward_headers():
+        return {name: request.headers[name] for name in _FORWARD_REQUEST_HEADERS if name in request.headers}
+
+    def response_headers(backend, headers):
+        result = {name: headers[name] for name in _FORWARD_RESPONSE_HEADERS if headers.get(name)}
+        result['X-XGuard-Backend'] = backend.url
+        return result
+
+    def unavailable(rejected):
+        """没有实例可用：所有实例都拒绝时透传最后一次拒绝，否则返回503"""
+        if rejected is not None:
+            status, headers, body = rejected
+            return Response(body, status=status, headers={name: headers[name] for name in _FORWARD_RESPONSE_HEADERS
+                                                          if headers.get(name)})
+        status = 429 if router.any_routable() else 503
+        return jsonify({"error": "没有可用的XGuard服务实例"}), status, {"Retry-After": str(RETRY_AFTER_SECONDS)}
+
+    def proxy(key, stream=False):
+        body = request.get_data()
+        backend, response, connection = router.forward(key, request.method, request.full_path.rstrip('?'),
+                                                       body, forward_headers())
+        if backend is None:
+            return unavailable(response)
+        headers = response_headers(backend, dict(response.getheaders()))
+        if not stream:
+            try:
+                payload = response.read()
+                router.finish(backend, response, connection)
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                backend.mark_down(e)
+                return jsonify({"error": f"XGuard服务实例响应中断: {e}"}), 502
+            finally:
+                backend.release()
+            return Response(payload, status=response.status, headers=headers)
+
+        def generate():
+            completed = False
+            try:
+                while True:
+                    chunk = response.read1(8192)
+                    if not chunk:
+                        completed = True
+                        return
+                    yield chunk
+            except (OSError, http.client.HTTPException) as e:
+                backend.mark_down(e)
+                payload = {"error": f"XGuard服务实例响应中断: {e}"}
+                yield f"event: error\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8')
+            finally:
+                # 客户端断开时关闭到实例的连接，实例随之停止生成
+                if completed:
+                    router.finish(backend, response, connection)
+                else:
+                    connection.close()
+                backend.release()
+
+        return Response(generate(), status=response.status, headers=headers)
+
+    @app.route('/health', methods=['GET'])
+    def health():
+        """网关自身的存活探测，附带各实例状态"""
+        return jsonify({"status": "healthy", "role": "router", "ready": router.any_routable(),
+                        "backends": [backend.status() for backend in router.backends]})
+
+    @app.route('/ready', methods=['GET'])
+    def ready():
+        """至少有一个实例模型就绪时返回200"""
+        ok = router.any_routable()
+        return jsonify({"ready": ok, "backends": [backend.status() for backend in router.backends]}), \
+            200 if ok else 503
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        return Response(router.registry.render(), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/check-commit', methods=['POST'])
+    def check_commit():
+        return proxy(routing_key(request.get_data(), request.content_type))
+
+    @app.route('/check-commit/stream', methods=['POST'])
+    def check_commit_stream():
+        return proxy(routing_key(request.get_data(), request.content_type), stream=True)
+
+    @app.route('/check-batch', methods=['POST'])
+    def check_batch():
+        return batch()
+
+    @app.route('/audit', methods=['GET'])
+    def audit_query():
+        return audit()
+
+    @app.route('/config', methods=['GET'])
+    @app.route('/cache/stats', methods=['GET'])
+    @app.route('/audit/bypass', methods=['POST'])
+    def passthrough():
+        # 按路径选择实例，同一接口固定落在同一实例上，/config的ETag在请求间保持一致
+        return proxy(request.path)
+
+    def batch():
+        """
+        按条目的路由键分组并行转发给各自的实例；子请求中的id换成条目序号，合并结果时还原。
+        某个实例中途失败时，尚未返回的条目重新选择实例
+        """
+        try:
+            items, options = parse_batch(request.get_data(), request.mimetype, request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if not router.any_routable():
+            return unavailable(None)
+
+        results = queue.Queue()
+
+        def run(indices, exclude):
+            while indices:
+                groups = {}
+                for index in indices:
+                    backend, _ = router.owner(items[index].get('message', ''), exclude)
+                    if backend is None:
+                        for index in indices:
+                            results.put({"id": items[index].get('id'), "error": "没有可用的XGuard服务实例",
+                                         "risk_scores": {"Safe-Safe": 0.5},
+                                         "explanation": "Error occurred during analysis.", "safe_score": 0.5})
+                        return
+                    groups.setdefault(backend, []).append(index)
+                if len(groups) == 1:
+                    backend, indices = next(iter(groups.items()))
+                    indices = send_group(backend, indices)
+                    if indices:
+                        exclude = exclude + (backend,)
+                    continue
+                threads = [threading.Thread(target=run_group, args=(backend, group, exclude), daemon=True)
+                           for backend, group in groups.items()]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                return
+
+        def run_group(backend, indices, exclude):
+            remaining = send_group(backend, indices)
+            if remaining:
+                run(remaining, exclude + (backend,))
+
+        def send_group(backend, indices):
+            """
+            转发一组条目，返回未拿到结果的条目序号。
+            实例返回429/503时与forward相同，只换下一个实例重试，不摘除该实例
+            """
+            pending = set(indices)
+            body = json.dumps(dict(options, items=[{"id": index, "message": items[index].get('message', '')}
+                                                   for index in indices]), ensure_ascii=False).encode('utf-8')
+            backend.try_acquire(force=True)
+            connection = None
+            try:
+                response, connection = router.send(backend, 'POST', '/check-batch', body,
+                                                   {'Content-Type': 'application/json'})
+                if response.status in _RETRY_STATUSES:
+                    # 实例自身排队已满或尚未就绪
+                    response.read()
+                    router.finish(backend, response, connection)
+                    connection = None
+                    router.failovers_total.inc(reason='retry')
+                    return sorted(pending)
+                if response.status != 200:
+                    response.read()
+                    raise BackendUnavailableError(f"{backend.url}: /check-batch返回{response.status}")
+                for line in response:
+                    if not line.strip():
+                        continue
+                    result = json.loads(line)
+                    index = result.get('id')
+                    if index in pending:
+                        pending.discard(index)
+                        result['id'] = items[index].get('id')
+                        results.put(result)
+                # 带Content-Length的响应逐行读完后不会自动关闭，未关闭的响应会使放回池中的连接无法再发送请求
+                response.read()
+                router.finish(backend, response, connection)
+                connection = None
+            except (OSError, ValueError, http.client.HTTPException, BackendUnavailableError) as e:
+                backend.mark_down(e)
+                if pending:
+                    router.failovers_total.inc(reason='retry')
+            finally:
+                if connection is not None:
+                    connection.close()
+                backend.release()
+            return sorted(pending)
+
+        def generate():
+            worker = threading.Thread(target=lambda: (run(list(range(len(items))), ()), results.put(None)),
+                                      name='xguard-router-batch', daemon=True)
+            worker.start()
+            while True:
+                result = results.get()
+                if result is None:
+                    return
+                yield json.dumps(result, ensure_ascii=False) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    def audit():
+        """各实例的审计日志相互独立，查询分发给所有就绪实例后按时间倒序合并；共享同一目录的实例结果去重"""
+        try:
+            limit = min(int(request.args.get('limit', 100)), 1000)
+        except ValueError as e:
+            return jsonify({"error": f"查询参数无效: {e}"}), 400
+        path = request.full_path.rstrip('?')
+        events = {}
+        errors = []
+        for backend in router.backends:
+            if not backend.routable:
+                continue
+            backend.try_acquire(force=True)
+            try:
+                response, connection = router.send(backend, 'GET', path, None, {})
+                body = response.read()
+                router.finish(backend, response, connection)
+                if response.status != 200:
+                    return Response(body, status=response.status, content_type=response.getheader('Content-Type'))
+                for event in json.loads(body).get('events', []):
+                    events.setdefault(json.dumps(event, sort_keys=True, ensure_ascii=False), event)
+            except (OSError, ValueError, http.client.HTTPException, BackendUnavailableError) as e:
+                backend.mark_down(e)
+                errors.append(backend.url)
+            finally:
+                backend.release()
+        if errors and not events:
+            return unavailable(None)
+        merged = sorted(events.values(), key=lambda event: event.get('ts', 0), reverse=True)[:limit]
+        return jsonify({"events": merged, "unavailable_backends": errors})
+
+    return app
+
+
+def main():
+    from config import ConfigStore
+    config = ConfigStore().get()
+
+    parser = argparse.ArgumentParser(description='XGuard路由网关')
+    parser.add_argument('--backends', help='逗号分隔的后端实例地址，默认取router_backends配置')
+    parser.add_argument('--host', default=os.environ.get('HOST', '127.0.0.1'), help='监听地址')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 8765)), help='监听端口')
+    parser.add_argument('--health-interval', type=float, default=config['router_health_interval'],
+                        help='健康探测间隔（秒）')
+    parser.add_argument('--slow-ms', type=float, default=config['router_slow_ms'],
+                        help='/health探测延迟超过该值的实例视为变慢，优先路由到其他实例')
+    parser.add_argument('--max-inflight', type=int, default=config['router_max_inflight'],
+                        help='转发给单个实例的在途请求上限')
+    parser.add_argument('--upstream-timeout', type=float, default=config['router_upstream_timeout'],
+                        help='等待实例响应的超时（秒），超时后换下一个实例')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    urls = [url.strip().rstrip('/') for url in args.backends.split(',') if url.strip()] if args.backends \
+        else list(config['router_backends'])
+    try:
+        router = Router(urls, args.health_interval, args.slow_ms, args.max_inflight, args.upstream_timeout)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return False
+    router.start_health_checks()
+    for backend in router.backends:
+        state = '就绪' if backend.routable else ('加载中' if backend.healthy else f'不可用 ({backend.last_error})')
+        print(f"   {backend.url}: {state}")
+    print(f"🔀 XGuard路由网关监听 http://{args.host}:{args.port}，后端 {len(router.backends)} 个")
+
+    # HTTP/1.1使插件与命令行客户端可以复用连接
+    from werkzeug.serving import WSGIRequestHandler
+    WSGIRequestHandler.protocol_version = 'HTTP/1.1'
+    create_app(router).run(host=args.host, port=args.port, threaded=True)
+    router.stop()
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
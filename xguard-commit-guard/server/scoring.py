@@ -0,0 +1,140 @@
+"""
+XGuard风险分数提取 - 在生成过程中只保留评分位置的top-k概率，避免堆叠全部步骤的词表分布
+"""
+
+import torch
+from transformers import LogitsProcessor
+
+# 与example.ipynb保持一致：保留top-10，除第1名外概率需大于1e-4
+SCORE_TOPK = 10
+SCORE_MIN_PROB = 1e-4
+
+# tokenizer -> 词表查找表，每个tokenizer只构建一次
+_token_tables = {}
+
+
+class TokenTable:
+    """token id → 文本 / 风险类别的一次性查找表，替代逐token调用tokenizer.decode"""
+
+    def __init__(self, tokenizer, id2text=None):
+        self.id2text = id2text if id2text is not None else tokenizer.batch_decode([[i] for i in range(len(tokenizer))])
+        self.id2risk = tokenizer.init_kwargs['id2risk']
+        self._tokenizer = tokenizer
+
+    def text(self, token_id):
+        if token_id < len(self.id2text):
+            return self.id2text[token_id]
+        return self._tokenizer.decode([token_id])
+
+
+def register_token_table(tokenizer, id2text):
+    """使用预先计算的id→文本表（prepare生成的token_table.json）注册查找表，免去逐token解码整个词表"""
+    entry = TokenTable(tokenizer, id2text)
+    _token_tables[id(tokenizer)] = entry
+    return entry
+
+
+def get_token_table(tokenizer):
+    """获取tokenizer对应的查找表（首次调用时构建）"""
+    entry = _token_tables.get(id(tokenizer))
+    if entry is None or entry._tokenizer is not tokenizer:
+        entry = TokenTable(tokenizer)
+        _token_tables[id(tokenizer)] = entry
+    return entry
+
+
+class RiskScoreCapture(LogitsProcessor):
+    """
+    生成过程中的评分捕获钩子
+
+    每一步只对当前步做softmax+topk，并按行保留：
+    - first: 第一个非pad生成token的top-k（reason_first=False时的评分位置）
+    - prev/last: 最近两个非pad生成token的top-k（reason_first=True时取倒数第二个）
+    某一步选中的token要到下一步才能看到，因此先暂存为pending，下一步再确认是否为pad。
+    显存占用与解释长度无关，只有 batch_size × k。
+    """
+
+    def __init__(self, input_length, pad_token_id, reason_first=False, k=SCORE_TOPK):
+        self.input_length = input_length
+        self.pad_token_id = pad_token_id
+        self.reason_first = reason_first
+        self.k = k
+        self._pending = None
+        self._first = None
+        self._first_set = None
+        self._prev = None
+        self._last = None
+        self._count = None
+
+    def _resolve(self, tokens):
+        """确认上一步暂存的top-k：选中token非pad的行才计入"""
+        if self._pending is None:
+            return
+        pending_values, pending_indices = self._pending
+        self._pending = None
+        if self._first is None:
+            batch_size = tokens.shape[0]
+            device = tokens.device
+            self._first = (torch.zeros_like(pending_values), torch.zeros_like(pending_indices))
+            self._prev = (torch.zeros_like(pending_values), torch.zeros_like(pending_indices))
+            self._last = (torch.zeros_like(pending_values), torch.zeros_like(pending_indices))
+            self._first_set = torch.zeros(batch_size, dtype=torch.bool, device=device)
+            self._count = torch.zeros(batch_size, dtype=torch.long, device=device)
+
+        keep = tokens != self.pad_token_id
+        keep_col = keep.unsqueeze(-1)
+        take_first = (keep & ~self._first_set).unsqueeze(-1)
+        self._first = (torch.where(take_first, pending_values, self._first[0]),
+                       torch.where(take_first, pending_indices, self._first[1]))
+        self._first_set |= keep
+        if self.reason_first:
+            self._prev = (torch.where(keep_col, self._last[0], self._prev[0]),
+                          torch.where(keep_col, self._last[1], self._prev[1]))
+            self._last = (torch.where(keep_col, pending_values, self._last[0]),
+                          torch.where(keep_col, pending_indices, self._last[1]))
+        self._count += keep.long()
+
+    def __call__(self, input_ids, scores):
+        if input_ids.shape[1] > self.input_length:
+            self._resolve(input_ids[:, -1])
+        if not self.reason_first and self._first_set is not None and bool(self._first_set.all()):
+            # 所有行的评分位置都已确定，后续步骤无需再计算
+            return scores
+        probs = scores.float().softmax(-1)
+        self._pending = probs.topk(k=self.k, dim=-1)
+        return scores
+
+    def finalize(self, sequences):
+        """生成结束后确认最后一步，返回每行评分位置的(top-k概率, top-k id)，无有效token的行为None"""
+        self._resolve(sequences[:, -1])
+        if self._first is None:
+            return [None] * sequences.shape[0]
+
+        if self.reason_first:
+            # 与原实现一致：score_idx = max(len-2, 0)
+            values = torch.where((self._count >= 2).unsqueeze(-1), self._prev[0], self._last[0])
+            indices = torch.where((self._count >= 2).unsqueeze(-1), self._prev[1], self._last[1])
+        else:
+            values, indices = self._first
+
+        values = values.cpu().tolist()
+        indices = indices.cpu().tolist()
+        counts = self._count.cpu().tolist()
+        return [(values[i], indices[i]) if counts[i] > 0 else None for i in range(len(counts))]
+
+
+def parse_topk(table, topk):
+    """将单个评分位置的top-k转换为token_score与risk_score"""
+    token_score = {}
+    risk_score = {}
+    if topk is None:
+        return token_score, risk_score
+    values, indices = topk
+    for ii, (value, index) in enumerate(zip(values, indices)):
+        if ii == 0 or value > SCORE_MIN_PROB:
+            text = table.text(index)
+            prob = round(float(value), 4)
+            token_score[text] = prob
+            if text in table.id2risk:
+                risk_score[table.id2risk[text]] = prob
+    return token_score, risk_score
@@ -0,0 +1,206 @@
+"""
+XGuard确定性敏感信息检测 - 在调用大模型之前用多模式自动机识别格式固定的密钥、证件号等
+"""
+
+import re
+import math
+from collections import deque
+
+# 只转换ASCII大小写，保证转换前后字符位置一一对应
+_ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+PRIVACY = "Data Privacy-Personal Privacy"
+ACCESS_CONTROL = "Cybersecurity-Access Control"
+
+
+def shannon_entropy(value):
+    """按字符计算的香农熵（bit/字符），用于排除password=xxxxxxxx这类占位值"""
+    if not value:
+        return 0.0
+    length = len(value)
+    counts = {}
+    for ch in value:
+        counts[ch] = counts.get(ch, 0) + 1
+    return -sum(c / length * math.log2(c / length) for c in counts.values())
+
+
+def _valid_cn_id(number):
+    """校验18位居民身份证号的GB 11643校验位"""
+    weights = (7, 9, 10, 5, 8, 4, 2, 1, 6, 3, 7, 9, 10, 5, 8, 4, 2)
+    check_codes = '10X98765432'
+    total = sum(int(d) * w for d, w in zip(number[:17], weights))
+    return check_codes[total % 11] == number[17].upper()
+
+
+class SecretRule:
+    """
+    单条检测规则
+
+    prefixes: 字面量前缀（小写），由自动机定位候选位置，再用regex在该位置做锚定匹配；
+              为空时对全文做regex搜索
+    group: 作为密钥值做熵检查的分组，0为整个匹配
+    """
+
+    def __init__(self, name, category, regex, prefixes=(), confidence=0.99,
+                 min_entropy=0.0, group=0, validator=None, flags=0):
+        self.name = name
+        self.category = category
+        self.regex = re.compile(regex, flags)
+        self.prefixes = tuple(prefixes)
+        self.confidence = confidence
+        self.min_entropy = min_entropy
+        self.group = group
+        self.validator = validator
+
+    def accept(self, match):
+        value = match.group(self.group)
+        if self.min_entropy and shannon_entropy(value) < self.min_entropy:
+            return False
+        if self.validator is not None and not self.validator(value):
+            return False
+        return True
+
+
+DEFAULT_RULES = (
+    SecretRule("private-key", ACCESS_CONTROL,
+               r"-----BEGIN (?:RSA |EC |DSA |OPENSSH |PGP |ENCRYPTED )?PRIVATE KEY(?: BLOCK)?-----",
+               prefixes=("-----begin ",)),
+    SecretRule("aws-access-key-id", ACCESS_CONTROL, r"(?:AKIA|ASIA)[0-9A-Z]{16}(?![0-9A-Z])",
+               prefixes=("akia", "asia"), min_entropy=3.0),
+    SecretRule("aliyun-access-key-id", ACCESS_CONTROL, r"LTAI[0-9A-Za-z]{12,20}(?![0-9A-Za-z])",
+               prefixes=("ltai",), min_entropy=3.0),
+    SecretRule("github-token", ACCESS_CONTROL, r"(?:ghp|gho|ghu|ghs|ghr)_[0-9A-Za-z]{36}|github_pat_[0-9A-Za-z_]{82}",
+               prefixes=("ghp_", "gho_", "ghu_", "ghs_", "ghr_", "github_pat_"), min_entropy=3.5),
+    SecretRule("slack-token", ACCESS_CONTROL, r"xox[abposr]-[0-9A-Za-z-]{10,}",
+               prefixes=("xoxa-", "xoxb-", "xoxp-", "xoxo-", "xoxs-", "xoxr-"), min_entropy=3.0),
+    SecretRule("google-api-key", ACCESS_CONTROL, r"AIza[0-9A-Za-z_\-]{35}",
+               prefixes=("aiza",), min_entropy=3.5),
+    SecretRule("openai-style-key", ACCESS_CONTROL, r"sk-(?:proj-)?[0-9A-Za-z_\-]{20,}",
+               prefixes=("sk-",), min_entropy=3.5, confidence=0.95),
+    SecretRule("jdbc-password", ACCESS_CONTROL,
+               r"jdbc:[a-z0-9]+:[^\s'\"]*?[?&;](?:password|pwd)=([^&;\s'\"]+)",
+               prefixes=("jdbc:",), group=1, flags=re.IGNORECASE),
+    SecretRule("url-credentials", ACCESS_CONTROL, r"://[^/\s:@'\"]+:(?![$%{<])([^/\s@'\"]{3,})@",
+               prefixes=("://",), group=1, min_entropy=2.0, confidence=0.9),
+    SecretRule("password-assignment", ACCESS_CONTROL,
+               r"(?:password|passwd|pwd|secret(?:_?key)?|api_?key|access_?token)[\"']?\s*[:=]\s*[\"']?([^\s\"',;]{8,})",
+               prefixes=("password", "passwd", "pwd", "secret", "api_key", "apikey", "access_token", "accesstoken"),
+               group=1, min_entropy=3.0, confidence=0.7, flags=re.IGNORECASE),
+    SecretRule("cn-id-card", PRIVACY,
+               r"(?<![0-9])[1-9][0-9]{5}(?:18|19|20)[0-9]{2}(?:0[1-9]|1[0-2])(?:0[1-9]|[12][0-9]|3[01])[0-9]{3}[0-9Xx](?![0-9A-Za-z])",
+               validator=_valid_cn_id),
+)
+
+
+class _AhoCorasick:
+    """字面量前缀的Aho-Corasick自动机，一次扫描找出所有前缀出现位置"""
+
+    def __init__(self, words):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for word in words:
+            node = 0
+            for ch in word:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(word)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter(self, text):
+        """产出(起始位置, 命中前缀)"""
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for end, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for word in out[node]:
+                yield end - len(word) + 1, word
+
+
+class SecretHit:
+    """一次命中；value只保留脱敏后的片段，避免密钥出现在响应和日志中"""
+
+    __slots__ = ('rule', 'category', 'confidence', 'start', 'end', 'masked')
+
+    def __init__(self, rule, match):
+        value = match.group(rule.group)
+        self.rule = rule.name
+        self.category = rule.category
+        self.confidence = rule.confidence
+        self.start = match.start(rule.group)
+        self.end = match.end(rule.group)
+        self.masked = value[:4] + '*' * max(len(value) - 4, 0) if len(value) > 8 else '*' * len(value)
+
+    def to_dict(self):
+        return {
+            "rule": self.rule,
+            "category": self.category,
+            "confidence": self.confidence,
+            "start": self.start,
+            "end": self.end,
+            "masked": self.masked,
+        }
+
+
+class SecretDetector:
+    """确定性敏感信息检测器：自动机定位字面量前缀 + 锚定正则确认 + 熵/校验位过滤"""
+
+    def __init__(self, rules=DEFAULT_RULES):
+        self.rules = tuple(rules)
+        self._prefix_rules = {}
+        self._scan_rules = []
+        for rule in self.rules:
+            if rule.prefixes:
+                for prefix in rule.prefixes:
+                    self._prefix_rules.setdefault(prefix, []).append(rule)
+            else:
+                self._scan_rules.append(rule)
+        self._automaton = _AhoCorasick(self._prefix_rules)
+
+    def scan(self, text):
+        """返回全部命中（按位置排序，同一规则同一位置只报一次）"""
+        hits = []
+        seen = set()
+        lowered = text.translate(_ASCII_LOWER)
+        for start, prefix in self._automaton.iter(lowered):
+            for rule in self._prefix_rules[prefix]:
+                # 前缀即规则匹配的起点，正则在该位置锚定匹配
+                match = rule.regex.match(text, start)
+                if match is None or (rule.name, match.start()) in seen or not rule.accept(match):
+                    continue
+                seen.add((rule.name, match.start()))
+                hits.append(SecretHit(rule, match))
+        for rule in self._scan_rules:
+            for match in rule.regex.finditer(text):
+                if rule.accept(match):
+                    hits.append(SecretHit(rule, match))
+        hits.sort(key=lambda hit: hit.start)
+        return hits
+
+    @staticmethod
+    def risk_scores(hits):
+        """将命中转换为与模型输出同格式的risk_scores：每个类别取最高置信度"""
+        scores = {}
+        for hit in hits:
+            scores[hit.category] = max(scores.get(hit.category, 0.0), hit.confidence)
+        if scores:
+            scores["Safe-Safe"] = round(1.0 - max(scores.values()), 4)
+        return scores
@@ -0,0 +1,34 @@
+"""
+XGuard风险阈值 - 与VSCode插件一致的阈值匹配与高风险类别判定
+"""
+
+DEFAULT_RISK_THRESHOLDS = {
+    "Data Privacy-Personal Privacy": 0.4,
+    "Cybersecurity-Access Control": 0.3,
+    "Cybersecurity-Hacker Attack": 0.5,
+    "Crimes and Illegal Activities-Dangerous Weapons": 0.6,
+    "Extremism-Violent Terrorist Activities": 0.7
+}
+
+# 未配置阈值的类别使用的默认阈值
+DEFAULT_THRESHOLD = 0.5
+
+
+def threshold_for(category, thresholds):
+    """类别阈值：精确匹配 → 按配置键'-'后的子类别名模糊匹配 → 默认阈值"""
+    if category in thresholds:
+        return thresholds[category]
+    for key, threshold in thresholds.items():
+        parts = key.split('-')
+        if (parts[1] if len(parts) > 1 and parts[1] else key) in category:
+            return threshold
+    return DEFAULT_THRESHOLD
+
+
+def high_risk_categories(risk_scores, thresholds):
+    """超过阈值的风险类别（Safe类别分数越高越安全，不参与判定），按分数降序"""
+    risks = [
+        (category, score) for category, score in risk_scores.items()
+        if 'safe' not in category.lower() and score > threshold_for(category, thresholds)
+    ]
+    return sorted(risks, key=lambda item: item[1], reverse=True)
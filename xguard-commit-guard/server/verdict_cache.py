@@ -0,0 +1,218 @@
+"""
+XGuard检测结果缓存 - 按内容哈希缓存判定结果，LRU淘汰，可选SQLite持久化，合并并发的相同请求
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class ComputationAbandonedError(Exception):
+    """执行计算的请求因自身原因（客户端断开、超过自己的截止时间）放弃，等待者应重新登记并接手计算"""
+
+
+def normalize_text(text):
+    """归一化待检测文本：统一换行符并去除首尾空白，避免编辑器保存差异导致缓存未命中"""
+    return text.replace('\r\n', '\n').replace('\r', '\n').strip()
+
+
+def make_cache_key(text, model_identity, policy=None, reason_first=False, max_new_tokens=500):
+    """由(归一化文本, 模型标识, policy, reason_first, 生成长度)计算缓存键"""
+    payload = json.dumps({
+        'text': normalize_text(text),
+        'model': model_identity,
+        'policy': policy,
+        'reason_first': reason_first,
+        'max_new_tokens': max_new_tokens,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class _SqliteStore:
+    """判定结果的SQLite持久化存储，服务重启后仍可命中"""
+
+    # 每写入多少条检查一次磁盘容量
+    PRUNE_INTERVAL = 256
+
+    def __init__(self, path, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS verdicts ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, last_access REAL NOT NULL)'
+        )
+        self._conn.commit()
+        logger.info(f"检测结果缓存持久化到: {path}")
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM verdicts WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute('UPDATE verdicts SET last_access = ? WHERE key = ?', (time.time(), key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO verdicts (key, value, last_access) VALUES (?, ?, ?)',
+                (key, json.dumps(value, ensure_ascii=False), time.time())
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_INTERVAL == 0:
+                self._conn.execute(
+                    'DELETE FROM verdicts WHERE key NOT IN '
+                    '(SELECT key FROM verdicts ORDER BY last_access DESC LIMIT ?)',
+                    (self.max_entries,)
+                )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM verdicts')
+            self._conn.commit()
+
+
+class VerdictCache:
+    """
+    判定结果缓存
+
+    内存中为有界LRU；配置db_path时同时写入SQLite，内存未命中再查磁盘。
+    同一键的并发请求只有第一个真正执行推理，其余等待同一个Future。
+    只缓存成功的结果，推理异常会传给所有等待者但不会写入缓存；
+    执行者因自身原因放弃时等待者收到ComputationAbandonedError，重新reserve()后由其中一个接手计算。
+    """
+
+    def __init__(self, max_entries=4096, db_path=None):
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._store = _SqliteStore(db_path, self.max_entries) if db_path else None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _remember(self, key, value):
+        """写入内存LRU（调用方需持有self._lock）"""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        """查询缓存，未命中返回None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                return value
+        if self._store is not None:
+            value = self._store.get(key)
+            if value is not None:
+                with self._lock:
+                    self._remember(key, value)
+                return value
+        return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+        if self._store is not None:
+            self._store.put(key, value)
+
+    def reserve(self, key):
+        """
+        查询缓存并登记在途计算，返回(value, future, owner)
+        - 命中: value为缓存结果
+        - 未命中且已有相同请求在计算: owner为False，等待future即可
+        - 未命中且无在途计算: owner为True，调用方计算后必须调用complete()
+        """
+        value = self.get(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value, None, False
+
+        with self._lock:
+            # 加锁后再确认一次，避免与刚完成的计算擦肩而过
+            value = self._entries.get(key)
+            if value is not None:
+                self.hits += 1
+                return value, None, False
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return None, future, False
+            future = Future()
+            self._inflight[key] = future
+            self.misses += 1
+            return None, future, True
+
+    def complete(self, key, future, value=None, error=None):
+        """结束reserve()登记的计算：成功时写入缓存，失败时把异常传给所有等待者"""
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                self.put(key, value)
+                future.set_result(value)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def get_or_compute(self, key, compute, timeout=None, abandon_on=()):
+        """
+        命中直接返回；未命中时执行compute()，同一键的并发调用共享一次计算，等待者最多等待timeout秒。
+        compute()抛出abandon_on中的异常（只与执行者自身有关，如它的截止时间）时不传给等待者，由等待者接手
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            value, future, owner = self.reserve(key)
+            if value is not None:
+                return value
+            if owner:
+                break
+            try:
+                return future.result(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except ComputationAbandonedError:
+                continue
+
+        try:
+            value = compute()
+        except Exception as e:
+            self.complete(key, future, error=ComputationAbandonedError() if isinstance(e, abandon_on) else e)
+            raise
+        self.complete(key, future, value=value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self._store is not None:
+            self._store.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'inflight': len(self._inflight),
+                'hit_rate': round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+                'persistent': self._store is not None,
+            }
@@ -0,0 +1,119 @@
+"""
+XGuard请求/响应编码 - 默认JSON；安装msgpack后可按Content-Type/Accept使用更紧凑的msgpack；
+/check-commit另支持text/plain：请求体即待检测文本、选项放在查询参数中，响应为逐行的判定结果，
+供git钩子客户端在不导入json（及其依赖的re）的情况下收发
+"""
+
+import json
+from urllib.parse import parse_qsl
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+TEXT = 'text/plain'
+_MSGPACK_TYPES = (MSGPACK, 'application/x-msgpack')
+
+# text/plain请求的查询参数及其类型
+_TEXT_BOOL_OPTIONS = ('score_only', 'verdict')
+_TEXT_FLOAT_OPTIONS = ('timeout_seconds',)
+
+
+class UnsupportedMediaTypeError(ValueError):
+    """请求使用了服务端无法解码的格式（如未安装msgpack）"""
+
+
+def _media_type(content_type):
+    return (content_type or '').split(';', 1)[0].strip().lower()
+
+
+def is_msgpack(content_type):
+    return _media_type(content_type) in _MSGPACK_TYPES
+
+
+def is_text(content_type):
+    return _media_type(content_type) == TEXT
+
+
+def accepts_msgpack(accept):
+    """Accept头是否要求msgpack响应（未安装msgpack时始终返回JSON）"""
+    return msgpack is not None and any(is_msgpack(part) for part in (accept or '').split(','))
+
+
+def response_type(accept):
+    """按Accept头选择响应格式：msgpack（已安装时）、text/plain或默认的JSON"""
+    if accepts_msgpack(accept):
+        return MSGPACK
+    if any(is_text(part) for part in (accept or '').split(',')):
+        return TEXT
+    return JSON
+
+
+def _decode_text(body, query):
+    """text/plain请求：请求体为message，score_only/verdict/workspace/timeout_seconds取查询参数"""
+    data = {'message': body.decode('utf-8')}
+    for name, value in parse_qsl(query or ''):
+        if name in _TEXT_BOOL_OPTIONS:
+            data[name] = value.lower() == 'true'
+        elif name in _TEXT_FLOAT_OPTIONS:
+            data[name] = float(value)
+        elif name == 'workspace':
+            data[name] = value
+    return data
+
+
+def decode(body, content_type=None, query=''):
+    """解码请求体为dict，空请求体视为{}；text/plain请求的选项取自查询字符串query"""
+    if is_text(content_type):
+        return _decode_text(body, query)
+    if is_msgpack(content_type):
+        if msgpack is None:
+            raise UnsupportedMediaTypeError('服务端未安装msgpack，请使用application/json')
+        data = msgpack.unpackb(body, raw=False) if body else {}
+    else:
+        data = json.loads(body.decode('utf-8')) if body else {}
+    if not isinstance(data, dict):
+        raise ValueError('请求体必须是对象')
+    return data
+
+
+def _one_line(value):
+    return ' '.join(str(value).split())
+
+
+def encode_text(payload):
+    """
+    检测结果的text/plain表示，每行一个字段，值中的空白折叠为单个空格：
+        error <错误信息>
+        blocked 0|1                     （请求了verdict时）
+        risk <分数> <风险类别>          （超过阈值的类别，按分数降序）
+        safe_score <分数>
+        decided_by <判定来源>
+        hit <规则> <起始> <结束>        （敏感信息检测器命中）
+    """
+    lines = []
+    if 'error' in payload:
+        lines.append(f"error {_one_line(payload['error'])}")
+    verdict = payload.get('verdict')
+    if verdict is not None:
+        lines.append(f"blocked {int(bool(verdict.get('blocked')))}")
+        lines.extend(f"risk {risk['score']} {_one_line(risk['category'])}" for risk in verdict.get('high_risks', []))
+    if 'safe_score' in payload:
+        lines.append(f"safe_score {payload['safe_score']}")
+    if payload.get('decided_by'):
+        lines.append(f"decided_by {_one_line(payload['decided_by'])}")
+    lines.extend(f"hit {_one_line(hit.get('rule'))} {hit.get('start')} {hit.get('end')}"
+                 for hit in payload.get('detector_hits', []))
+    return ''.join(line + '\n' for line in lines).encode('utf-8')
+
+
+def encode(payload, media_type=JSON):
+    """按response_type()选出的格式编码响应体，返回(bytes, Content-Type)"""
+    if media_type == MSGPACK and msgpack is not None:
+        return msgpack.packb(payload, use_bin_type=True), MSGPACK
+    if media_type == TEXT:
+        return encode_text(payload), f'{TEXT}; charset=utf-8'
+    return json.dumps(payload, ensure_ascii=False).encode('utf-8'), JSON
@@ -0,0 +1,287 @@
+"""
+XGuard多进程推理池 - 启动多个推理进程，各持有一份模型副本，权重通过内存映射的safetensors共享物理页
+"""
+
+import os
+import json
+import mmap
+import glob
+import struct
+import logging
+import threading
+import multiprocessing
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+_SAFETENSORS_DTYPES = {
+    'F64': torch.float64,
+    'F32': torch.float32,
+    'F16': torch.float16,
+    'BF16': torch.bfloat16,
+    'I64': torch.int64,
+    'I32': torch.int32,
+    'I16': torch.int16,
+    'I8': torch.int8,
+    'U8': torch.uint8,
+    'BOOL': torch.bool,
+}
+
+# 父进程检查停止标志并写入共享内存的间隔（秒）
+_STOP_POLL_INTERVAL = 0.02
+
+
+def _iter_safetensors(path):
+    """以内存映射方式读取safetensors文件，产出(名称, 与文件页共享内存的张量)"""
+    with open(path, 'rb') as f:
+        # ACCESS_COPY即MAP_PRIVATE：未写入的页直接来自page cache，多个进程共享同一份物理内存
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    header_size = struct.unpack('<Q', mapped[:8])[0]
+    header = json.loads(mapped[8:8 + header_size])
+    base = 8 + header_size
+    for name, info in header.items():
+        dtype = _SAFETENSORS_DTYPES.get(info.get('dtype')) if name != '__metadata__' else None
+        if dtype is None:
+            continue
+        start, end = info['data_offsets']
+        if end == start:
+            continue
+        count = (end - start) // torch.empty((), dtype=dtype).element_size()
+        tensor = torch.frombuffer(mapped, dtype=dtype, count=count, offset=base + start)
+        yield name, tensor.view(info['shape'])
+
+
+def map_safetensors_weights(model, model_path):
+    """
+    将模型参数替换为指向safetensors文件映射的张量，替换后原先的私有副本被释放；
+    名称、形状、dtype或设备不一致的参数保持原样。
+    返回共享情况：共享参数数shared、参数总数total、共享字节数shared_bytes、仍为私有副本的字节数private_bytes
+    （含量化层的打包权重），以及因dtype与文件不一致而未能共享的参数数dtype_mismatch
+    """
+    from precision import model_memory_bytes
+
+    parameters = dict(model.named_parameters(remove_duplicate=False))
+    shared = {}
+    dtype_mismatch = 0
+    files = sorted(glob.glob(os.path.join(model_path, '*.safetensors'))) if os.path.isdir(model_path) else []
+    for path in files:
+        for name, tensor in _iter_safetensors(path):
+            param = parameters.get(name)
+            if param is None or param.device.type != 'cpu' or param.shape != tensor.shape:
+                continue
+            if param.dtype != tensor.dtype:
+                dtype_mismatch += 1
+                continue
+            param.data = tensor
+            shared[id(param)] = tensor.numel() * tensor.element_size()
+    shared_bytes = sum(shared.values())
+    return {
+        'shared': len(shared),
+        'total': len({id(param) for param in parameters.values()}),
+        'shared_bytes': shared_bytes,
+        'private_bytes': max(0, model_memory_bytes(model) - shared_bytes),
+        'dtype_mismatch': dtype_mismatch,
+        'safetensors': bool(files),
+    }
+
+
+def sharing_problem(sharing, precision):
+    """权重大部分未能与其他推理进程共享时返回原因说明，否则返回None"""
+    if sharing['shared_bytes'] >= sharing['private_bytes']:
+        return None
+    if precision.startswith('int8'):
+        return f"precision={precision}的Linear层权重在各进程内量化，量化后的权重无法映射到文件"
+    if not sharing['safetensors']:
+        return "模型目录中没有safetensors权重文件"
+    if sharing['dtype_mismatch']:
+        return (f"{sharing['dtype_mismatch']}个参数的dtype与权重文件不一致（precision={precision}），"
+                f"可先运行 model_artifacts.py prepare --precision {precision} 生成目标dtype的权重")
+    return "权重文件中的参数名称或形状与模型不一致"
+
+
+def _mb(size):
+    return round(size / (1024 * 1024), 1)
+
+
+def _worker_main(index, config, threads, conn, stop_flags):
+    """推理进程入口：加载模型副本后循环处理父进程发来的批次"""
+    torch.set_num_threads(threads)
+    import xguard_service as service
+    from config import ConfigStore
+
+    # 子进程内按父进程的配置以单进程模式加载与推理；级联的第一级模型只在父进程中加载
+    service._config_store = ConfigStore(overrides=dict(config, worker_processes=0, cascade_enabled=False))
+    try:
+        service.load_model()
+        # onnx后端的权重由ONNX Runtime持有，不做映射
+        model = service._backend.model
+        sharing = map_safetensors_weights(model, config['model_path']) if model is not None else None
+    except Exception as e:
+        conn.send(('error', f"{type(e).__name__}: {e}"))
+        return
+    if sharing is not None:
+        logger.info(f"推理进程 {index} 已就绪 - pid={os.getpid()}, threads={threads}, "
+                    f"共享权重 {sharing['shared']}/{sharing['total']} ({_mb(sharing['shared_bytes'])}MB), "
+                    f"私有 {_mb(sharing['private_bytes'])}MB")
+    conn.send(('ready', (os.getpid(), sharing)))
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        batch_messages, params, watch_stop = message
+        size = len(batch_messages)
+        should_stop = (lambda: [bool(stop_flags[i]) for i in range(size)]) if watch_stop else None
+        stats = {}
+        try:
+            results = service._infer_with_loaded_model(batch_messages, should_stop=should_stop, stats=stats, **params)
+            conn.send(('ok', (results, stats)))
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    """父进程侧的单个推理进程句柄，同一时间只处理一个批次"""
+
+    def __init__(self, ctx, index, config, threads, max_batch_size):
+        self.index = index
+        self.inflight = 0
+        self.lock = threading.Lock()
+        self._ctx = ctx
+        self._config = config
+        self._threads = threads
+        self._max_batch_size = max_batch_size
+        self.process = None
+        self.conn = None
+        self.stop_flags = None
+        # 推理进程报告的权重共享情况（map_safetensors_weights的返回值），onnx后端为None
+        self.sharing = None
+
+    def start(self):
+        """启动进程并等待模型加载完成"""
+        self.conn, child_conn = self._ctx.Pipe()
+        self.stop_flags = self._ctx.Array('b', self._max_batch_size, lock=False)
+        self.process = self._ctx.Process(
+            target=_worker_main,
+            args=(self.index, self._config, self._threads, child_conn, self.stop_flags),
+            name=f'xguard-worker-{self.index}',
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        try:
+            status, detail = self.conn.recv()
+        except EOFError:
+            raise RuntimeError(f"推理进程 {self.index} 启动失败")
+        if status != 'ready':
+            raise RuntimeError(f"推理进程 {self.index} 加载模型失败: {detail}")
+        _, self.sharing = detail
+
+    def call(self, batch_messages, params, should_stop=None, stats=None):
+        with self.lock:
+            if not self.process.is_alive():
+                logger.warning(f"推理进程 {self.index} 已退出，正在重启")
+                self.start()
+            for i in range(len(self.stop_flags)):
+                self.stop_flags[i] = 0
+            try:
+                self.conn.send((batch_messages, params, should_stop is not None))
+                while not self.conn.poll(_STOP_POLL_INTERVAL):
+                    if should_stop is not None:
+                        for i, stop in enumerate(should_stop()):
+                            self.stop_flags[i] = 1 if stop else 0
+                    if not self.process.is_alive():
+                        raise EOFError()
+                status, payload = self.conn.recv()
+            except (EOFError, OSError):
+                raise RuntimeError(f"推理进程 {self.index} 异常退出")
+        if status != 'ok':
+            raise RuntimeError(payload)
+        results, worker_stats = payload
+        if stats is not None:
+            stats.update(worker_stats)
+        return results
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class WorkerPool:
+    """
+    多进程推理池
+
+    每个进程持有一份模型副本并固定torch线程数，权重替换为safetensors文件的内存映射，
+    因此N个副本共享同一份物理页。进程依次启动，加载期的私有副本不会同时存在。
+    权重dtype与文件不一致或int8量化时无法共享，第一个进程加载完后记录警告。
+    infer_batch线程安全，每次派发给当前在途批次最少的进程。
+    """
+
+    def __init__(self, config, processes, threads_per_worker=0, max_batch_size=8):
+        processes = max(1, int(processes))
+        threads = int(threads_per_worker) or max(1, (os.cpu_count() or 1) // processes)
+        ctx = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._workers = [_Worker(ctx, i, config, threads, max_batch_size) for i in range(processes)]
+        try:
+            for worker in self._workers:
+                worker.start()
+                if worker.index == 0 and processes > 1:
+                    # 第一个进程加载完即可知道权重能否共享，在其余进程启动前给出提示
+                    self._check_sharing(worker.sharing, config.get('precision', 'auto'), processes)
+        except Exception:
+            self.close()
+            raise
+        logger.info(f"推理进程池已启动 - processes={processes}, threads_per_worker={threads}")
+
+    @staticmethod
+    def _check_sharing(sharing, precision, processes):
+        """权重大部分不能共享时，N个进程各持有一份私有副本，内存随进程数成倍增长"""
+        if sharing is None:
+            return
+        problem = sharing_problem(sharing, precision)
+        if problem is None:
+            return
+        logger.warning(
+            f"推理进程的权重大部分未能共享: {problem}。{processes}个推理进程将各自持有约"
+            f"{_mb(sharing['private_bytes'])}MB私有权重，合计约{_mb(sharing['private_bytes'] * processes)}MB；"
+            f"内存受限时请减少worker_processes或改用单进程推理（worker_processes=0）"
+        )
+
+    @property
+    def size(self):
+        return len(self._workers)
+
+    def infer_batch(self, batch_messages, should_stop=None, stats=None, **params):
+        """与infer_batch相同的批量推理接口，在负载最低的推理进程中执行；stats带回推理进程内的阶段耗时"""
+        with self._lock:
+            worker = min(self._workers, key=lambda w: w.inflight)
+            worker.inflight += 1
+        try:
+            return worker.call(batch_messages, params, should_stop, stats)
+        finally:
+            with self._lock:
+                worker.inflight -= 1
+
+    def status(self):
+        return [
+            {"pid": worker.process.pid, "alive": worker.process.is_alive(), "inflight": worker.inflight,
+             "shared_weights_mb": _mb(worker.sharing['shared_bytes']) if worker.sharing else None,
+             "private_weights_mb": _mb(worker.sharing['private_bytes']) if worker.sharing else None}
+            for worker in self._workers
+        ]
+
+    def close(self):
+        for worker in self._workers:
+            worker.close()
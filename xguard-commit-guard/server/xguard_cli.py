@@ -0,0 +1,552 @@
+#!/usr/bin/env python3
+"""
+XGuard命令行客户端 - 供git commit-msg等钩子调用
+
+    xguard check < message.txt          # 从stdin读取，超过risk_thresholds时退出码为1
+    xguard check --file .git/COMMIT_EDITMSG
+    xguard scan                         # 检测git diff --cached中新增的内容，只送检此前未放行的hunk
+    git diff HEAD~3 | xguard scan --stdin
+    xguard install-hook                 # 在当前仓库安装commit-msg钩子
+    xguard install-hook --pre-commit    # 安装检测暂存区改动的pre-commit钩子
+
+check选项：
+    --file PATH      从文件读取（commit-msg钩子传入的$1），默认读取stdin
+    --socket PATH    服务的Unix域套接字路径，默认取XGUARD_UNIX_SOCKET
+    --url URL        未指定套接字时使用的服务地址，默认取XGUARD_URL或http://127.0.0.1:8765
+    --timeout SEC    请求超时（秒），默认30
+    --msgpack        使用msgpack编码请求与响应（需安装msgpack）
+    --keep-comments  不去除#开头的git注释行
+    --fail-closed    服务不可用时拒绝提交（退出码2），默认放行
+    --quiet          通过时不输出
+
+scan选项：
+    --stdin          从stdin读取unified diff，默认读取git diff --cached
+    --store PATH     放行记录文件，默认.git/xguard/cleared-hunks
+    --socket/--url/--timeout/--fail-closed/--quiet  同check，--timeout默认120
+
+退出码：0 通过，1 超过阈值被拦截，2 服务不可用或请求失败。
+"""
+
+import os
+import sys
+
+try:
+    # socket模块连带导入enum与selectors，单是导入就约12ms，超过钩子除推理外的全部开销预算；
+    # _socket是socket包装的C模块（导入不到1ms），套接字对象与函数相同
+    import _socket as socket
+except ImportError:
+    import socket
+
+DEFAULT_URL = 'http://127.0.0.1:8765'
+# DEFAULT_URL解析后的(scheme, host, port, 路径前缀)，默认地址无需导入urllib.parse
+_DEFAULT_ADDRESS = ('http', '127.0.0.1', 8765, '')
+EXIT_OK = 0
+EXIT_BLOCKED = 1
+EXIT_ERROR = 2
+
+# git commit -v 附带的diff以该行开头，其后内容不属于提交信息
+_SCISSORS = '# ------------------------ >8 ------------------------'
+
+# -S跳过site初始化（客户端只依赖标准库）；以模块方式导入可复用__pycache__中的字节码，
+# 直接运行脚本则每次都要重新编译
+_HOOK_TEMPLATE = '''#!/bin/sh
+# 由 xguard install-hook 生成：{description}
+exec "{python}" -S -c 'import sys; sys.path.insert(0, "{directory}"); from xguard_cli import main; sys.exit(main())' \\
+    {command}
+'''
+
+# 钩子名 -> (说明, 调用的子命令)
+_HOOKS = {
+    'commit-msg': ('提交前检测commit message中的敏感信息', 'check --file "$1"'),
+    'pre-commit': ('提交前检测暂存区新增内容中的敏感信息', 'scan'),
+}
+
+
+class ServiceError(Exception):
+    """服务不可用或返回了非200响应"""
+
+
+def strip_comments(message):
+    """去掉git注释行与commit -v的diff部分"""
+    lines = []
+    for line in message.splitlines():
+        if line.startswith(_SCISSORS):
+            break
+        if not line.startswith('#'):
+            lines.append(line)
+    return '\n'.join(lines).strip()
+
+
+def _parse_url(url):
+    """解析服务地址，返回(scheme, host, port, 路径前缀)；支持IPv6地址与反向代理下的路径前缀"""
+    if url == DEFAULT_URL:
+        return _DEFAULT_ADDRESS
+    from urllib.parse import urlsplit
+    parts = urlsplit(url)
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+        host = None
+    else:
+        host = parts.hostname
+    if parts.scheme not in ('http', 'https') or not host:
+        raise ServiceError(f'无效的服务地址: {url}')
+    return parts.scheme, host, port or (443 if parts.scheme == 'https' else 80), parts.path.rstrip('/')
+
+
+def _numeric_address(host, port):
+    """host为IP地址字面量时返回与getaddrinfo相同结构的结果，否则返回None"""
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, host)
+        except OSError:
+            continue
+        address = (host, port) if family == socket.AF_INET else (host, port, 0, 0)
+        return [(family, socket.SOCK_STREAM, 0, '', address)]
+    return None
+
+
+def _connect(socket_path, host, port, timeout):
+    if socket_path:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+    # 与socket.create_connection相同：按getaddrinfo的结果依次尝试，IPv4与IPv6地址均可；
+    # 进程内首次getaddrinfo要初始化libc的名字解析（约8ms），IP地址字面量直接连接
+    error = None
+    for family, kind, proto, _, address in _numeric_address(host, port) or \
+            socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+        sock = socket.socket(family, kind, proto)
+        try:
+            sock.settimeout(timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.connect(address)
+            return sock
+        except OSError as e:
+            error = e
+            sock.close()
+    raise error or OSError(f'无法解析地址: {host}')
+
+
+def _read_response(sock):
+    """读取单个响应（请求带Connection: close），返回(状态码, 小写头部dict, 响应体)"""
+    buffer = b''
+    while b'\r\n\r\n' not in buffer:
+        chunk = sock.recv(65536)
+        if not chunk:
+            raise ServiceError('连接被服务端关闭')
+        buffer += chunk
+    head, _, body = buffer.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        status = int(lines[0].split(' ', 2)[1])
+    except (IndexError, ValueError):
+        raise ServiceError(f'无效的HTTP响应: {lines[0][:80]}')
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', -1))
+    while length < 0 or len(body) < length:
+        chunk = sock.recv(65536)
+        if not chunk:
+            if length < 0:
+                break
+            raise ServiceError('响应不完整')
+        body += chunk
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        body = _dechunk(body)
+    return status, headers, body
+
+
+def _dechunk(body):
+    """解码chunked响应体（响应体已读到连接关闭为止）"""
+    data = []
+    position = 0
+    while True:
+        end = body.find(b'\r\n', position)
+        if end < 0:
+            raise ServiceError('响应不完整')
+        size = int(body[position:end].split(b';', 1)[0], 16)
+        if size == 0:
+            return b''.join(data)
+        data.append(body[end + 2:end + 2 + size])
+        position = end + 2 + size + 2
+
+
+def _request_https(method, host, port, path, body, headers, timeout):
+    """https经http.client发送；它连带导入ssl与email（钩子进程约多30ms），只在使用https地址时导入"""
+    import http.client
+    connection = http.client.HTTPSConnection(host, port, timeout=timeout)
+    try:
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        data = response.read()
+    except http.client.HTTPException as e:
+        raise ServiceError(f'请求XGuard服务失败: {e}')
+    finally:
+        connection.close()
+    return response.status, {name.lower(): value for name, value in response.getheaders()}, data
+
+
+def _request(method, path, body=b'', content_type='application/json', accept='application/json',
+             socket_path=None, url=DEFAULT_URL, timeout=30.0):
+    """
+    发送单个HTTP请求，返回(状态码, 小写头部dict, 响应体)
+    钩子每次提交都启动新进程：Unix域套接字与http地址直接在socket上收发单个请求，
+    避免http.client连带导入ssl、email等模块
+    """
+    if socket_path:
+        scheme, host, port, prefix = 'http', 'localhost', None, ''
+    else:
+        scheme, host, port, prefix = _parse_url(url)
+    host_header = f'[{host}]' if ':' in host else host
+    if port not in (None, 80, 443):
+        host_header += f':{port}'
+    headers = {'Host': host_header, 'Accept': accept, 'Content-Type': content_type,
+               'Content-Length': str(len(body)), 'Connection': 'close'}
+    try:
+        if scheme == 'https':
+            return _request_https(method, host, port, prefix + path, body, headers, timeout)
+        sock = _connect(socket_path, host, port, timeout)
+    except OSError as e:
+        raise ServiceError(f'无法连接XGuard服务: {e}')
+    try:
+        head = ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+        sock.sendall(f'{method} {prefix + path} HTTP/1.1\r\n{head}\r\n'.encode('latin-1') + body)
+        return _read_response(sock)
+    except OSError as e:
+        raise ServiceError(f'请求XGuard服务失败: {e}')
+    finally:
+        sock.close()
+
+
+def _json_body(payload):
+    import json
+    return json.dumps(payload).encode('ascii')
+
+
+def _load_json(data):
+    import json
+    return json.loads(data.decode('utf-8')) if data.strip() else {}
+
+
+# 查询参数中无需编码的字节，与urllib.parse.quote(value, safe='/')一致
+_UNRESERVED = frozenset(b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_.-~/')
+
+
+def _quote(value):
+    """百分号编码查询参数值（UTF-8），省去导入urllib.parse"""
+    return ''.join(chr(byte) if byte in _UNRESERVED else f'%{byte:02X}'
+                   for byte in value.encode('utf-8', 'surrogateescape'))
+
+
+def _load_text_result(data):
+    """解析wire.encode_text()的逐行检测结果，得到与JSON响应相同结构的dict"""
+    result = {}
+    for line in data.decode('utf-8').splitlines():
+        field, _, value = line.partition(' ')
+        if field == 'blocked':
+            result['verdict'] = {'blocked': value == '1', 'high_risks': []}
+        elif field == 'risk':
+            score, _, category = value.partition(' ')
+            result.setdefault('verdict', {'blocked': True, 'high_risks': []})['high_risks'].append(
+                {'category': category, 'score': float(score)})
+        elif field == 'safe_score':
+            result['safe_score'] = float(value)
+        elif field == 'hit':
+            rule, start, end = value.rsplit(' ', 2)
+            result.setdefault('detector_hits', []).append({'rule': rule, 'start': int(start), 'end': int(end)})
+        elif field in ('error', 'decided_by'):
+            result[field] = value
+    return result
+
+
+def request_check(message, socket_path=None, url=DEFAULT_URL, timeout=30.0, use_msgpack=False, workspace=None):
+    """
+    发送一次/check-commit请求（附带verdict），返回响应dict；workspace记入服务端审计日志
+    默认以text/plain收发，钩子进程无需导入json
+    """
+    path = '/check-commit'
+    if use_msgpack:
+        try:
+            import msgpack
+        except ImportError:
+            raise ServiceError('--msgpack需要安装msgpack（pip install msgpack）')
+        payload = {'message': message, 'score_only': True, 'verdict': True, 'workspace': workspace}
+        body = msgpack.packb(payload, use_bin_type=True)
+        content_type = accept = 'application/msgpack'
+    else:
+        body = message.encode('utf-8', 'surrogateescape')
+        content_type, accept = 'text/plain; charset=utf-8', 'text/plain'
+        path += '?score_only=true&verdict=true' + (f'&workspace={_quote(workspace)}' if workspace else '')
+    status, headers, data = _request('POST', path, body, content_type, accept, socket_path, url, timeout)
+
+    try:
+        response_type = headers.get('content-type', '')
+        if 'msgpack' in response_type:
+            import msgpack
+            result = msgpack.unpackb(data, raw=False)
+        elif response_type.startswith('text/plain'):
+            result = _load_text_result(data)
+        else:
+            result = _load_json(data)
+    except ValueError as e:
+        raise ServiceError(f"XGuard服务返回{status}，响应无法解析: {e}")
+    if status != 200:
+        raise ServiceError(f"XGuard服务返回{status}: {result.get('error', '')}")
+    return result
+
+
+def request_policy(socket_path=None, url=DEFAULT_URL, timeout=30.0):
+    """服务端当前判定策略的指纹（模型与阈值等配置），本地放行记录只在指纹一致时有效"""
+    status, _, data = _request('GET', '/config', socket_path=socket_path, url=url, timeout=timeout)
+    try:
+        result = _load_json(data)
+    except ValueError as e:
+        raise ServiceError(f"XGuard服务返回{status}，响应无法解析: {e}")
+    if status != 200:
+        raise ServiceError(f"XGuard服务返回{status}: {result.get('error', '')}")
+    return result.get('policy')
+
+
+def request_batch(items, socket_path=None, url=DEFAULT_URL, timeout=120.0, workspace=None):
+    """
+    一次/check-batch请求检测多个(id, 文本)，服务端按max_batch_size合批推理；
+    返回 {id: 结果dict}；条目是diff片段而非提交信息，不应用服务端的提交信息预筛
+    """
+    body = _json_body({
+        'score_only': True, 'verdict': True, 'prefilter': False, 'workspace': workspace,
+        'items': [{'id': item_id, 'message': text} for item_id, text in items],
+    })
+    status, _, data = _request('POST', '/check-batch', body, accept='application/x-ndjson',
+                               socket_path=socket_path, url=url, timeout=timeout)
+    try:
+        if status != 200:
+            result = _load_json(data)
+            raise ServiceError(f"XGuard服务返回{status}: {result.get('error', '')}")
+        results = {}
+        for line in data.decode('utf-8').splitlines():
+            if line.strip():
+                result = _load_json(line.encode('utf-8'))
+                results[result.get('id')] = result
+    except ValueError as e:
+        raise ServiceError(f"XGuard服务返回{status}，响应无法解析: {e}")
+    return results
+
+
+_COMMON_OPTIONS = {'--socket': 'socket', '--url': 'url', '--timeout': 'timeout'}
+_CHECK_OPTIONS = dict(_COMMON_OPTIONS, **{'--file': 'file'})
+_CHECK_FLAGS = {'--msgpack': 'msgpack', '--keep-comments': 'keep_comments',
+                '--fail-closed': 'fail_closed', '--quiet': 'quiet'}
+_SCAN_OPTIONS = dict(_COMMON_OPTIONS, **{'--store': 'store'})
+_SCAN_FLAGS = {'--stdin': 'stdin', '--fail-closed': 'fail_closed', '--quiet': 'quiet'}
+
+
+def _parse_args(argv, options, flags, timeout):
+    """子命令参数（手工解析，省去argparse的导入开销），无效参数抛出ValueError"""
+    args = dict.fromkeys(options.values())
+    args.update({
+        'socket': os.environ.get('XGUARD_UNIX_SOCKET'),
+        'url': os.environ.get('XGUARD_URL', DEFAULT_URL),
+        'timeout': timeout,
+    })
+    args.update(dict.fromkeys(flags.values(), False))
+    index = 0
+    while index < len(argv):
+        name, has_value, value = argv[index].partition('=')
+        if name in flags and not has_value:
+            args[flags[name]] = True
+        elif name in options:
+            if not has_value:
+                index += 1
+                if index >= len(argv):
+                    raise ValueError(f'{name} 需要参数')
+                value = argv[index]
+            args[options[name]] = value
+        else:
+            raise ValueError(f'未知参数: {argv[index]}')
+        index += 1
+    args['timeout'] = float(args['timeout'])
+    return args
+
+
+def check(argv):
+    try:
+        args = _parse_args(argv, _CHECK_OPTIONS, _CHECK_FLAGS, timeout=30.0)
+    except ValueError as e:
+        print(f'❌ xguard check: {e}', file=sys.stderr)
+        return EXIT_ERROR
+    try:
+        if args['file']:
+            with open(args['file'], 'r', encoding='utf-8', errors='replace') as f:
+                message = f.read()
+        else:
+            message = sys.stdin.read()
+    except OSError as e:
+        print(f'❌ xguard check: {e}', file=sys.stderr)
+        return EXIT_ERROR
+    if not args['keep_comments']:
+        message = strip_comments(message)
+
+    try:
+        # git在工作区根目录运行钩子，当前目录即审计日志中的工作区
+        result = request_check(message, args['socket'], args['url'], args['timeout'], args['msgpack'], os.getcwd())
+    except ServiceError as e:
+        if args['fail_closed']:
+            print(f'❌ XGuard: {e}', file=sys.stderr)
+            return EXIT_ERROR
+        print(f'⚠️  XGuard: {e}，已跳过检测', file=sys.stderr)
+        return EXIT_OK
+
+    verdict = result.get('verdict', {})
+    if verdict.get('blocked'):
+        print('🚫 XGuard: 提交信息可能包含敏感内容，已拦截', file=sys.stderr)
+        for risk in verdict.get('high_risks', []):
+            print(f"   - {risk['category']}: {risk['score']:.2%}", file=sys.stderr)
+        for hit in result.get('detector_hits', []):
+            print(f"   - {hit.get('rule')} [{hit.get('start')}:{hit.get('end')}]", file=sys.stderr)
+        print('   确认安全可使用 git commit --no-verify 跳过检测', file=sys.stderr)
+        return EXIT_BLOCKED
+    if not args['quiet']:
+        print(f"✅ XGuard: 安全分 {result.get('safe_score', 1.0):.0%}", file=sys.stderr)
+    return EXIT_OK
+
+
+def _git(*args):
+    import subprocess
+    return subprocess.run(['git', *args], capture_output=True, check=True).stdout.decode('utf-8', 'surrogateescape')
+
+
+def _default_store_path():
+    """仓库内为.git/xguard/cleared-hunks（工作树之间共享），不在仓库中时使用用户缓存目录"""
+    import subprocess
+    try:
+        return os.path.abspath(_git('rev-parse', '--git-common-dir').strip() + '/xguard/cleared-hunks')
+    except (OSError, subprocess.CalledProcessError):
+        cache = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+        return os.path.join(cache, 'xguard', 'cleared-hunks')
+
+
+def scan(argv):
+    import subprocess
+    from diff_scan import parse_diff, unique_hunks, ClearedStore
+
+    try:
+        args = _parse_args(argv, _SCAN_OPTIONS, _SCAN_FLAGS, timeout=120.0)
+    except ValueError as e:
+        print(f'❌ xguard scan: {e}', file=sys.stderr)
+        return EXIT_ERROR
+    try:
+        if args['stdin']:
+            diff = sys.stdin.read()
+        else:
+            diff = _git('diff', '--cached', '--no-color', '--no-ext-diff', '--unified=0', '--diff-filter=d')
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f'❌ xguard scan: 无法获取暂存区diff: {e}', file=sys.stderr)
+        return EXIT_ERROR
+
+    hunks = parse_diff(diff)
+    unique = unique_hunks(hunks)
+    if not unique:
+        return EXIT_OK
+    store = ClearedStore(args['store'] or _default_store_path()).load()
+
+    try:
+        policy = request_policy(args['socket'], args['url'], args['timeout'])
+        cleared = store.cleared(policy)
+        pending = [hunk for hunk in unique if hunk.digest not in cleared]
+        results = request_batch(
+            [(hunk.digest, hunk.text) for hunk in pending], args['socket'], args['url'], args['timeout'], os.getcwd()
+        ) if pending else {}
+    except ServiceError as e:
+        if args['fail_closed']:
+            print(f'❌ XGuard: {e}', file=sys.stderr)
+            return EXIT_ERROR
+        print(f'⚠️  XGuard: {e}，已跳过检测', file=sys.stderr)
+        return EXIT_OK
+
+    blocked, failed, passed = [], [], []
+    for hunk in pending:
+        result = results.get(hunk.digest)
+        if result is None or 'error' in result or 'verdict' not in result:
+            failed.append(hunk)
+        elif result['verdict'].get('blocked'):
+            blocked.append((hunk, result))
+        elif result.get('decided_by') != 'prefilter':
+            # 不支持prefilter选项的旧服务仍可能预筛，未经评分的段不记为已放行
+            passed.append(hunk.digest)
+    try:
+        store.add(policy, passed)
+    except OSError as e:
+        print(f'⚠️  XGuard: 无法写入放行记录 {store.path}: {e}', file=sys.stderr)
+
+    if blocked:
+        print(f'🚫 XGuard: {len(blocked)} 处改动可能包含敏感内容，已拦截', file=sys.stderr)
+        for hunk, result in blocked:
+            risks = ', '.join(f"{risk['category']} {risk['score']:.2%}" for risk in result['verdict']['high_risks'])
+            print(f'   {hunk.path}:{hunk.line}  {risks}', file=sys.stderr)
+            for hit in result.get('detector_hits', []):
+                print(f"     - {hit.get('rule')} 第{hunk.line_of(hit.get('start', 0))}行", file=sys.stderr)
+        print('   确认安全可使用 git commit --no-verify 跳过检测', file=sys.stderr)
+        return EXIT_BLOCKED
+    if failed:
+        message = f'{len(failed)} 处改动检测失败（首个: {failed[0].path}:{failed[0].line}）'
+        if args['fail_closed']:
+            print(f'❌ XGuard: {message}', file=sys.stderr)
+            return EXIT_ERROR
+        print(f'⚠️  XGuard: {message}，已跳过', file=sys.stderr)
+    if not args['quiet']:
+        print(f'✅ XGuard: {len(unique)} 处改动，检测 {len(pending)} 处，'
+              f'{len(unique) - len(pending)} 处此前已放行', file=sys.stderr)
+    return EXIT_OK
+
+
+def install_hook(argv):
+    """在当前git仓库写入commit-msg（或pre-commit）钩子；已有非XGuard钩子时不覆盖"""
+    import argparse
+    import subprocess
+    parser = argparse.ArgumentParser(prog='xguard install-hook', description='安装git钩子')
+    parser.add_argument('--pre-commit', action='store_true', help='安装检测暂存区改动的pre-commit钩子')
+    parser.add_argument('--force', action='store_true', help='覆盖已有的同名钩子')
+    args = parser.parse_args(argv)
+    hook = 'pre-commit' if args.pre_commit else 'commit-msg'
+    description, command = _HOOKS[hook]
+
+    try:
+        hooks_dir = subprocess.check_output(['git', 'rev-parse', '--git-path', 'hooks'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        print('❌ 当前目录不是git仓库', file=sys.stderr)
+        return EXIT_ERROR
+    path = os.path.join(hooks_dir, hook)
+    if os.path.exists(path) and not args.force:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            if 'xguard install-hook' not in f.read():
+                print(f'❌ 已存在{hook}钩子: {path}（使用--force覆盖）', file=sys.stderr)
+                return EXIT_ERROR
+    os.makedirs(hooks_dir, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(_HOOK_TEMPLATE.format(description=description, command=command, python=sys.executable,
+                                      directory=os.path.dirname(os.path.abspath(__file__))))
+    os.chmod(path, 0o755)
+    print(f'✅ 已安装{hook}钩子: {path}')
+    return EXIT_OK
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    commands = {'check': check, 'scan': scan, 'install-hook': install_hook}
+    if not argv or argv[0] in ('-h', '--help') or argv[0] not in commands:
+        print(__doc__.strip(), file=sys.stderr)
+        return EXIT_OK if argv and argv[0] in ('-h', '--help') else EXIT_ERROR
+    return commands[argv[0]](argv[1:])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,11 +7,31 @@ XGuard本地服务 - 提供HTTP API接口供VSCode插件调用
 import os
 import sys
 import json
+import queue
+import math
+import hashlib
+import time
+import atexit
 import logging
-import torch
-from flask import Flask, request, jsonify
-from modelscope import AutoModelForCausalLM, AutoTokenizer
-from threading import Lock
+from contextlib import contextmanager
+from flask import Flask, Response, request, jsonify, stream_with_context
+from threading import Lock, Thread, Event
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait, FIRST_COMPLETED
+from batching import MicroBatcher, QueueFullError, DeadlineExceededError
+from verdict_cache import VerdictCache, make_cache_key
+from prefilter import Prefilter
+from secret_detector import SecretDetector
+from chunking import split_windows, aggregate_windows
+from config import ConfigStore
+from thresholds import high_risk_categories
+from cascade import first_tier_decision, UNCERTAIN
+from model_artifacts import ArtifactError
+from audit_log import AuditLog, check_event, bypass_event, parse_time, query as query_audit
+import wire
+import metrics
+
+# 以脚本方式运行时同样注册为xguard_service模块，供async_server等模块导入同一份全局状态
+sys.modules.setdefault('xguard_service', sys.modules[__name__])
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -20,241 +40,998 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 model_lock = Lock()
 
-# 全局模型实例（单例）
-_model = None
+# 全局推理后端实例（单例），backends.InferenceBackend
+_backend = None
 _tokenizer = None
+_batcher = None
+_batcher_lock = Lock()
+_model_load_lock = Lock()
+_config_store = None
+# 配置存储单独加锁：get_batcher()等在持有_batcher_lock时仍会读取配置
+_config_store_lock = Lock()
+_model_identity = None
+_verdict_cache = None
+_prefilter = None
+_secret_detector = None
+_worker_pool = None
+_audit_log = None
+# 级联的第一级模型（推理后端）与其调度器，cascade_enabled时加载
+_cascade_backend = None
+_cascade_batcher = None
+cascade_lock = Lock()
 
-def infer(model, tokenizer, messages, policy=None, max_new_tokens=500, reason_first=False):
-    """从example.ipynb复制的推理函数"""
-    rendered_query = tokenizer.apply_chat_template(messages, policy=policy, reason_first=reason_first, tokenize=False)
-    
-    model_inputs = tokenizer([rendered_query], return_tensors="pt").to(model.device)
-    
-    outputs = model.generate(**model_inputs, max_new_tokens=max_new_tokens, do_sample=False, output_scores=True, return_dict_in_generate=True)
+# 模型加载状态：not_loaded → loading → warming_up → ready（或failed），phases为各阶段耗时
+_readiness = {"state": "not_loaded", "phases": {}, "error": None, "load_seconds": None}
 
-    batch_idx = 0
-    input_length = model_inputs['input_ids'].shape[1]
+# reason_first=False时风险token位于生成位置0，仅需解码1步即可得到判定结果
+SCORE_ONLY_MAX_NEW_TOKENS = 1
 
-    output_ids = outputs["sequences"].tolist()[batch_idx][input_length:]
-    response = tokenizer.decode(output_ids, skip_special_tokens=True)
-    
-    ### parse score ###
-    generated_tokens_with_probs = []
-
-    generated_tokens = outputs.sequences[:, input_length:]
-
-    scores = torch.stack(outputs.scores, 1)
-    scores = scores.softmax(-1)
-    scores_topk_value, scores_topk_index = scores.topk(k=10, dim=-1)
-
-    for generated_token, score_topk_value, score_topk_index in zip(generated_tokens, scores_topk_value, scores_topk_index):
-        generated_tokens_with_prob = []
-        for token, topk_value, topk_index in zip(generated_token, score_topk_value, score_topk_index):
-            token = int(token.cpu())
-            if token == tokenizer.pad_token_id:
-                continue
-            
-            res_topk_score = {}
-            for ii, (value, index) in enumerate(zip(topk_value, topk_index)):
-                if ii == 0 or value.cpu().numpy() > 1e-4:
-                    text = tokenizer.decode(index.cpu().numpy())
-                    res_topk_score[text] = {
-                        "id": str(int(index.cpu().numpy())),
-                        "prob": round(float(value.cpu().numpy()), 4),
-                    }
-
-            generated_tokens_with_prob.append(res_topk_score)
-        
-        generated_tokens_with_probs.append(generated_tokens_with_prob)
+def get_config_store():
+    """获取配置存储（首次调用时查找配置文件）"""
+    global _config_store
+    if _config_store is None:
+        with _config_store_lock:
+            if _config_store is None:
+                _config_store = ConfigStore()
+    return _config_store
 
-    score_idx = max(len(generated_tokens_with_probs[batch_idx])-2, 0) if reason_first else 0
-    id2risk = tokenizer.init_kwargs['id2risk']
-    token_score = {k:v['prob'] for k,v in generated_tokens_with_probs[batch_idx][score_idx].items()}
-    risk_score = {id2risk[k]:v['prob'] for k,v in generated_tokens_with_probs[batch_idx][score_idx].items() if k in id2risk}
+def get_service_config():
+    """当前服务配置的只读快照，配置文件修改后自动更新"""
+    return get_config_store().get()
 
-    result = {
-        'response': response,
-        'token_score': token_score,
-        'risk_score': risk_score,
-    }
+def model_loaded():
+    """模型（或推理进程池）是否已加载"""
+    return _backend is not None or _worker_pool is not None
 
-    return result
+@contextmanager
+def _load_phase(name):
+    """记录一个加载阶段的耗时（秒），供/ready展示"""
+    started = time.monotonic()
+    yield
+    _readiness['phases'][name] = round(time.monotonic() - started, 3)
 
-def get_config_file_path():
-    """获取配置文件路径，按优先级查找"""
-    # 1. 当前工作目录下的 .xguard-config.json
-    current_dir_config = os.path.join(os.getcwd(), '.xguard-config.json')
-    if os.path.exists(current_dir_config):
-        return current_dir_config
-    
-    # 2. 服务器脚本所在目录下的 .xguard-config.json
-    server_dir = os.path.dirname(os.path.abspath(__file__))
-    server_config = os.path.join(server_dir, '.xguard-config.json')
-    if os.path.exists(server_config):
-        return server_config
+def load_model():
+    """
+    加载XGuard模型（仅加载一次）并执行预热推理；worker_processes>0时只加载tokenizer并启动推理进程池
+    torch/modelscope在此时才导入，服务进程启动后/health无需等待这些重量级依赖
+    """
+    with _model_load_lock:
+        if model_loaded():
+            return
+        _readiness.update(state='loading', error=None, phases={})
+        started = time.monotonic()
+        try:
+            if get_service_config()['worker_processes'] > 0:
+                _start_worker_pool()
+            else:
+                _load_local_model()
+            if get_service_config()['cascade_enabled']:
+                with _load_phase('cascade'):
+                    _load_cascade_model()
+        except Exception as e:
+            _readiness.update(state='failed', error=str(e))
+            raise
+        _readiness.update(state='ready', load_seconds=round(time.monotonic() - started, 3))
+        logger.info(f"XGuard模型已就绪 - 各阶段耗时: {_readiness['phases']}")
+
+def _load_local_model():
+    global _backend, _tokenizer
+    logger.info("正在加载XGuard本地模型...")
+    try:
+        with _load_phase('import'):
+            from modelscope import AutoTokenizer
+            from backends import load_backend
+            from model_artifacts import check_model_dir, load_token_table
+        
+        # 从配置文件或环境变量获取模型路径
+        config = get_service_config()
+        tokenizer_path = config['tokenizer_path']
+        model_path = config['model_path']
+        
+        logger.info(f"使用模型路径: {model_path} (precision={config['precision']}, backend={config['inference_backend']})")
+        logger.info(f"使用tokenizer路径: {tokenizer_path}")
+        
+        # model_artifacts.py prepare生成的目录先校验清单，损坏或与配置不匹配时拒绝加载
+        with _load_phase('verify'):
+            manifest = check_model_dir(model_path, config['precision'], config['model_verify'])
+        with _load_phase('tokenizer'):
+            tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+        if manifest is not None:
+            with _load_phase('token_table'):
+                load_token_table(model_path, tokenizer)
+        with _load_phase('model'):
+            backend = load_backend(config['inference_backend'], model_path, tokenizer, config['precision'],
+                                   config['onnx_cache_dir'])
+        _tokenizer = tokenizer
+        _backend = backend
+        metrics.MODEL_MEMORY_BYTES.set(backend.memory_bytes())
+        logger.info("XGuard本地模型加载完成")
+    except ArtifactError as e:
+        logger.error(f"模型产物校验失败: {e}")
+        raise
+    except Exception as e:
+        logger.error(f"本地模型加载失败: {e}")
+        raise RuntimeError("无法加载XGuard本地模型，请确保local_model和local_tokenizer目录存在")
     
-    # 3. 项目根目录下的 .xguard-config.json (相对于server目录的上一级)
-    project_root = os.path.dirname(server_dir)
-    project_config = os.path.join(project_root, '.xguard-config.json')
-    if os.path.exists(project_config):
-        return project_config
+    if config['warmup_enabled']:
+        _readiness['state'] = 'warming_up'
+        with _load_phase('warmup'):
+            warm_up()
+
+def _load_cascade_model():
+    """加载级联的第一级小模型，其id2risk标签空间须与主模型一致"""
+    global _cascade_backend
+    from modelscope import AutoTokenizer
+    from backends import load_backend
+    from model_artifacts import check_model_dir, load_token_table
+
+    config = get_service_config()
+    if not config['cascade_model_path']:
+        raise RuntimeError("cascade_enabled为true时需配置cascade_model_path")
+    logger.info(f"正在加载级联第一级模型: {config['cascade_model_path']}")
+    manifest = check_model_dir(config['cascade_model_path'], config['precision'], config['model_verify'])
+    tokenizer = AutoTokenizer.from_pretrained(config['cascade_tokenizer_path'] or config['tokenizer_path'])
+    if manifest is not None:
+        load_token_table(config['cascade_model_path'], tokenizer)
+    labels = set(tokenizer.init_kwargs.get('id2risk', {}).values())
+    if labels != set(_tokenizer.init_kwargs.get('id2risk', {}).values()):
+        raise RuntimeError("级联第一级模型的id2risk标签空间与主模型不一致")
+    _cascade_backend = load_backend(config['inference_backend'], config['cascade_model_path'], tokenizer,
+                                    config['precision'], config['onnx_cache_dir'])
+    logger.info(f"级联第一级模型加载完成 - uncertainty_band={config['cascade_uncertainty_band']}")
+
+def warm_up():
+    """
+    预热推理：触发首次调用的算子初始化，并提前构建评分token表与前缀KV，
+    避免重启后第一个真实请求承担这些开销。
+    生成2个token，使prefill与逐token解码两种形状都完成初始化（compile后端在此时编译）
+    """
+    with model_lock:
+        _infer_with_loaded_model(
+            [[{"role": "user", "content": "XGuard warm-up"}]],
+            max_new_tokens=2,
+            reason_first=False
+        )
+
+def _start_worker_pool():
+    """多进程模式：父进程只需tokenizer（分块、缓存键），模型副本由推理进程各自加载并预热"""
+    global _tokenizer, _worker_pool
+    config = get_service_config()
+    logger.info(f"正在启动推理进程池 - worker_processes={config['worker_processes']}")
+    try:
+        with _load_phase('import'):
+            from modelscope import AutoTokenizer
+            from worker_pool import WorkerPool
+            from model_artifacts import check_model_dir
+        # 父进程先校验一次，推理进程按校验记录只需检查文件大小与mtime
+        with _load_phase('verify'):
+            check_model_dir(config['model_path'], config['precision'], config['model_verify'])
+        with _load_phase('tokenizer'):
+            _tokenizer = AutoTokenizer.from_pretrained(config['tokenizer_path'])
+        if config['inference_backend'] == 'onnx':
+            # 由父进程先完成一次导出，避免各推理进程同时导出同一个模型
+            with _load_phase('export'):
+                from backends import ensure_onnx_export
+                ensure_onnx_export(config['model_path'], config['onnx_cache_dir'])
+        with _load_phase('workers'):
+            _worker_pool = WorkerPool(
+                config.to_dict(),
+                config['worker_processes'],
+                threads_per_worker=config['worker_threads'],
+                max_batch_size=config['max_batch_size']
+            )
+    except ArtifactError as e:
+        logger.error(f"模型产物校验失败: {e}")
+        raise
+    except Exception as e:
+        logger.error(f"推理进程池启动失败: {e}")
+        raise RuntimeError("无法启动XGuard推理进程池，请确保local_model和local_tokenizer目录存在")
+    atexit.register(_worker_pool.close)
+
+def preload_in_background():
+    """后台线程中加载并预热模型，服务可立即响应/health与/ready"""
+    def preload():
+        try:
+            load_model()
+        except Exception as e:
+            logger.error(f"模型预加载失败: {e}")
     
-    return None
+    thread = Thread(target=preload, name='xguard-preload', daemon=True)
+    thread.start()
+    return thread
+
+def _infer_with_loaded_model(batch_messages, stats=None, **kwargs):
+    """供微批调度器调用的批量推理入口，同时记录阶段耗时与token数指标"""
+    stats = {} if stats is None else stats
+    if _worker_pool is not None:
+        results = _worker_pool.infer_batch(batch_messages, stats=stats, **kwargs)
+    else:
+        results = _backend.infer_batch(batch_messages, stats=stats,
+                                       use_prefix_cache=get_service_config()['prefix_cache_enabled'], **kwargs)
+    metrics.observe_inference(stats, len(batch_messages))
+    return results
+
+def get_batcher():
+    """获取微批调度器（首次调用时创建）"""
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                config = get_service_config()
+                # 多进程模式下每个推理进程各自串行，调度线程数与进程数一致且无需全局锁
+                workers = config['worker_processes']
+                _batcher = MicroBatcher(
+                    _infer_with_loaded_model,
+                    max_batch_size=config['max_batch_size'],
+                    batch_window_ms=config['batch_window_ms'],
+                    lock=None if workers > 0 else model_lock,
+                    max_queue_depth=config['max_queue_depth'],
+                    concurrency=max(1, workers)
+                )
+                logger.info(f"微批调度器已启动 - max_batch_size={config['max_batch_size']}, "
+                            f"batch_window_ms={config['batch_window_ms']}, max_queue_depth={config['max_queue_depth']}")
+    return _batcher
+
+def _infer_first_tier(batch_messages, stats=None, **kwargs):
+    """级联第一级模型的批量推理入口"""
+    return _cascade_backend.infer_batch(batch_messages, stats=stats,
+                                        use_prefix_cache=get_service_config()['prefix_cache_enabled'], **kwargs)
+
+def cascade_active():
+    return _cascade_backend is not None and get_service_config()['cascade_enabled']
+
+def get_cascade_batcher():
+    """获取第一级模型的微批调度器（首次调用时创建），与主模型的调度器互不阻塞"""
+    global _cascade_batcher
+    if _cascade_batcher is None:
+        with _batcher_lock:
+            if _cascade_batcher is None:
+                config = get_service_config()
+                _cascade_batcher = MicroBatcher(
+                    _infer_first_tier,
+                    max_batch_size=config['max_batch_size'],
+                    batch_window_ms=config['batch_window_ms'],
+                    lock=cascade_lock,
+                    max_queue_depth=config['max_queue_depth']
+                )
+    return _cascade_batcher
+
+def first_tier_verdict(windows, results, score_only=False):
+    """
+    由第一级模型的各窗口结果判定：分数明确时返回(标注decided_by为tier1的结果, None)，
+    落在阈值附近的不确定区间时返回(None, 第一级risk_scores)，需交给完整模型
+    """
+    config = get_service_config()
+    result = build_result(windows, results, score_only)
+    decision = first_tier_decision(result['risk_scores'], config['risk_thresholds'], config['cascade_uncertainty_band'])
+    if decision == UNCERTAIN:
+        return None, result['risk_scores']
+    return dict(result, decided_by='tier1'), None
+
+def escalated_result(result, first_scores):
+    """完整模型的结果，附带第一级分数供排查"""
+    return dict(result, decided_by='model', escalated=True, tier1_risk_scores=first_scores)
+
+def get_verdict_cache():
+    """获取检测结果缓存（首次调用时创建），cache_enabled为false时返回None"""
+    global _verdict_cache
+    config = get_service_config()
+    if _verdict_cache is None and config['cache_enabled']:
+        with _batcher_lock:
+            if _verdict_cache is None:
+                _verdict_cache = VerdictCache(
+                    max_entries=config['cache_max_entries'],
+                    db_path=config['cache_db_path']
+                )
+    return _verdict_cache
 
-def load_model_config():
-    """从配置文件加载模型配置"""
-    config = {
-        'model_path': None,
-        'tokenizer_path': None
+def get_audit_log():
+    """获取审计日志写入器（首次调用时创建），audit_log_enabled为false时返回None"""
+    global _audit_log
+    config = get_service_config()
+    if not config['audit_log_enabled']:
+        return None
+    if _audit_log is None:
+        with _batcher_lock:
+            if _audit_log is None:
+                _audit_log = AuditLog(
+                    config['audit_log_dir'],
+                    max_bytes=int(config['audit_log_max_mb'] * 1024 * 1024),
+                    rotate_seconds=config['audit_log_rotate_hours'] * 3600,
+                    keep_files=config['audit_log_keep_files']
+                )
+                atexit.register(_audit_log.close)
+    return _audit_log
+
+def audit_check(text, result, source, workspace=None):
+    """检测结果交给审计日志（只入队，不等待写入）"""
+    audit = get_audit_log()
+    if audit is not None:
+        audit.record(check_event(text, result, get_service_config()['risk_thresholds'], source, workspace))
+
+def get_prefilter():
+    """获取预筛引擎，配置中的规则变化时才重新编译"""
+    global _prefilter
+    config = get_service_config()
+    if _prefilter is None:
+        with _batcher_lock:
+            if _prefilter is None:
+                _prefilter = Prefilter(config['skip_patterns'], config['min_length'])
+    else:
+        _prefilter.update(config['skip_patterns'], config['min_length'])
+    return _prefilter
+
+def prefilter_result(text):
+    """预筛命中时返回跳过推理的安全结果，未命中或预筛关闭时返回None"""
+    if not get_service_config()['prefilter_enabled']:
+        return None
+    verdict = get_prefilter().check(text)
+    if not verdict.skipped:
+        return None
+    return {
+        "risk_scores": {"Safe-Safe": 1.0},
+        "explanation": f"Skipped by prefilter rule {verdict.rule}.",
+        "safe_score": 1.0,
+        "skipped": True,
+        "prefilter_rule": verdict.rule
+    }
+
+def get_secret_detector():
+    """获取敏感信息检测器（首次调用时构建自动机）"""
+    global _secret_detector
+    if _secret_detector is None:
+        with _batcher_lock:
+            if _secret_detector is None:
+                _secret_detector = SecretDetector()
+    return _secret_detector
+
+def detector_result(hits):
+    """由检测器命中构造与模型同格式的判定结果"""
+    risk_scores = SecretDetector.risk_scores(hits)
+    rules = ', '.join(f"{hit.rule}[{hit.start}:{hit.end}]" for hit in hits)
+    return {
+        "risk_scores": risk_scores,
+        "explanation": f"Deterministic secret detector matched: {rules}.",
+        "safe_score": risk_scores.get('Safe-Safe', 1.0),
+        "decided_by": "secret_detector",
+        "detector_hits": [hit.to_dict() for hit in hits]
     }
+
+def run_prechecks(text, prefilter=True):
+    """
+    推理前的确定性检查，返回(可直接返回的结果或None, 检测器命中列表)
+    检测器先于预筛执行，避免"fix: ..."之类的消息携带密钥却被skip_patterns放行；
+    prefilter为False时不应用针对提交信息的min_length/skip_patterns（如文件内容、diff片段）
+    """
+    config = get_service_config()
+    hits = []
+    if config['secret_detector_enabled']:
+        hits = get_secret_detector().scan(text)
+        confident = [hit for hit in hits if hit.confidence >= config['secret_detector_confidence']]
+        if confident:
+            return detector_result(confident), hits
     
-    # 首先尝试从环境变量获取
-    config['model_path'] = os.environ.get('XGUARD_MODEL_PATH')
-    config['tokenizer_path'] = os.environ.get('XGUARD_TOKENIZER_PATH')
+    # 存在低置信度命中时不预筛，交给模型判断
+    if not hits:
+        skipped = prefilter_result(text) if prefilter else None
+        if skipped is not None:
+            return skipped, hits
+        if config['secret_detector_enabled'] and not config['secret_detector_pass_to_model']:
+            return {
+                "risk_scores": {"Safe-Safe": 1.0},
+                "explanation": "No match from deterministic secret detector.",
+                "safe_score": 1.0,
+                "decided_by": "secret_detector"
+            }, hits
+    return None, hits
+
+class InvalidRequestError(ValueError):
+    """请求体不是JSON对象或字段类型、取值无效，响应400"""
+
+def request_message(data):
+    """检测请求体中的message；请求体不是对象或message不是字符串时抛出InvalidRequestError"""
+    if not isinstance(data, dict):
+        raise InvalidRequestError("请求体应为JSON对象")
+    message = data.get('message', '')
+    if not isinstance(message, str):
+        raise InvalidRequestError("message必须是字符串")
+    return message
+
+def request_deadline(data):
+    """
+    请求的截止时间（time.monotonic()时间戳）：请求体timeout_seconds优先，否则取配置；0表示不限时
+    timeout_seconds不是有限的非负数时抛出InvalidRequestError
+    """
+    timeout = data.get('timeout_seconds') if isinstance(data, dict) else None
+    if timeout is None:
+        timeout = get_service_config()['timeout_seconds']
+    elif isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or not math.isfinite(timeout) or timeout < 0:
+        raise InvalidRequestError("timeout_seconds必须是非负数")
+    return time.monotonic() + float(timeout) if timeout > 0 else None
+
+def check_text(text, score_only=False, deadline=None, prefilter=True):
+    """完整检测流程：空文本 → 敏感信息检测器 → 预筛（prefilter为False时跳过） → 缓存/模型推理"""
+    with metrics.track_check() as outcome:
+        if not text.strip():
+            outcome['decided_by'] = 'empty'
+            return empty_message_result()
+        
+        result, hits = run_prechecks(text, prefilter)
+        if result is not None:
+            outcome['decided_by'] = result.get('decided_by', 'prefilter')
+            return result
+        
+        if not model_loaded():
+            load_model()
+        result = check_text_cached(text, score_only, deadline)
+        outcome['decided_by'] = result.get('decided_by', 'model')
+        return attach_detector_hits(result, hits)
+
+def attach_detector_hits(result, hits):
+    """把检测器的低置信度命中附加到模型结果上（不修改缓存中的原对象）"""
+    if hits:
+        result = dict(result, detector_hits=[hit.to_dict() for hit in hits])
+    return result
+
+def model_identity():
+    """
+    模型标识，作为缓存键的一部分，切换模型或精度模式后旧结果自然失效
+    首次调用后固定：这些配置需重启才生效，热加载修改不应改变当前进程的缓存键
+    """
+    global _model_identity
+    if _model_identity is None:
+        config = get_service_config()
+        identity = f"{os.path.abspath(config['model_path'])}|{os.path.abspath(config['tokenizer_path'])}"
+        if config['precision'] != 'auto':
+            identity += f"|{config['precision']}"
+        if config['inference_backend'] != 'eager':
+            identity += f"|backend={config['inference_backend']}"
+        if config['cascade_enabled'] and config['cascade_model_path']:
+            identity += f"|cascade={os.path.abspath(config['cascade_model_path'])}"
+        _model_identity = identity
+    return _model_identity
+
+def submit_text(text, score_only=False, deadline=None, batcher=None):
+    """
+    将文本（超出token预算时按窗口切分）提交给微批调度器（默认为主模型的调度器），返回(windows, futures)
+    队列已满时放弃已提交的窗口并抛出QueueFullError
+    """
+    config = get_service_config()
+    max_new_tokens = SCORE_ONLY_MAX_NEW_TOKENS if score_only else 500
+    windows = split_windows(_tokenizer, text, config['chunk_max_tokens'], config['chunk_overlap_tokens'])
     
-    # 如果环境变量未设置，尝试从配置文件加载
-    if not config['model_path'] or not config['tokenizer_path']:
-        config_file = get_config_file_path()
-        if config_file:
-            try:
-                with open(config_file, 'r', encoding='utf-8') as f:
-                    user_config = json.load(f)
-                    if 'model_path' in user_config:
-                        config['model_path'] = user_config['model_path']
-                    if 'tokenizer_path' in user_config:
-                        config['tokenizer_path'] = user_config['tokenizer_path']
-            except Exception as e:
-                logger.warning(f"加载配置文件失败: {e}")
+    # 各窗口同时提交，由微批调度器合并为批次推理，延迟随批容量而非序列长度增长
+    batcher = batcher or get_batcher()
+    futures = []
+    try:
+        for window in windows:
+            futures.append(batcher.submit(
+                messages=[{"role": "user", "content": window.text}],
+                max_new_tokens=max_new_tokens,
+                reason_first=False,
+                deadline=deadline
+            ))
+    except QueueFullError:
+        for future in futures:
+            future.abandon()
+        raise
+    return windows, futures
+
+def build_result(windows, results, score_only=False):
+    """由各窗口的推理结果构造/check-commit响应格式的dict"""
+    if len(windows) == 1:
+        risk_scores = results[0].get('risk_score', {})
+        explanation = '' if score_only else results[0].get('response', '')
+        safe_score = risk_scores.get('Safe-Safe', 0)
+        
+        logger.info(f"检测完成 - Safe Score: {safe_score:.2%}")
+        
+        return {
+            "risk_scores": risk_scores,
+            "explanation": explanation,
+            "safe_score": safe_score
+        }
     
-    # 如果仍然没有设置，使用默认相对路径
-    if not config['model_path']:
-        # 默认模型路径：相对于项目根目录
-        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        config['model_path'] = os.path.join(project_root, 'local_model')
+    config = get_service_config()
+    risk_scores, sources, riskiest = aggregate_windows(
+        windows, results, mode=config['chunk_aggregation'], top_k=config['chunk_top_k']
+    )
+    safe_score = risk_scores.get('Safe-Safe', 0)
     
-    if not config['tokenizer_path']:
-        # 默认tokenizer路径：相对于项目根目录  
-        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        config['tokenizer_path'] = os.path.join(project_root, 'local_tokenizer')
+    logger.info(f"分块检测完成 - {len(windows)} 个窗口, Safe Score: {safe_score:.2%}")
     
-    return config
+    return {
+        "risk_scores": risk_scores,
+        "explanation": '' if score_only else results[riskiest].get('response', ''),
+        "safe_score": safe_score,
+        "chunks": len(windows),
+        "category_sources": sources
+    }
 
-def load_model():
-    """加载XGuard模型（仅加载一次）"""
-    global _model, _tokenizer
-    if _model is None:
-        logger.info("正在加载XGuard本地模型...")
+def _check_text(text, score_only=False, deadline=None):
+    """
+    对单条文本执行推理，返回/check-commit响应格式的dict；超出token预算的长文本分窗口检测后聚合。
+    启用级联时先由第一级模型判定，分数落在不确定区间内才交给完整模型
+    """
+    first_scores = None
+    if cascade_active():
+        windows, futures = submit_text(text, score_only, deadline, get_cascade_batcher())
+        decided, first_scores = first_tier_verdict(windows, _wait_results(futures, deadline), score_only)
+        if decided is not None:
+            return decided
+    windows, futures = submit_text(text, score_only, deadline)
+    result = build_result(windows, _wait_results(futures, deadline), score_only)
+    return result if first_scores is None else escalated_result(result, first_scores)
+
+def _wait_results(futures, deadline):
+    """按截止时间等待各窗口的推理结果"""
+    results = []
+    try:
+        for future in futures:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            results.append(future.result(timeout=remaining))
+    except FutureTimeoutError:
+        # 调用方已不再等待，让调度器在推理前丢弃或在解码中停止这些请求
+        for future in futures:
+            future.abandon()
+        raise DeadlineExceededError("检测超过截止时间")
+    return results
+
+def cache_key_for(text, score_only=False):
+    """
+    检测结果的缓存键：分窗口参数、级联不确定区间等可热加载修改且改变聚合结果的配置计入模型标识，
+    修改后（包括重启后的持久化缓存）不会再命中按旧配置得到的结果
+    """
+    return make_cache_key(
+        text,
+        f"{model_identity()}|{get_service_config().result_etag}",
+        reason_first=False,
+        max_new_tokens=SCORE_ONLY_MAX_NEW_TOKENS if score_only else 500
+    )
+
+def check_text_cached(text, score_only=False, deadline=None):
+    """带缓存的检测：相同内容直接返回历史判定，并发的相同请求只推理一次"""
+    cache = get_verdict_cache()
+    if cache is None:
+        return _check_text(text, score_only, deadline)
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    # 截止时间是各请求自己的，执行者超时后由截止时间更晚的等待者接手
+    return cache.get_or_compute(cache_key_for(text, score_only), lambda: _check_text(text, score_only, deadline),
+                                timeout=timeout, abandon_on=(DeadlineExceededError,))
+
+def verdict_policy():
+    """模型与判定相关配置的指纹，客户端据此判断本地缓存的放行记录是否仍然有效"""
+    identity = f"{model_identity()}|{get_service_config().verdict_etag}"
+    return hashlib.sha256(identity.encode('utf-8')).hexdigest()[:16]
+
+def threshold_verdict(result):
+    """按当前risk_thresholds判定是否拦截，命令行与git钩子客户端无需再获取阈值配置"""
+    risks = high_risk_categories(result.get('risk_scores', {}), get_service_config()['risk_thresholds'])
+    return {
+        "blocked": bool(risks),
+        "high_risks": [{"category": category, "score": score} for category, score in risks],
+        "policy": verdict_policy()
+    }
+
+def wire_response(payload, status=200, headers=None, media_type=wire.JSON):
+    """按客户端要求以JSON、msgpack或text/plain编码的响应"""
+    body, content_type = wire.encode(payload, media_type)
+    return Response(body, status=status, headers=headers, content_type=content_type)
+
+def verdict_event(result):
+    """流式接口的verdict事件：判定结果（不含解释）与按当前阈值的拦截结论"""
+    payload = {key: value for key, value in result.items() if key != 'explanation'}
+    payload['verdict'] = threshold_verdict(result)
+    return payload
+
+def _stream_with_model(text, hits, emit, should_stop):
+    """
+    单窗口文本在进程内流式推理：评分位置解码后立即发送verdict，随后逐段发送token，返回完整结果。
+    级联、多进程推理、长文本分块与不支持流式的推理后端（onnx）改为一次性检测后返回结果（由调用方发送）
+    """
+    config = get_service_config()
+    windows = split_windows(_tokenizer, text, config['chunk_max_tokens'], config['chunk_overlap_tokens'])
+    if _worker_pool is not None or cascade_active() or len(windows) > 1 or not _backend.supports_streaming:
+        return attach_detector_hits(check_text_cached(text), hits), False
+
+    cache = get_verdict_cache()
+    key = cache_key_for(text) if cache is not None else None
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        return attach_detector_hits(cached, hits), False
+
+    def on_scores(scored):
+        _, risk_scores = scored
+        result = {"risk_scores": risk_scores, "safe_score": risk_scores.get('Safe-Safe', 0)}
+        emit('verdict', verdict_event(attach_detector_hits(result, hits)))
+
+    stats = {}
+    with model_lock:
+        raw = _backend.infer_stream([{"role": "user", "content": text}],
+                                    use_prefix_cache=config['prefix_cache_enabled'],
+                                    should_stop=should_stop, on_scores=on_scores,
+                                    on_text=lambda chunk: emit('token', {"text": chunk}), stats=stats)
+    metrics.observe_inference(stats, 1)
+    result = build_result(windows, [raw])
+    # 客户端中途断开时解释不完整，不写入缓存
+    if cache is not None and not should_stop():
+        cache.put(key, result)
+    return attach_detector_hits(result, hits), True
+
+def stream_check(text, emit, should_stop, workspace=None):
+    """
+    流式检测流程，依次调用emit(event, payload)：
+    verdict（判定）→ token（解释文本片段，可能没有）→ done（完整结果）；出错时为error。
+    确定性检查或缓存命中时verdict与done连续发送
+    """
+    with metrics.track_check() as outcome:
         try:
-            # 从配置文件或环境变量获取模型路径
-            config = load_model_config()
-            tokenizer_path = config['tokenizer_path']
-            model_path = config['model_path']
-            
-            logger.info(f"使用模型路径: {model_path}")
-            logger.info(f"使用tokenizer路径: {tokenizer_path}")
-            
-            _tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
-            _model = AutoModelForCausalLM.from_pretrained(
-                model_path, 
-                torch_dtype="auto", 
-                device_map="auto"
-            ).eval()
-            logger.info("XGuard本地模型加载完成")
+            if not text.strip():
+                outcome['decided_by'] = 'empty'
+                result, streamed = empty_message_result(), False
+            else:
+                result, hits = run_prechecks(text)
+                streamed = False
+                if result is not None:
+                    outcome['decided_by'] = result.get('decided_by', 'prefilter')
+                else:
+                    if not model_loaded():
+                        load_model()
+                    result, streamed = _stream_with_model(text, hits, emit, should_stop)
+                    outcome['decided_by'] = result.get('decided_by', 'model')
+            audit_check(text, result, 'check-commit-stream', workspace)
+            if not streamed:
+                emit('verdict', verdict_event(result))
+            emit('done', result)
         except Exception as e:
-            logger.error(f"本地模型加载失败: {e}")
-            raise RuntimeError("无法加载XGuard本地模型，请确保local_model和local_tokenizer目录存在")
+            logger.error(f"流式检测过程中发生错误: {e}")
+            status, _ = error_status(e)
+            audit_check(text, error_result(e), 'check-commit-stream', workspace)
+            emit('error', dict(error_result(e), status=status))
+            raise
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def empty_message_result():
+    """空文本直接判定为安全"""
+    return {
+        "risk_scores": {"Safe-Safe": 1.0},
+        "explanation": "Empty message is considered safe.",
+        "safe_score": 1.0
+    }
+
+def error_result(e):
+    """检测出错时的响应格式"""
+    return {
+        "error": str(e),
+        "risk_scores": {"Safe-Safe": 0.5},
+        "explanation": "Error occurred during analysis.",
+        "safe_score": 0.5
+    }
+
+def error_status(e):
+    """异常对应的HTTP状态码与额外响应头"""
+    if isinstance(e, QueueFullError):
+        return 429, {"Retry-After": str(e.retry_after)}
+    if isinstance(e, (DeadlineExceededError, FutureTimeoutError)):
+        return 504, {}
+    return 500, {}
+
+def health_status():
+    """健康检查内容（存活探测，不依赖模型是否加载）"""
+    status = {"status": "healthy", "model_loaded": model_loaded(), "ready": _readiness['state'] == 'ready'}
+    if _batcher is not None:
+        status["queue_depth"] = _batcher.depth
+        status["dropped_requests"] = _batcher.dropped
+    if _worker_pool is not None:
+        status["workers"] = _worker_pool.status()
+    return status
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """健康检查端点"""
-    return jsonify({"status": "healthy", "model_loaded": _model is not None})
+    return jsonify(health_status())
+
+def readiness_status():
+    """就绪状态：加载阶段、各阶段耗时、推理后端及失败原因"""
+    return dict(_readiness, ready=_readiness['state'] == 'ready', phases=dict(_readiness['phases']),
+                backend=get_service_config()['inference_backend'])
+
+@app.route('/ready', methods=['GET'])
+def ready_check():
+    """就绪检查端点：模型加载并预热完成前返回503"""
+    status = readiness_status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+def _cache_stat(name):
+    def read():
+        return _verdict_cache.stats()[name] if _verdict_cache is not None else None
+    return read
+
+# 由服务状态现取值的指标
+metrics.REGISTRY.register(metrics.Gauge(
+    'xguard_model_ready', '模型是否已加载并预热完成', callback=lambda: int(_readiness['state'] == 'ready')))
+metrics.REGISTRY.register(metrics.Gauge(
+    'xguard_model_load_seconds', '模型加载各阶段耗时', labelnames=('phase',),
+    callback=lambda: dict(_readiness['phases'])))
+metrics.REGISTRY.register(metrics.Gauge(
+    'xguard_queue_depth', '推理等待队列中的请求数', callback=lambda: _batcher.depth if _batcher is not None else 0))
+metrics.REGISTRY.register(metrics.Counter(
+    'xguard_dropped_requests_total', '超时或被放弃而未完成推理的请求数',
+    callback=lambda: _batcher.dropped if _batcher is not None else 0))
+metrics.REGISTRY.register(metrics.Counter(
+    'xguard_config_reloads_total', '配置文件变化后重新加载的次数', callback=lambda: get_config_store().reloads))
+metrics.REGISTRY.register(metrics.Counter(
+    'xguard_cache_hits_total', '检测结果缓存命中次数', callback=_cache_stat('hits')))
+metrics.REGISTRY.register(metrics.Counter(
+    'xguard_cache_misses_total', '检测结果缓存未命中次数', callback=_cache_stat('misses')))
+metrics.REGISTRY.register(metrics.Counter(
+    'xguard_cache_coalesced_total', '与进行中的相同请求合并的次数', callback=_cache_stat('coalesced')))
+metrics.REGISTRY.register(metrics.Counter(
+    'xguard_audit_events_total', '已写入审计日志的事件数',
+    callback=lambda: _audit_log.written if _audit_log is not None else 0))
+metrics.REGISTRY.register(metrics.Counter(
+    'xguard_audit_dropped_total', '审计队列已满或写入失败而丢弃的事件数',
+    callback=lambda: _audit_log.dropped + _audit_log.failed if _audit_log is not None else 0))
+metrics.REGISTRY.register(metrics.Gauge(
+    'xguard_audit_queue_depth', '等待写入审计日志的事件数',
+    callback=lambda: _audit_log.depth if _audit_log is not None else 0))
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus文本格式的运行指标"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/check-commit', methods=['POST'])
 def check_commit_message():
     """
     检测Commit Message安全性
-    请求体: {"message": "commit message text"}
-    响应: XGuard原生输出格式
+    请求体: {"message": "commit message text", "score_only": false, "verdict": false, "workspace": "/path"}
+    响应: XGuard原生输出格式；score_only为true时只解码风险token，explanation为空；
+    verdict为true时附带按当前risk_thresholds的拦截判定；workspace只用于审计日志
+    请求体与响应均可使用msgpack（Content-Type/Accept: application/msgpack）；
+    也可使用text/plain：请求体即message，其余字段取查询参数，响应为wire.encode_text()的逐行格式
     """
-    if _model is None:
-        load_model()
-    
-    data = request.get_json()
-    commit_message = data.get('message', '')
-    
-    if not commit_message.strip():
-        return jsonify({
-            "risk_scores": {"Safe-Safe": 1.0},
-            "explanation": "Empty message is considered safe.",
-            "safe_score": 1.0
-        })
+    media_type = wire.response_type(request.headers.get('Accept'))
+    if wire.is_msgpack(request.content_type) or wire.is_text(request.content_type):
+        try:
+            data = wire.decode(request.get_data(), request.content_type, request.query_string.decode('latin-1'))
+        except wire.UnsupportedMediaTypeError as e:
+            return wire_response({"error": str(e)}, 415, media_type=media_type)
+        except ValueError:
+            return wire_response({"error": "请求体或查询参数无法解码"}, 400, media_type=media_type)
+    else:
+        data = request.get_json(silent=True)
+    try:
+        commit_message = request_message(data)
+        deadline = request_deadline(data)
+    except InvalidRequestError as e:
+        return wire_response({"error": str(e)}, 400, media_type=media_type)
+    score_only = bool(data.get('score_only', get_service_config()['score_only']))
     
     try:
-        with model_lock:  # 确保线程安全
-            # 使用与example.ipynb完全一致的推理方式
-            result = infer(
-                _model,
-                _tokenizer,
-                messages=[{"role": "user", "content": commit_message}],
-                max_new_tokens=500,
-                reason_first=False
-            )
-        
-        risk_scores = result.get('risk_score', {})
-        explanation = result.get('response', '')
-        safe_score = risk_scores.get('Safe-Safe', 0)
-        
-        logger.info(f"检测完成 - Safe Score: {safe_score:.2%}")
-        
-        return jsonify({
-            "risk_scores": risk_scores,
-            "explanation": explanation,
-            "safe_score": safe_score
-        })
+        result = check_text(commit_message, score_only, deadline)
+        audit_check(commit_message, result, 'check-commit', data.get('workspace'))
+        if data.get('verdict'):
+            result = dict(result, verdict=threshold_verdict(result))
+        return wire_response(result, media_type=media_type)
         
     except Exception as e:
         logger.error(f"检测过程中发生错误: {e}")
-        return jsonify({
-            "error": str(e),
-            "risk_scores": {"Safe-Safe": 0.5},
-            "explanation": "Error occurred during analysis.",
-            "safe_score": 0.5
-        }), 500
+        status, headers = error_status(e)
+        audit_check(commit_message, error_result(e), 'check-commit', data.get('workspace'))
+        return wire_response(error_result(e), status, headers, media_type=media_type)
+
+@app.route('/check-commit/stream', methods=['POST'])
+def check_commit_stream():
+    """
+    流式检测Commit Message，响应为Server-Sent Events
+    请求体: {"message": "commit message text", "workspace": "/path"}
+    事件: verdict {"risk_scores", "safe_score", "verdict": {"blocked", "high_risks", "policy"}}，
+          评分位置解码后立即发送；token {"text"} 逐段发送解释文本；done 完整结果；error 出错
+    客户端断开连接后停止生成
+    """
+    data = request.get_json(silent=True)
+    try:
+        text = request_message(data)
+    except InvalidRequestError as e:
+        return jsonify({"error": str(e)}), 400
+    events = queue.Queue()
+    stopped = Event()
+
+    def run():
+        try:
+            stream_check(text, lambda event, payload: events.put((event, payload)), stopped.is_set,
+                         data.get('workspace'))
+        except Exception:
+            # 已作为error事件发送给客户端
+            pass
+        finally:
+            events.put(None)
+
+    def generate():
+        Thread(target=run, name='xguard-stream', daemon=True).start()
+        try:
+            while True:
+                item = events.get()
+                if item is None:
+                    return
+                yield sse_event(*item)
+        finally:
+            # 客户端断开时WSGI服务器关闭本生成器，通知推理线程停止生成
+            stopped.set()
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+class InvalidBatchItem(ValueError):
+    """/check-batch中无法检测的条目（JSON无效、不是对象或message不是字符串）"""
+
+def _iter_ndjson_items():
+    """逐行流式读取application/x-ndjson请求体中的 {"id": ..., "message": ...}，无法解析的行作为InvalidBatchItem交出"""
+    for line in request.stream:
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield InvalidBatchItem(f"条目不是有效的JSON: {e}")
+
+def batch_item_error(item):
+    """条目格式有误时返回对应的异常，否则返回None"""
+    if isinstance(item, InvalidBatchItem):
+        return item
+    if not isinstance(item, dict):
+        return InvalidBatchItem("条目必须是JSON对象")
+    if not isinstance(item.get('message', ''), str):
+        return InvalidBatchItem("message必须是字符串")
+    return None
+
+def _check_batch_item(item, score_only, verdict=False, workspace=None, prefilter=True):
+    """检测单个条目，异常（包括条目格式有误）按条目返回而不中断整个批次"""
+    invalid = batch_item_error(item)
+    if invalid is not None:
+        return {"id": item.get('id') if isinstance(item, dict) else None, **error_result(invalid)}
+    message = item.get('message', '')
+    try:
+        while True:
+            try:
+                result = check_text(message, score_only, prefilter=prefilter)
+                break
+            except QueueFullError as e:
+                # 批量任务不急于返回，队列满时等待后重试而不是报错
+                time.sleep(e.retry_after)
+    except Exception as e:
+        logger.error(f"批量检测条目 {item.get('id')} 出错: {e}")
+        audit_check(message, error_result(e), 'check-batch', workspace)
+        return {"id": item.get('id'), **error_result(e)}
+    audit_check(message, result, 'check-batch', workspace)
+    if verdict:
+        result = dict(result, verdict=threshold_verdict(result))
+    return {"id": item.get('id'), **result}
+
+@app.route('/check-batch', methods=['POST'])
+def check_batch():
+    """
+    批量检测，结果以NDJSON逐行流式返回（按完成顺序，用id对应请求）
+    请求体: {"items": [{"id": "c1", "message": "..."}], "score_only": false, "verdict": false, "workspace": "/path",
+            "prefilter": true}，
+           或Content-Type为application/x-ndjson的逐行条目（score_only、verdict、workspace、prefilter取查询参数）
+    响应: 每行一个 {"id": ..., "risk_scores": ..., "explanation": ..., "safe_score": ...}，
+          verdict为true时附带按当前risk_thresholds的拦截判定；
+          条目出错（含JSON无效、不是对象）时该行为 {"id": ..., "error": ...}，其余条目照常返回
+    条目不是提交信息（如diff片段）时传prefilter为false，不应用min_length/skip_patterns预筛
+    """
+    config = get_service_config()
+    if request.mimetype == 'application/x-ndjson':
+        score_only = request.args.get('score_only', str(config['score_only'])).lower() == 'true'
+        verdict = request.args.get('verdict', 'false').lower() == 'true'
+        workspace = request.args.get('workspace')
+        prefilter = request.args.get('prefilter', 'true').lower() == 'true'
+        items = _iter_ndjson_items()
+    else:
+        data = request.get_json(silent=True)
+        options = data if isinstance(data, dict) else {}
+        items = data.get('items', []) if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return jsonify({"error": "请求体应为 {\"items\": [...]}、条目列表或application/x-ndjson"}), 400
+        score_only = bool(options.get('score_only', config['score_only']))
+        verdict = bool(options.get('verdict', False))
+        workspace = options.get('workspace')
+        prefilter = bool(options.get('prefilter', True))
+    # 同时在途的条目数与模型批大小一致，输入再大两端内存也保持有界
+    window = config['max_batch_size']
+
+    def generate():
+        with ThreadPoolExecutor(max_workers=window) as executor:
+            pending = set()
+            for item in items:
+                if len(pending) >= window:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield json.dumps(future.result(), ensure_ascii=False) + '\n'
+                pending.add(executor.submit(_check_batch_item, item, score_only, verdict, workspace, prefilter))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield json.dumps(future.result(), ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/audit/bypass', methods=['POST'])
+def audit_bypass():
+    """
+    记录强制绕过事件
+    请求体: {"message": "...", "reason": "...", "risks": [{"category": ..., "score": ...}], "workspace": "/path"}
+    审计日志未启用或队列已满时返回503，插件改为写本地审计文件
+    """
+    data = request.get_json(silent=True) or {}
+    audit = get_audit_log()
+    if audit is None:
+        return jsonify({"error": "审计日志未启用"}), 503
+    event = bypass_event(data.get('message', ''), data.get('reason', ''), data.get('risks'), data.get('workspace'))
+    if not audit.record(event):
+        return jsonify({"error": "审计日志队列已满"}), 503
+    return jsonify({"recorded": True}), 202
+
+@app.route('/audit', methods=['GET'])
+def audit_query():
+    """
+    按时间倒序查询审计事件
+    查询参数: since/until（Unix时间戳或ISO 8601）、workspace、category、kind（check/bypass）、limit（默认100，最大1000）
+    """
+    try:
+        since = parse_time(request.args.get('since'))
+        until = parse_time(request.args.get('until'))
+        limit = min(int(request.args.get('limit', 100)), 1000)
+    except ValueError as e:
+        return jsonify({"error": f"查询参数无效: {e}"}), 400
+    events = query_audit(get_service_config()['audit_log_dir'], since, until, request.args.get('workspace'),
+                         request.args.get('category'), request.args.get('kind'), limit)
+    return jsonify({"events": events})
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """检测结果缓存命中统计"""
+    cache = get_verdict_cache()
+    if cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(cache.stats(), enabled=True))
 
 @app.route('/config', methods=['GET'])
 def get_config():
-    """获取当前配置"""
-    config_path = os.path.join(os.getcwd(), '.xguard-config.json')
-    default_config = {
-        "risk_thresholds": {
-            "Data Privacy-Personal Privacy": 0.4,
-            "Cybersecurity-Access Control": 0.3,
-            "Cybersecurity-Hacker Attack": 0.5
-        },
-        "timeout_seconds": 10,
-        "skip_patterns": ["^fix", "^feat", "^docs", "^chore", "^refactor"],
-        "min_length": 10
-    }
-    
-    if os.path.exists(config_path):
-        try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                user_config = json.load(f)
-                # 合并配置
-                for key, value in user_config.items():
-                    if key in default_config:
-                        if isinstance(value, dict):
-                            default_config[key].update(value)
-                        else:
-                            default_config[key] = value
-        except Exception as e:
-            logger.warning(f"配置文件读取失败: {e}")
-    
-    return jsonify(default_config)
+    """
+    获取插件使用的配置；带ETag，配置未变化时对If-None-Match返回304
+    policy为判定相关配置与模型的指纹，供命令行客户端校验本地缓存的放行记录
+    """
+    config = get_service_config()
+    policy = verdict_policy()
+    response = jsonify(dict(config.client_view(), policy=policy))
+    response.set_etag(f"{config.etag}-{policy}")
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8765))
     host = os.environ.get('HOST', '127.0.0.1')
     debug = os.environ.get('DEBUG', 'false').lower() == 'true'
     
-    app.run(host=host, port=port, debug=debug, threaded=True)
\ No newline at end of file
+    # debug模式下reloader的监控进程不处理请求，只在实际服务进程中预加载
+    if get_service_config()['preload_model'] and (not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        preload_in_background()
+    
+    unix_socket = get_service_config()['unix_socket']
+    if get_service_config()['server_mode'] == 'async':
+        # 异步服务循环：检测请求等待推理时不占用线程，其余接口转发给Flask应用
+        import async_server
+        async_server.run(host, port, unix_socket)
+    else:
+        if unix_socket and (not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+            # Unix域套接字由后台线程中的异步服务循环处理，与TCP端口共享模型与调度器
+            import async_server
+            async_server.serve_unix_socket_in_background(unix_socket)
+        # HTTP/1.1使插件与命令行客户端可以复用连接
+        from werkzeug.serving import WSGIRequestHandler
+        WSGIRequestHandler.protocol_version = 'HTTP/1.1'
+        app.run(host=host, port=port, debug=debug, threaded=True)
\ No newline at end of file
@@ -63,6 +63,27 @@ compile_extension() {
     cd ..
 }
 
+# 准备模型产物：转换为目标精度的分片safetensors并写入校验清单，服务启动时走快速加载路径
+prepare_model() {
+    echo "🧩 准备模型产物..."
+    if [ ! -d local_model ] || [ ! -d local_tokenizer ]; then
+        echo "⚠️  未找到local_model或local_tokenizer，跳过"
+        echo "   放入模型后可手动运行: cd server && python3 model_artifacts.py prepare --precision auto"
+        return
+    fi
+    read -p "服务使用的推理精度 (auto/bf16/int8-dynamic/int8-weight-only，默认auto): " precision
+    cd server
+    if python3 model_artifacts.py prepare --precision "${precision:-auto}"; then
+        echo "✅ 模型产物已写入prepared_model，未配置model_path时服务优先加载该目录"
+        if [ "${precision:-auto}" != "auto" ]; then
+            echo "   请同时将precision配置为 ${precision}（或设置XGUARD_PRECISION）"
+        fi
+    else
+        echo "⚠️  模型产物准备失败，服务仍可直接加载local_model"
+    fi
+    cd ..
+}
+
 # 创建系统服务（可选）
 create_system_service() {
     echo "⚙️  创建系统服务（可选）..."
@@ -210,6 +231,7 @@ main() {
     install_python_deps
     install_node_deps
     compile_extension
+    prepare_model
     create_system_service
     choose_install_method
     show_usage
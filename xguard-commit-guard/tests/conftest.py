@@ -0,0 +1,13 @@
+"""
+测试公共设置：项目根目录与server目录加入sys.path，分别用于导入benchmarks包与平铺的服务模块
+"""
+
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_DIR = os.path.join(PROJECT_ROOT, 'server')
+
+for _path in (SERVER_DIR, PROJECT_ROOT):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
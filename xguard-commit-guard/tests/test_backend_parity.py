@@ -0,0 +1,39 @@
+"""
+推理后端一致性测试 - 桩模型分别经eager、compile、onnx后端推理同一批语料，
+各检测模式（只评分、解释、先解释后评分）下的风险分布与解释文本都应与eager一致
+"""
+
+import pytest
+
+for _module in ('torch', 'transformers', 'tokenizers', 'modelscope', 'onnx', 'onnxruntime'):
+    pytest.importorskip(_module)
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.parity import MODES, run_parity
+from benchmarks.stub_model import build_stub_model
+
+BACKENDS = ('eager', 'compile', 'onnx')
+TOLERANCE = 1e-4
+
+
+@pytest.fixture(scope='module')
+def report(tmp_path_factory):
+    root = tmp_path_factory.mktemp('parity')
+    model_path, tokenizer_path = build_stub_model(str(root / 'stub'))
+    items = generate_corpus(size=8, seed=0)
+    return run_parity(model_path, tokenizer_path, items, list(BACKENDS), batch_size=4, max_new_tokens=16,
+                      onnx_cache_dir=str(root / 'onnx'), tolerance=TOLERANCE)
+
+
+@pytest.mark.parametrize('backend', BACKENDS[1:])
+@pytest.mark.parametrize('mode', [mode for mode, _, _ in MODES])
+def test_backend_matches_eager(report, backend, mode):
+    stats = report['comparisons'][backend][mode]
+    assert stats['max_risk_score_diff'] <= TOLERANCE
+    assert stats['max_token_score_diff'] <= TOLERANCE
+    assert stats['response_agreement'] == 1.0
+
+
+def test_report_passed(report):
+    assert report['reference'] == 'eager'
+    assert report['passed']
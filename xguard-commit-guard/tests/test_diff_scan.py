@@ -0,0 +1,108 @@
+"""
+diff解析测试 - 按 '@@' 头中的行数确定hunk结束位置，git与非git（diff -u/-ru）的多文件diff逐文件提取新增行
+"""
+
+from diff_scan import ClearedStore, parse_diff, unique_hunks
+
+
+def _summary(hunks):
+    return [(hunk.path, hunk.line, hunk.text) for hunk in hunks]
+
+
+def test_two_file_non_git_diff():
+    diff = '\n'.join([
+        'diff -ru old/app.py new/app.py',
+        '--- old/app.py\t2024-01-01 10:00:00.000000000 +0800',
+        '+++ new/app.py\t2024-01-02 10:00:00.000000000 +0800',
+        '@@ -1,3 +1,4 @@',
+        ' import os',
+        '+TOKEN = os.environ["TOKEN"]',
+        ' ',
+        ' def main():',
+        'diff -ru old/notes.txt new/notes.txt',
+        '--- old/notes.txt\t2024-01-01 10:00:00.000000000 +0800',
+        '+++ new/notes.txt\t2024-01-02 10:00:00.000000000 +0800',
+        '@@ -10,2 +10,3 @@',
+        ' first',
+        '+second',
+        ' third',
+    ])
+    assert _summary(parse_diff(diff)) == [
+        ('new/app.py', 2, 'TOKEN = os.environ["TOKEN"]'),
+        ('new/notes.txt', 11, 'second'),
+    ]
+
+
+def test_header_like_lines_inside_hunk():
+    # 删除 "-- a" 与新增 "++ b" 在diff中显示为 "--- a" 与 "+++ b"
+    diff = '\n'.join([
+        '--- a.md',
+        '+++ a.md',
+        '@@ -1,2 +1,2 @@',
+        '--- removed rule',
+        '+++ added heading',
+        ' tail',
+        '--- b.md',
+        '+++ b.md',
+        '@@ -0,0 +1 @@',
+        '+new file line',
+    ])
+    assert _summary(parse_diff(diff)) == [
+        ('a.md', 1, '++ added heading'),
+        ('b.md', 1, 'new file line'),
+    ]
+
+
+def test_git_diff_with_deleted_file_and_no_newline_marker():
+    diff = '\n'.join([
+        'diff --git a/gone.txt b/gone.txt',
+        'deleted file mode 100644',
+        '--- a/gone.txt',
+        '+++ /dev/null',
+        '@@ -1 +0,0 @@',
+        '-bye',
+        'diff --git a/src/x.py b/src/x.py',
+        'index 1111111..2222222 100644',
+        '--- a/src/x.py',
+        '+++ b/src/x.py',
+        '@@ -5,2 +5,3 @@ def f():',
+        '     a = 1',
+        '+    b = 2',
+        '     return a',
+        '\\ No newline at end of file',
+        '@@ -20 +21,2 @@',
+        '-old',
+        '+new one',
+        '+new two',
+    ])
+    assert _summary(parse_diff(diff)) == [
+        ('src/x.py', 6, '    b = 2'),
+        ('src/x.py', 21, 'new one\nnew two'),
+    ]
+
+
+def test_context_lines_split_added_runs_and_blank_runs_are_skipped():
+    diff = '\n'.join([
+        '--- a/f', '+++ b/f', '@@ -1,2 +1,6 @@',
+        '+one', ' keep', '+two', '+   ', ' keep', '+',
+    ])
+    hunks = parse_diff(diff)
+    assert _summary(hunks) == [('f', 1, 'one'), ('f', 3, 'two\n   ')]
+    assert hunks[1].line_of(4) == 4
+
+
+def test_digest_ignores_position_and_unique_hunks():
+    first = parse_diff('--- a/f\n+++ b/f\n@@ -1 +1,2 @@\n ctx\n+same\n')
+    second = parse_diff('--- a/g\n+++ b/g\n@@ -40 +40,2 @@\n other\n+same\n')
+    assert first[0].digest == second[0].digest
+    assert unique_hunks(first + second) == first
+
+
+def test_cleared_store_resets_on_policy_change(tmp_path):
+    path = str(tmp_path / 'cleared')
+    ClearedStore(path).load().add('p1', ['d1', 'd2'])
+    store = ClearedStore(path).load()
+    assert store.cleared('p1') == {'d1', 'd2'}
+    assert store.cleared('p2') == set()
+    store.add('p2', ['d3'])
+    assert ClearedStore(path).load().cleared('p2') == {'d3'}
@@ -0,0 +1,192 @@
+"""
+路由网关测试 - 启动两个桩实例进程，验证一致性哈希的亲和性、实例被杀后的故障转移、429/503时换实例而不摘除，
+以及/check-batch请求体有误时返回400
+"""
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip('flask')
+
+from router import Router, create_app, parse_batch
+
+# 桩实例：/health报告就绪，检测接口在结果中带上实例名；POST /_mode切换为overloaded后检测接口返回429
+_STUB = r'''
+import json, sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NAME = sys.argv[1]
+state = {'mode': 'normal'}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body, content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.reply(200, json.dumps({"status": "healthy", "ready": True, "queue_depth": 0}).encode())
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path == '/_mode':
+            state['mode'] = body.decode()
+            return self.reply(200, b'{}')
+        if state['mode'] == 'overloaded':
+            return self.reply(429, b'{"error": "busy"}')
+        if self.path.startswith('/check-batch'):
+            lines = [json.dumps({"id": item["id"], "backend": NAME, "safe_score": 1.0})
+                     for item in json.loads(body)["items"]]
+            return self.reply(200, ''.join(line + '\n' for line in lines).encode(), 'application/x-ndjson')
+        self.reply(200, json.dumps({"backend": NAME, "safe_score": 1.0}).encode())
+
+
+server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+print(server.server_address[1], flush=True)
+server.serve_forever()
+'''
+
+
+class _Stub:
+    def __init__(self, name):
+        self.name = name
+        self.process = subprocess.Popen([sys.executable, '-c', _STUB, name], stdout=subprocess.PIPE, text=True)
+        self.url = f'http://127.0.0.1:{int(self.process.stdout.readline())}'
+
+    def set_mode(self, mode):
+        import http.client
+        connection = http.client.HTTPConnection(self.url[len('http://'):], timeout=5)
+        connection.request('POST', '/_mode', body=mode)
+        connection.getresponse().read()
+        connection.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.wait()
+
+
+@pytest.fixture
+def stubs():
+    started = [_Stub('a'), _Stub('b')]
+    yield {stub.url: stub for stub in started}
+    for stub in started:
+        stub.kill()
+
+
+@pytest.fixture
+def router(stubs):
+    router = Router(list(stubs), health_interval=60, upstream_timeout=5)
+    router.probe_all()
+    assert all(backend.routable for backend in router.backends)
+    return router
+
+
+@pytest.fixture
+def client(router):
+    return create_app(router).test_client()
+
+
+def _messages_by_owner(router, count=40):
+    """按哈希环上的首选实例给测试文本分组"""
+    owners = {}
+    for index in range(count):
+        message = f'feat: change number {index}'
+        owners.setdefault(next(router.ring.walk(message)).url, []).append(message)
+    return owners
+
+
+def _check(client, message):
+    return client.post('/check-commit', json={"message": message})
+
+
+def test_same_text_sticks_to_its_ring_owner(client, router, stubs):
+    owners = _messages_by_owner(router)
+    assert set(owners) == set(stubs)
+    for url, messages in owners.items():
+        for message in messages[:5]:
+            for _ in range(2):
+                response = _check(client, message)
+                assert response.status_code == 200
+                assert response.headers['X-XGuard-Backend'] == url
+                assert response.get_json()['backend'] == stubs[url].name
+
+
+def test_killed_backend_fails_over(client, router, stubs):
+    owners = _messages_by_owner(router)
+    killed, survivor = list(owners)
+    stubs[killed].kill()
+
+    response = _check(client, owners[killed][0])
+    assert response.status_code == 200
+    assert response.headers['X-XGuard-Backend'] == survivor
+    killed_backend = next(backend for backend in router.backends if backend.url == killed)
+    assert not killed_backend.healthy
+
+    # 摘除后不再尝试该实例，批量请求的条目全部由存活实例检测
+    response = client.post('/check-batch', json={"items": [{"id": message, "message": message}
+                                                           for message in owners[killed][:3] + owners[survivor][:3]]})
+    results = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(results) == 6
+    assert {result['backend'] for result in results} == {stubs[survivor].name}
+
+
+def test_overloaded_backend_is_skipped_but_kept(client, router, stubs):
+    owners = _messages_by_owner(router)
+    overloaded, other = list(owners)
+    stubs[overloaded].set_mode('overloaded')
+
+    response = _check(client, owners[overloaded][0])
+    assert response.status_code == 200
+    assert response.headers['X-XGuard-Backend'] == other
+
+    items = [{"id": message, "message": message} for message in owners[overloaded][:3] + owners[other][:3]]
+    response = client.post('/check-batch', json={"items": items})
+    results = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert sorted(result['id'] for result in results) == sorted(item['id'] for item in items)
+    assert {result['backend'] for result in results} == {stubs[other].name}
+
+    # 429只换实例重试，不摘除实例
+    assert all(backend.healthy for backend in router.backends)
+
+    # 所有实例都拒绝时把最后一次429透传给客户端
+    stubs[other].set_mode('overloaded')
+    response = _check(client, owners[overloaded][0])
+    assert response.status_code == 429
+    response = client.post('/check-batch', json={"items": items[:2]})
+    results = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(results) == 2 and all('error' in result for result in results)
+    assert all(backend.healthy for backend in router.backends)
+
+
+@pytest.mark.parametrize('body, content_type', [
+    ('{"id": 1, "message": "ok"}\n{"id": 2, "message": ', 'application/x-ndjson'),
+    ('["not an object"]\n', 'application/x-ndjson'),
+    ('{"id": 1, "message": 42}\n', 'application/x-ndjson'),
+    ('not json', 'application/json'),
+    ('{"items": ["oops"]}', 'application/json'),
+    ('{"items": 5}', 'application/json'),
+])
+def test_malformed_batch_is_rejected(client, body, content_type):
+    response = client.post('/check-batch', data=body, content_type=content_type)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_parse_batch_options():
+    items, options = parse_batch(b'{"id": 1, "message": "a"}\n\n{"id": 2}\n', 'application/x-ndjson',
+                                 {'score_only': 'true', 'workspace': '/repo', 'ignored': 'x'})
+    assert items == [{"id": 1, "message": "a"}, {"id": 2}]
+    assert options == {'score_only': True, 'workspace': '/repo'}
+    items, options = parse_batch(b'{"items": [{"message": "a"}], "verdict": true}', 'application/json', {})
+    assert items == [{"message": "a"}] and options == {'verdict': True}
@@ -0,0 +1,150 @@
+"""
+服务接口测试 - 以Flask测试客户端调用各端点，模型推理由桩函数代替，只验证请求解析与错误响应
+"""
+
+import json
+import threading
+
+import pytest
+
+pytest.importorskip('flask')
+
+import xguard_service as service
+from config import ConfigStore
+
+
+def _fake_check_text(text, score_only=False, deadline=None, prefilter=True):
+    if text == 'boom':
+        raise RuntimeError('inference failed')
+    return {"risk_scores": {"Safe-Safe": 1.0}, "explanation": "", "safe_score": 1.0}
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    store = ConfigStore(path=str(tmp_path / 'missing.json'), overrides={'audit_log_enabled': False})
+    monkeypatch.setattr(service, '_config_store', store)
+    monkeypatch.setattr(service, 'check_text', _fake_check_text)
+    return service.app.test_client()
+
+
+def _lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_batch_reports_malformed_ndjson_lines_per_item(client):
+    body = '\n'.join([
+        json.dumps({"id": "a", "message": "add login form"}),
+        '{"id": "b", "message": ',
+        json.dumps(["not", "an", "object"]),
+        json.dumps({"id": "d", "message": 42}),
+        json.dumps({"id": "e", "message": "boom"}),
+        json.dumps({"id": "f", "message": "update readme"}),
+    ]) + '\n'
+    response = client.post('/check-batch', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+
+    lines = _lines(response)
+    assert len(lines) == 6
+    by_id = {line['id']: line for line in lines if line['id'] is not None}
+    assert 'error' not in by_id['a'] and 'error' not in by_id['f']
+    assert 'error' in by_id['d'] and 'error' in by_id['e']
+    anonymous = [line for line in lines if line['id'] is None]
+    assert len(anonymous) == 2 and all('error' in line for line in anonymous)
+
+
+def test_batch_json_body_with_invalid_items(client):
+    response = client.post('/check-batch', json={"items": [{"id": "a", "message": "add login form"}, "oops"]})
+    assert response.status_code == 200
+    lines = _lines(response)
+    assert {line['id'] for line in lines} == {'a', None}
+    assert ['error' in line for line in sorted(lines, key=lambda line: line['id'] is None)] == [False, True]
+
+
+@pytest.mark.parametrize('body', [{"items": 5}, "not json"])
+def test_batch_rejects_malformed_request_body(client, body):
+    if isinstance(body, str):
+        response = client.post('/check-batch', data=body, content_type='application/json')
+    else:
+        response = client.post('/check-batch', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def _cache_key(monkeypatch, tmp_path, **overrides):
+    store = ConfigStore(path=str(tmp_path / 'missing.json'), overrides=overrides)
+    monkeypatch.setattr(service, '_config_store', store)
+    monkeypatch.setattr(service, '_model_identity', 'model')
+    return service.cache_key_for('add login form')
+
+
+@pytest.mark.parametrize('key, value', [
+    ('chunk_max_tokens', 256), ('chunk_overlap_tokens', 0), ('chunk_aggregation', 'topk'),
+    ('chunk_top_k', 3), ('cascade_uncertainty_band', 0.3),
+])
+def test_cache_key_follows_result_affecting_config(monkeypatch, tmp_path, key, value):
+    assert _cache_key(monkeypatch, tmp_path, **{key: value}) != _cache_key(monkeypatch, tmp_path)
+
+
+def test_cache_key_ignores_thresholds(monkeypatch, tmp_path):
+    thresholds = {"Cybersecurity-Access Control": 0.1}
+    assert _cache_key(monkeypatch, tmp_path, risk_thresholds=thresholds, min_length=3) == _cache_key(monkeypatch, tmp_path)
+
+
+@pytest.mark.parametrize('timeout', ['abc', {'seconds': None}, -1, True, float('inf')])
+def test_check_commit_rejects_invalid_timeout(client, monkeypatch, timeout):
+    audited = []
+    monkeypatch.setattr(service, 'audit_check', lambda *args: audited.append(args))
+    response = client.post('/check-commit', data=json.dumps({"message": "add login form", "timeout_seconds": timeout}),
+                           content_type='application/json')
+    assert response.status_code == 400
+    assert 'timeout_seconds' in response.get_json()['error']
+    assert audited == []
+
+
+@pytest.mark.parametrize('body, content_type', [
+    ('not json', 'application/json'), ('{"message": ', 'application/json'), ('["a list"]', 'application/json'),
+    ('{"message": 42}', 'application/json'), (b'\xff\xfe', 'text/plain'),
+])
+def test_check_commit_rejects_malformed_body(client, body, content_type):
+    response = client.post('/check-commit', data=body, content_type=content_type)
+    assert response.status_code == 400
+    assert 'safe_score' not in response.get_json()
+
+
+def test_check_commit_text_plain(client):
+    response = client.post('/check-commit?score_only=true&verdict=true&workspace=%2Ftmp%2Frepo',
+                           data='add login form', content_type='text/plain; charset=utf-8',
+                           headers={'Accept': 'text/plain'})
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    assert response.get_data(as_text=True).splitlines() == ['blocked 0', 'safe_score 1.0']
+
+
+def test_check_commit_text_plain_rejects_invalid_timeout(client):
+    response = client.post('/check-commit?timeout_seconds=abc', data='add login form',
+                           content_type='text/plain', headers={'Accept': 'text/plain'})
+    assert response.status_code == 400
+    assert response.get_data(as_text=True).startswith('error ')
+
+
+def test_check_commit_accepts_valid_timeout(client):
+    response = client.post('/check-commit', json={"message": "add login form", "timeout_seconds": 0, "verdict": True})
+    assert response.status_code == 200
+    assert response.get_json()['verdict']['blocked'] is False
+
+
+def test_check_commit_stream_rejects_malformed_body(client):
+    response = client.post('/check-commit/stream', data='["a list"]', content_type='application/json')
+    assert response.status_code == 400
+
+
+def test_first_get_batcher_creates_config_store_without_deadlock(monkeypatch):
+    monkeypatch.setattr(service, '_config_store', None)
+    monkeypatch.setattr(service, '_batcher', None)
+    result = []
+    thread = threading.Thread(target=lambda: result.append(service.get_batcher()), daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+    assert not thread.is_alive(), "get_batcher() deadlocked while creating the config store"
+    assert result[0] is service._batcher
+    assert service._config_store is not None
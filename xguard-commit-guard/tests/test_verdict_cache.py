@@ -0,0 +1,187 @@
+"""
+检测结果缓存测试 - 缓存键归一化、LRU淘汰、SQLite持久化，以及并发相同请求的合并与放弃后的接手
+"""
+
+import threading
+import time
+
+import pytest
+
+from verdict_cache import ComputationAbandonedError, VerdictCache, make_cache_key
+
+
+class _Deadline(Exception):
+    """模拟执行者自身的截止时间到期"""
+
+
+def _run_threads(count, target):
+    results = [None] * count
+    errors = [None] * count
+
+    def run(index):
+        try:
+            results[index] = target(index)
+        except Exception as e:
+            errors[index] = e
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert not any(thread.is_alive() for thread in threads)
+    return results, errors
+
+
+def test_cache_key_normalizes_text():
+    key = make_cache_key('fix: bug\r\n', 'model-a')
+    assert key == make_cache_key('  fix: bug\n', 'model-a')
+    assert key != make_cache_key('fix: bug', 'model-b')
+    assert key != make_cache_key('fix: bug', 'model-a', policy='strict')
+    assert key != make_cache_key('fix: bug', 'model-a', reason_first=True)
+
+
+def test_lru_evicts_least_recently_used():
+    cache = VerdictCache(max_entries=2)
+    cache.put('a', {'v': 1})
+    cache.put('b', {'v': 2})
+    assert cache.get('a') == {'v': 1}
+    cache.put('c', {'v': 3})
+
+    assert cache.get('b') is None
+    assert cache.get('a') == {'v': 1}
+    assert cache.get('c') == {'v': 3}
+    assert cache.stats()['entries'] == 2
+
+
+def test_sqlite_store_survives_restart(tmp_path):
+    db_path = str(tmp_path / 'verdicts.db')
+    cache = VerdictCache(max_entries=8, db_path=db_path)
+    cache.put('k', {'risk_score': 0.9, 'risk_tag': 'Data Leakage'})
+
+    restarted = VerdictCache(max_entries=8, db_path=db_path)
+    value, future, owner = restarted.reserve('k')
+    assert value == {'risk_score': 0.9, 'risk_tag': 'Data Leakage'}
+    assert future is None and not owner
+    assert restarted.stats()['hits'] == 1
+
+    restarted.clear()
+    assert VerdictCache(max_entries=8, db_path=db_path).get('k') is None
+
+
+def test_sqlite_store_prunes_to_max_entries(tmp_path, monkeypatch):
+    import verdict_cache
+    monkeypatch.setattr(verdict_cache._SqliteStore, 'PRUNE_INTERVAL', 4)
+    db_path = str(tmp_path / 'verdicts.db')
+    cache = VerdictCache(max_entries=2, db_path=db_path)
+    for index in range(4):
+        cache.put(f'k{index}', {'v': index})
+        time.sleep(0.01)
+
+    restarted = VerdictCache(max_entries=2, db_path=db_path)
+    assert restarted.get('k0') is None
+    assert restarted.get('k1') is None
+    assert restarted.get('k3') == {'v': 3}
+
+
+def test_concurrent_requests_share_one_computation():
+    cache = VerdictCache()
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {'risk_score': 0.1}
+
+    def request(index):
+        return cache.get_or_compute('k', compute, timeout=5)
+
+    timer = threading.Timer(0.2, release.set)
+    timer.start()
+    results, errors = _run_threads(6, request)
+    timer.cancel()
+
+    assert errors == [None] * 6
+    assert results == [{'risk_score': 0.1}] * 6
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert stats['misses'] == 1
+    assert stats['coalesced'] + stats['hits'] == 5
+    assert stats['inflight'] == 0
+
+
+def test_failure_reaches_waiters_and_is_not_cached():
+    cache = VerdictCache()
+    value, future, owner = cache.reserve('k')
+    assert owner
+    _, shared, waiter_owner = cache.reserve('k')
+    assert shared is future and not waiter_owner
+
+    cache.complete('k', future, error=RuntimeError('inference failed'))
+    with pytest.raises(RuntimeError):
+        shared.result(timeout=1)
+    assert cache.get('k') is None
+    assert cache.reserve('k')[2]
+
+
+def test_waiter_takes_over_abandoned_computation():
+    cache = VerdictCache()
+    owner_started = threading.Event()
+    release_owner = threading.Event()
+    calls = []
+
+    def abandoned():
+        calls.append('owner')
+        owner_started.set()
+        release_owner.wait(5)
+        raise _Deadline()
+
+    def take_over():
+        calls.append('waiter')
+        return {'risk_score': 0.2}
+
+    def request(index):
+        if index == 0:
+            return cache.get_or_compute('k', abandoned, abandon_on=(_Deadline,))
+        owner_started.wait(5)
+        return cache.get_or_compute('k', take_over, timeout=5, abandon_on=(_Deadline,))
+
+    # 等待者登记后再让执行者超时放弃
+    releaser = threading.Thread(target=lambda: (owner_started.wait(5), time.sleep(0.2), release_owner.set()))
+    releaser.start()
+    results, errors = _run_threads(2, request)
+    releaser.join()
+
+    assert isinstance(errors[0], _Deadline)
+    assert errors[1] is None
+    assert results[1] == {'risk_score': 0.2}
+    assert calls == ['owner', 'waiter']
+    assert cache.get('k') == {'risk_score': 0.2}
+
+
+def test_abandoned_reservation_is_released():
+    cache = VerdictCache()
+    value, future, owner = cache.reserve('k')
+    cache.complete('k', future, error=ComputationAbandonedError())
+
+    # 执行者放弃后登记已清除，下一个请求成为新的执行者
+    assert cache.get_or_compute('k', lambda: {'risk_score': 0.3}) == {'risk_score': 0.3}
+
+
+def test_waiter_reraises_errors_not_in_abandon_on():
+    cache = VerdictCache()
+    value, future, owner = cache.reserve('k')
+    threading.Timer(0.1, lambda: cache.complete('k', future, error=ValueError('bad'))).start()
+    with pytest.raises(ValueError):
+        cache.get_or_compute('k', lambda: None, timeout=5, abandon_on=(_Deadline,))
+
+
+def test_waiter_timeout():
+    cache = VerdictCache()
+    value, future, owner = cache.reserve('k')
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        cache.get_or_compute('k', lambda: {'risk_score': 0.0}, timeout=0.1)
+    assert time.monotonic() - started < 2
+    cache.complete('k', future, value={'risk_score': 0.0})
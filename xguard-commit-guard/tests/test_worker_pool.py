@@ -0,0 +1,84 @@
+"""
+推理进程池权重共享测试 - 参数替换为safetensors文件映射，dtype不一致或量化时报告未能共享及原因
+"""
+
+import logging
+
+import pytest
+
+torch = pytest.importorskip('torch')
+safetensors_torch = pytest.importorskip('safetensors.torch')
+
+from worker_pool import WorkerPool, map_safetensors_weights, sharing_problem
+
+
+class _TinyModel(torch.nn.Module):
+    """与语言模型一样以Linear层权重为主"""
+
+    def __init__(self):
+        super().__init__()
+        self.embed = torch.nn.Embedding(8, 16)
+        self.proj = torch.nn.Linear(16, 256)
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    torch.manual_seed(0)
+    safetensors_torch.save_file(_TinyModel().state_dict(), str(tmp_path / 'model.safetensors'))
+    return str(tmp_path)
+
+
+def _loaded(model_dir, dtype=torch.float32):
+    model = _TinyModel().to(dtype)
+    model.load_state_dict(safetensors_torch.load_file(f'{model_dir}/model.safetensors'))
+    return model
+
+
+def test_matching_weights_are_mapped(model_dir):
+    model = _loaded(model_dir)
+    expected = model.proj.weight.detach().clone()
+    sharing = map_safetensors_weights(model, model_dir)
+
+    assert sharing['shared'] == sharing['total'] == 3
+    assert sharing['private_bytes'] == 0
+    assert sharing['shared_bytes'] == sum(p.numel() * p.element_size() for p in model.parameters())
+    assert torch.equal(model.proj.weight, expected)
+    assert sharing_problem(sharing, 'auto') is None
+
+
+def test_dtype_mismatch_is_reported(model_dir):
+    model = _loaded(model_dir, torch.bfloat16)
+    sharing = map_safetensors_weights(model, model_dir)
+
+    assert sharing['shared'] == 0 and sharing['dtype_mismatch'] == 3
+    assert sharing['private_bytes'] > 0
+    assert 'prepare --precision bf16' in sharing_problem(sharing, 'bf16')
+
+
+def test_quantized_weights_stay_private(model_dir):
+    model = torch.ao.quantization.quantize_dynamic(_loaded(model_dir), {torch.nn.Linear}, dtype=torch.qint8)
+    sharing = map_safetensors_weights(model, model_dir)
+
+    # 量化后的Linear权重不是参数，只有embedding能映射到文件
+    assert sharing['shared'] == 1
+    assert sharing['private_bytes'] > 0
+    assert 'int8-dynamic' in sharing_problem(sharing, 'int8-dynamic')
+
+
+def test_missing_safetensors_is_reported(tmp_path):
+    sharing = map_safetensors_weights(_TinyModel(), str(tmp_path))
+    assert sharing['shared'] == 0 and not sharing['safetensors']
+    assert 'safetensors' in sharing_problem(sharing, 'auto')
+
+
+def test_pool_warns_when_weights_are_private(caplog):
+    sharing = {'shared': 0, 'total': 4, 'shared_bytes': 0, 'private_bytes': 8 * 1024 * 1024,
+               'dtype_mismatch': 4, 'safetensors': True}
+    with caplog.at_level(logging.WARNING, logger='worker_pool'):
+        WorkerPool._check_sharing(sharing, 'bf16', 3)
+    assert '合计约24.0MB' in caplog.text
+
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger='worker_pool'):
+        WorkerPool._check_sharing(dict(sharing, shared_bytes=16 * 1024 * 1024), 'auto', 3)
+    assert caplog.text == ''
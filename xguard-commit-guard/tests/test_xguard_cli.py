@@ -0,0 +1,73 @@
+"""
+命令行客户端测试 - 钩子默认路径不导入json/socket/urllib.parse，text/plain请求与响应的编解码与服务端一致
+"""
+
+import os
+import subprocess
+import sys
+from urllib.parse import quote
+
+import pytest
+
+import wire
+import xguard_cli
+
+SERVER_DIR = os.path.dirname(os.path.abspath(xguard_cli.__file__))
+
+
+def test_hook_path_skips_heavy_imports():
+    code = ('import sys; import xguard_cli; '
+            'xguard_cli._parse_url(xguard_cli.DEFAULT_URL); xguard_cli._load_text_result(b"blocked 0\\n"); '
+            'print(",".join(name for name in ("json", "socket", "urllib.parse", "re") if name in sys.modules))')
+    output = subprocess.run([sys.executable, '-S', '-c', code], cwd=SERVER_DIR,
+                            capture_output=True, text=True, check=True).stdout
+    assert output.strip() == ''
+
+
+@pytest.mark.parametrize('value', [
+    '/home/dev/repo', '/tmp/my repo', '/srv/项目/代码', 'C:\\work\\a&b=c?d#e', '~user/.x_y-z', '100%',
+])
+def test_quote_matches_urllib(value):
+    assert xguard_cli._quote(value) == quote(value, safe='/')
+
+
+def test_parse_url():
+    assert xguard_cli._parse_url(xguard_cli.DEFAULT_URL) == ('http', '127.0.0.1', 8765, '')
+    assert xguard_cli._parse_url('https://[::1]/xguard/') == ('https', '::1', 443, '/xguard')
+
+
+def test_text_request_round_trip():
+    workspace = '/tmp/my repo/项目'
+    query = f'score_only=true&verdict=true&workspace={xguard_cli._quote(workspace)}&timeout_seconds=2.5'
+    data = wire.decode('修复登录\n\n详细说明'.encode('utf-8'), 'text/plain; charset=utf-8', query)
+    assert data == {'message': '修复登录\n\n详细说明', 'score_only': True, 'verdict': True,
+                    'workspace': workspace, 'timeout_seconds': 2.5}
+
+
+def test_text_response_round_trip():
+    payload = {
+        'safe_score': 0.12,
+        'decided_by': 'model',
+        'verdict': {'blocked': True, 'high_risks': [{'category': 'Cybersecurity-Access Control', 'score': 0.88}]},
+        'detector_hits': [{'rule': 'github-token', 'start': 10, 'end': 50, 'masked': 'ghp_****'}],
+    }
+    body, content_type = wire.encode(payload, wire.TEXT)
+    assert content_type.startswith('text/plain')
+    result = xguard_cli._load_text_result(body)
+    assert result == {
+        'safe_score': 0.12,
+        'decided_by': 'model',
+        'verdict': payload['verdict'],
+        'detector_hits': [{'rule': 'github-token', 'start': 10, 'end': 50}],
+    }
+
+
+def test_text_error_response():
+    body, _ = wire.encode({'error': 'timeout_seconds无效:\n不是数字'}, wire.TEXT)
+    assert xguard_cli._load_text_result(body) == {'error': 'timeout_seconds无效: 不是数字'}
+
+
+def test_numeric_address_skips_name_resolution():
+    assert xguard_cli._numeric_address('127.0.0.1', 8765)[0][4] == ('127.0.0.1', 8765)
+    assert xguard_cli._numeric_address('::1', 8765)[0][4] == ('::1', 8765, 0, 0)
+    assert xguard_cli._numeric_address('localhost', 8765) is None